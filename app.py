@@ -1,14 +1,20 @@
-import re
+import gc
+import os
 import copy
-import requests
-from collections import namedtuple, defaultdict
+import time
+import uuid
+from collections import defaultdict, deque
 from operator import itemgetter
-from flask import Flask, request, json, jsonify, g
+from flask import Flask, Response, request, json, g, stream_with_context
 from flask_cors import CORS
 
 import utils
 from utils import func_time, get_helper
-from logic_server import server, Connection
+from paths import namespace
+from cache import ResponseCache, DiskCache
+from task_artifacts import TaskArtifacts
+from logic_server import server, Connection, import_generation, db_pool, \
+    query_profiler, metrics
 from libs.deps_sorting import SortList
 from libs.conflict_filter import ConflictFilter
 from libs.package_deps import PackageDependencies
@@ -24,9 +30,42 @@ logger = utils.get_logger(__name__)
 
 QM.init_manager(logger)
 
+response_cache = ResponseCache(
+    server.get_dict_values, import_generation,
+    max_bytes=namespace.CACHE_SIZE * 1024 ** 2,
+    disk_path=namespace.CACHE_DIR,
+    disk_max_bytes=namespace.CACHE_DISK_SIZE * 1024 ** 2,
+    default_ttl=namespace.CACHE_TTL,
+    metrics=metrics,
+    # requests answered from cache are in access log too
+    on_hit=server.url_logging
+)
+
+# parameters checked by `check_input_params` are a part of every cache key
+cached = response_cache.cached
+validated_params = [
+    ('name', 's', 'pkg_name'), ('version', 's'), ('pkg_ls', 's', 'pkg_name'),
+    ('arch', 's'), ('branch', 's', 'repo_name'),
+]
+
+task_artifacts = TaskArtifacts(
+    workers=namespace.TASK_FETCH_WORKERS,
+    timeout=namespace.TASK_FETCH_TIMEOUT,
+    deadline=namespace.TASK_FETCH_DEADLINE,
+    cache=DiskCache(
+        os.path.join(namespace.CACHE_DIR, 'tasks'),
+        namespace.TASK_CACHE_SIZE * 1024 ** 2
+    ) if namespace.TASK_CACHE_SIZE else None,
+    metrics=metrics
+)
+
 
 @app.route('/package_info')
 @func_time(logger)
+@cached(validated_params + [
+    ('sha1', 's'), ('release', 's'), ('disttag', 's'), ('buildtime', 'i'),
+    ('source', 'b'), ('packager', 's'), ('packager_email', 's'), ('full', 'b'),
+])
 def package_info():
     """
     The function of showing information about given package by user parameters.
@@ -138,7 +177,7 @@ def package_info():
         },
     }
 
-    params_values = server.get_values_by_params(input_params)
+    params_values = server.get_values_by_params(input_params, values_only=True)
     if params_values is False:
         return get_helper(server.helper(request.path))
 
@@ -152,39 +191,38 @@ def package_info():
     if full:
         output_params = server.package_params
 
-    g.connection.request_line = \
-        "SELECT pkg.pkghash, {p_params} FROM last_packages WHERE " \
-        "{p_values} {branch}".format(
-            p_params=", ".join(output_params),
-            p_values=" ".join(params_values),
-            branch='{}'
-        )
-
+    # names of columns are constants, values are bound as parameters
+    conditions = [
+        "{} = %({})s".format(input_params[param]['rname'], param)
+        for param in params_values
+    ]
     if pbranch:
-        g.connection.request_line = g.connection.request_line.format(
-            "AND assigment_name = %(branch)s"
-        )
-    else:
-        g.connection.request_line = g.connection.request_line.format('')
+        conditions.append("assigment_name = %(branch)s")
 
-    g.connection.request_line = (g.connection.request_line, {'branch': pbranch})
+    g.connection.request_line = QM.build(
+        "SELECT pkg.pkghash, {} FROM last_packages WHERE {}".format(
+            ", ".join(output_params), " AND ".join(conditions)
+        ),
+        dict(params_values, branch=pbranch)
+    )
 
     status, response = g.connection.send_request()
     if status is False:
         return response
 
-    json_retval = json.loads(
-        utils.convert_to_json(['pkghash'] + output_params, response)
+    packages = utils.RowSerializer(['pkghash'] + output_params).to_dicts(
+        response
     )
 
-    if full and len(response) > 0:
+    if full and packages:
 
         pkghashs = utils.join_tuples(response)
 
         # files
-        g.connection.request_line = (
+        g.connection.request_line = QM.build(
             "SELECT pkghash, groupUniqArray(filename) FROM File WHERE pkghash "
-            "IN %(pkghshs)s GROUP BY pkghash", {'pkghshs': pkghashs}
+            "IN (SELECT hsh FROM pkg_hshs) GROUP BY pkghash",
+            tables={'pkg_hshs': pkghashs}
         )
 
         status, response = g.connection.send_request()
@@ -193,54 +231,42 @@ def package_info():
 
         files_dict = utils.tuplelist_to_dict(response, 1)
 
-        # add empty list if package has no files
-        for hsh in pkghashs:
-            if hsh not in files_dict:
-                files_dict[hsh] = []
-
         # depends
-        g.connection.request_line = (
+        g.connection.request_line = QM.build(
             "SELECT pkghash, dptype, dpname FROM last_depends WHERE pkghash "
-            "IN %(pkghshs)s", {'pkghshs': pkghashs}
+            "IN (SELECT hsh FROM pkg_hshs)", tables={'pkg_hshs': pkghashs}
         )
 
         status, response = g.connection.send_request()
         if status is False:
             return response
 
-        depends_dict = utils.tuplelist_to_dict(response, 2)
-
-        depends_struct = {}
-        for pkg in depends_dict:
-            depend_ls = depends_dict[pkg]
+        depends_struct = defaultdict(lambda: defaultdict(list))
+        for pkghash, dptype, dpname in response:
+            depends_struct[pkghash][dptype].append(dpname)
 
-            depends_struct[pkg] = {}
+        for package in packages:
+            pkghash = package['pkghash']
 
-            for i in range(0, len(depend_ls), 2):
-                if depend_ls[i] not in depends_struct[pkg]:
-                    depends_struct[pkg][depend_ls[i]] = []
-
-                depends_struct[pkg][depend_ls[i]].append(depend_ls[i + 1])
-
-        for elem in json_retval:
-            pkghash = json_retval[elem]['pkghash']
-
-            # add files to result structure
-            json_retval[elem]['files'] = files_dict[pkghash]
+            # add files to result structure (empty list if package has no
+            # files)
+            package['files'] = files_dict.get(pkghash, [])
 
             # add depends to result structure
-            for dep in depends_struct[pkghash]:
-                json_retval[elem][dep] = depends_struct[pkghash][dep]
+            package.update(depends_struct.get(pkghash, {}))
 
     # remove pkghash from result
-    for value in json_retval.values():
-        value.pop('pkghash', None)
+    result = {}
+    for i, package in enumerate(packages):
+        package.pop('pkghash', None)
+        result[str(i)] = package
 
-    return json.dumps(json_retval, sort_keys=False)
+    return utils.json_dumps(result)
 
 
 @app.route('/misconflict_packages')
 @func_time(logger)
+@cached(validated_params + [('task', 'i')])
 def misconflict_packages():
     """
     The function of searching for conflicting files in packages that do not have
@@ -333,9 +359,11 @@ def misconflict_packages():
         pbranch = values['branch']
 
         # get hash for package names
-        g.connection.request_line = (QM.misconflict_pkgs_get_hshs_by_pkgs, {
-            'pkgs': tuple(pkg_ls), 'branch': pbranch, 'arch': allowed_archs
-        })
+        g.connection.request_line = QM.build(
+            QM.misconflict_pkgs_get_hshs_by_pkgs,
+            {'branch': pbranch, 'arch': allowed_archs},
+            tables={'pkg_names': pkg_ls}
+        )
 
         status, response = g.connection.send_request()
         if status is False:
@@ -360,10 +388,11 @@ def misconflict_packages():
         return json.dumps({})
 
     # get list of (input package | conflict package | conflict files)
-    g.connection.request_line = (QM.misconflict_pkgs_get_pkg_with_conflict, {
-        'hshs': tuple(input_pkg_hshs), 'branch': pbranch,
-        'arch': allowed_archs
-    })
+    g.connection.request_line = QM.build(
+        QM.misconflict_pkgs_get_pkg_with_conflict,
+        {'branch': pbranch, 'arch': allowed_archs},
+        tables={'pkg_hshs': input_pkg_hshs}
+    )
 
     status, response = g.connection.send_request()
     if status is False:
@@ -409,8 +438,8 @@ def misconflict_packages():
             result_list.append(pkg)
 
     # get architectures of found packages
-    g.connection.request_line = QM.misconflict_pkgs_get_pkg_archs.format(
-        hshs=tuple(output_pkgs)
+    g.connection.request_line = QM.build(
+        QM.misconflict_pkgs_get_pkg_archs, tables={'pkg_hshs': output_pkgs}
     )
 
     status, response = g.connection.send_request()
@@ -430,11 +459,11 @@ def misconflict_packages():
     )
 
     # get main information of packages by package hashes
-    g.connection.request_line = (QM.misconflict_pkgs_get_meta_by_hshs, {
-        'pkgs': tuple(confl_pkgs),
-        'branch': pbranch,
-        'arch': allowed_archs
-    })
+    g.connection.request_line = QM.build(
+        QM.misconflict_pkgs_get_meta_by_hshs,
+        {'branch': pbranch, 'arch': allowed_archs},
+        tables={'pkg_names': confl_pkgs}
+    )
 
     status, response = g.connection.send_request()
     if status is False:
@@ -467,6 +496,9 @@ def misconflict_packages():
 
 @app.route('/package_by_file')
 @func_time(logger)
+@cached(validated_params + [
+    ('file', 'r', 'pkg_name'), ('md5', 's'),
+])
 def package_by_file():
     """
     The function of searching binary packages that contain the specified file.
@@ -509,18 +541,13 @@ def package_by_file():
     else:
         arch = server.known_archs
 
-    base_query = QM.package_by_file_get_hshs_by_files.format(
-        in_='{}', pkghash=QM.package_by_file_get_pkg_hashs, param='{}'
-    )
-
     if file:
-        elem, query = file, "filename LIKE %(elem)s"
+        elem, query = file, QM.package_by_file_get_hshs_by_files
     else:
-        elem, query = md5, "filemd5 = %(elem)s"
+        elem, query = md5, QM.package_by_file_get_hshs_by_md5
 
-    g.connection.request_line = (
-        base_query.format(', filename', query),
-        {'branch': pbranch, 'arch': tuple(arch), 'elem': elem}
+    g.connection.request_line = QM.build(
+        query, {'branch': pbranch, 'arch': tuple(arch), 'elem': elem}
     )
 
     status, response = g.connection.send_request()
@@ -532,12 +559,10 @@ def package_by_file():
 
     ids_filename_dict = utils.tuplelist_to_dict(response, 1)
 
-    pkghashs = tuple([key for key in ids_filename_dict.keys()])
-
-    g.connection.request_line = (
-        QM.package_by_file_get_meta_by_hshs, {
-            'hashs': pkghashs, 'branch': pbranch
-        })
+    g.connection.request_line = QM.build(
+        QM.package_by_file_get_meta_by_hshs, {'branch': pbranch},
+        tables={'pkg_hshs': ids_filename_dict.keys()}
+    )
 
     status, response = g.connection.send_request()
     if status is False:
@@ -556,6 +581,7 @@ def package_by_file():
 
 @app.route('/package_files')
 @func_time(logger)
+@cached(validated_params + [('sha1', 's')])
 def package_files():
     """
     The function which show list of files by given sha1 of package.
@@ -596,11 +622,12 @@ def package_files():
         'files': [file[0] for file in response],
     }
 
-    return json.dumps(js, sort_keys=False)
+    return utils.json_dumps(js)
 
 
 @app.route('/dependent_packages')
 @func_time(logger)
+@cached(validated_params)
 def dependent_packages():
     """
     The function of searching source packages whose binary packages depend on
@@ -652,6 +679,11 @@ def dependent_packages():
 
 @app.route('/what_depends_src')
 @func_time(logger)
+@cached(validated_params + [
+    ('task', 'i'), ('dptype', 's'), ('leaf', 's', 'pkg_name'), ('deep', 'i'),
+    ('finitepkg', 'b', 'pkg_name'), ('reqfilter', 's', 'pkg_name'),
+    ('reqfilterbysrc', 's', 'pkg_name'),
+])
 def what_depends_build():
     """
     The function of searching build dependencies.
@@ -789,57 +821,32 @@ def what_depends_build():
     if not deep_level:
         deep_level = 1
 
-    tmp_table_name = 'tmp_pkg_ls'
-
-    # create tmp table with list of packages
-    g.connection.request_line = \
-        """CREATE TEMPORARY TABLE {tmp_table} (pkgname String) \
-                              """.format(tmp_table=tmp_table_name)
-
-    status, response = g.connection.send_request()
-    if status is False:
-        return response
-
-    # FIXME use package_deps module
-    # base query - first iteration, build requires depth 1
-    g.connection.request_line = (
-        QM.wds_insert_build_req_deep_1.format(tmp_table=tmp_table_name), {
-            'sfilter': sourcef,
-            'pkgs': input_pkgs,
-            'branch': pbranch,
-            'union': list(input_pkgs)
-        }
-    )
-
-    status, response = g.connection.send_request()
-    if status is False:
-        return response
-
     max_allowed_depth = 10
-
-    if deep_level > 1:
-        if deep_level > max_allowed_depth:
-            return utils.json_str_error(
-                "Requires Depth cannot exceed {}".format(max_allowed_depth)
-            )
-
-        # sql wrapper for increase depth
-        deep_wrapper = QM.wds_increase_depth_wrap.format(
-            tmp_table=tmp_table_name
+    if deep_level > max_allowed_depth:
+        return utils.json_str_error(
+            "Requires Depth cannot exceed {}".format(max_allowed_depth)
         )
 
-        # process depth for every level and add results to pkg_ls
-        for i in range(deep_level - 1):
-            g.connection.request_line = (QM.wds_insert_result_for_depth_level.format(
-                wrapper=deep_wrapper, tmp_table=tmp_table_name
-            ), {'sfilter': sourcef, 'branch': pbranch})
-
-            status, response = g.connection.send_request()
-            if status is False:
-                return response
+    # dependent packages and source dependencies are searched for x86_64
+    # packages, binary dependencies - for requested archs
+    # request may hold a connection already (task queries), graph is loaded
+    # with it, so the request doesn't wait for the second one
+    client = g.connection.held_client()
+    base_graph = server.dep_graphs.get(pbranch, ['x86_64', 'noarch'], client)
+    arch_graph = server.dep_graphs.get(pbranch, arch, client)
+    if base_graph is None or arch_graph is None:
+        g.connection.error = True
+        return utils.json_str_error('Dependency graph is not available.')
+
+    # packages which depend on input packages up to the depth level
+    pkg_ls = base_graph.dependents(
+        input_pkgs, deep_level, source=1 in sourcef, binary=0 in sourcef
+    )
 
-    g.connection.request_line = (QM.wds_get_acl.format(tmp_table=tmp_table_name),
-                                 {'branch': pbranch.lower()})
+    g.connection.request_line = QM.build(
+        QM.wds_get_acl, {'branch': pbranch.lower()},
+        tables={'pkg_names': pkg_ls}
+    )
 
     status, response = g.connection.send_request()
     if status is False:
@@ -850,55 +857,28 @@ def what_depends_build():
     for pkg in response:
         pkg_acl_dict[pkg[0]] = pkg[1][0]
 
-    tmp_table_pkg_dep = 'package_dependency'
-
-    # create tmp table package - dependency
-    g.connection.request_line = \
-        """CREATE TEMPORARY TABLE {}
-(
-    pkgname String,
-    reqname String
-)""".format(tmp_table_pkg_dep)
-
-    status, response = g.connection.send_request()
-    if status is False:
-        return response
-
-    # get source dependencies
-    if depends_type in ['source', 'both']:
-        # populate the temporary table with package names and their source
-        # dependencies
-        g.connection.request_line = (
-            QM.wds_insert_src_deps.format(
-                tmp_deps=tmp_table_pkg_dep, tmp_table=tmp_table_name), {
-                'branch': pbranch, 'pkgs': list(input_pkgs)
-            }
-        )
-
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-    # get binary dependencies
-    if depends_type in ['binary', 'both']:
-        # populate the temporary table with package names and their binary
-        # dependencies
-        g.connection.request_line = (QM.wds_insert_binary_deps.format(
-            tmp_table=tmp_table_name, tmp_req=tmp_table_pkg_dep
-        ), {'branch': pbranch, 'archs': tuple(arch)})
-
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-    # select all filtered package with dependencies
-    g.connection.request_line = QM.wds_get_all_filtred_pkgs_with_deps
-
-    status, response = g.connection.send_request()
-    if status is False:
-        return response
-
-    pkgs_to_sort_dict = utils.tuplelist_to_dict(response, 1)
+    # dependencies of found packages
+    pkg_deps = {}
+    for pkg in pkg_ls:
+        deps = set()
+        if depends_type in ['source', 'both']:
+            deps.update(base_graph.requires(pkg, binary=False))
+        if depends_type in ['binary', 'both']:
+            deps.update(arch_graph.requires(pkg, source=False))
+        pkg_deps[pkg] = deps
+
+    # packages without dependencies are skipped, except input packages
+    dep_nodes = set(input_pkgs)
+    dep_nodes.update(pkg for pkg, deps in pkg_deps.items() if deps)
+
+    pkgs_to_sort = []
+    for pkg in dep_nodes:
+        deps = pkg_deps.get(pkg, set()) & dep_nodes
+        if deps or pkg in input_pkgs:
+            deps.discard(pkg)
+            pkgs_to_sort.append((sorted(deps), pkg))
+
+    pkgs_to_sort_dict = {pkg: deps for deps, pkg in sorted(pkgs_to_sort)}
 
     if not pkgs_to_sort_dict:
         return json.dumps({})
@@ -906,21 +886,12 @@ def what_depends_build():
     finitepkg = server.get_one_value('finitepkg', 'b', is_='pkg_name')
 
     if finitepkg:
-        all_dependencies = []
-        for pkg, deps in pkgs_to_sort_dict.items():
-            for dep in deps:
-                if dep not in all_dependencies:
-                    all_dependencies.append(dep)
-
-        g.connection.request_line = \
-            ("SELECT pkgname FROM {} WHERE pkgname NOT IN %(pkgs)s"
-             "".format(tmp_table_name), {'pkgs': tuple(all_dependencies)})
+        all_dependencies = set()
+        for deps in pkgs_to_sort_dict.values():
+            all_dependencies.update(deps)
 
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-        filter_by_tops = utils.join_tuples(response)
+        filter_by_tops = tuple(pkg for pkg in pkg_ls
+                               if pkg not in all_dependencies)
 
     # check leaf, if true, get dependencies of leaf package
     if leaf:
@@ -943,23 +914,20 @@ def what_depends_build():
     for name in sorted_list:
         result_dict[name] = []
         if name in circle_deps:
-            result_dict[name] += list(circle_deps[name].keys())
+            result_dict[name] += [
+                dep for dep in circle_deps[name] if dep != name
+            ]
 
     # if leaf, then select packages from the result list and their cyclic
     # dependencies on which the leaf package and create a dictionary
     if leaf:
-
-        def recursive_search(pkgname, structure):
-            for pkg in structure[pkgname]:
-                if pkg not in leaf_filter and pkg != pkgname:
-                    leaf_filter.append(pkg)
-                    recursive_search(pkg, structure)
-
-        leaf_filter = []
-        recursive_search(leaf, pkgs_to_sort_dict)
-
-        if leaf not in leaf_filter:
-            leaf_filter.append(leaf)
+        leaf_filter = {leaf}
+        queue = deque([leaf])
+        while queue:
+            for pkg in pkgs_to_sort_dict.get(queue.popleft(), ()):
+                if pkg not in leaf_filter:
+                    leaf_filter.add(pkg)
+                    queue.append(pkg)
 
         # filter result dict by leaf packages
         result_dict = {
@@ -971,9 +939,9 @@ def what_depends_build():
     sorted_pkgs = tuple(result_dict.keys())
 
     # get output data for sorted package list
-    g.connection.request_line = (
-        QM.wds_get_output_data.format(tmp_table=tmp_table_name),
-        {'branch': pbranch}
+    g.connection.request_line = QM.build(
+        QM.wds_get_output_data, {'branch': pbranch},
+        tables={'pkg_names': sorted_pkgs}
     )
 
     status, response = g.connection.send_request()
@@ -1010,45 +978,17 @@ def what_depends_build():
         if reqfilter['reqfilter']:
             reqfilter_binpkgs = tuple(reqfilter['reqfilter'].split(','))
         else:
-            g.connection.request_line = (QM.wds_req_filter_by_src, {
-                'srcpkg': reqfilter['reqfilterbysrc'],
-                'branch': pbranch
-            })
-
-            status, response = g.connection.send_request()
-            if status is False:
-                return response
-
-            reqfilter_binpkgs = utils.join_tuples(response)
-
-        base_query = QM.wds_req_filter_by_binary.format(
-            pkg="{pkg}", tmp_table=tmp_table_name
-        )
-
-        if len(reqfilter_binpkgs) == 1:
-            base_query = base_query.format(pkg=reqfilter_binpkgs[0])
-        else:
-            last_query = None
-            for pkg in reqfilter_binpkgs:
-                if not last_query:
-                    last_query = base_query.format(pkg=pkg)
-
-                last_query = "{} AND pkgname IN ({})" \
-                             "".format(last_query, base_query.format(pkg=pkg))
-
-            base_query = last_query
-
-        g.connection.request_line = (
-            QM.wds_get_filter_pkgs.format(base_query=base_query), {
-                'branch': pbranch, 'archs': tuple(arch)
-            }
-        )
-
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
+            reqfilter_binpkgs = tuple(
+                base_graph.binaries.get(reqfilter['reqfilterbysrc'], ())
+            )
 
-        filter_pkgs = utils.join_tuples(response)
+        # packages which depend on all binary packages from filter
+        for pkg in reqfilter_binpkgs:
+            required_by = arch_graph.required_by_binary(pkg) & pkg_ls
+            if filter_pkgs is None:
+                filter_pkgs = required_by
+            else:
+                filter_pkgs &= required_by
 
     # sort pkg info list
     sorted_dict = {}
@@ -1073,6 +1013,7 @@ def what_depends_build():
 
 @app.route('/unpackaged_dirs')
 @func_time(logger)
+@cached(validated_params + [('pkgr', 's'), ('pkgset', 's', 'repo_name')])
 def unpackaged_dirs():
     """
     The function of searching unpacked directories by maintainer name.
@@ -1129,6 +1070,9 @@ def unpackaged_dirs():
 
 @app.route('/repo_compare')
 @func_time(logger)
+@cached(validated_params + [
+    ('pkgset1', 's', 'repo_name'), ('pkgset2', 's', 'repo_name'),
+])
 def repo_compare():
     """
     The function of compare two differences in the package base of specified
@@ -1183,11 +1127,12 @@ def repo_compare():
     if not response:
         return json.dumps({})
 
-    return json.dumps(result_dict, sort_keys=False)
+    return utils.json_dumps(result_dict)
 
 
 @app.route('/find_pkgset')
 @func_time(logger)
+@cached(validated_params + [('task', 'i')])
 def find_pkgset():
     """
     The function which returns a list of binary packages for the given source
@@ -1234,8 +1179,8 @@ def find_pkgset():
 
         pkg_ls = utils.join_tuples(response)
 
-    g.connection.request_line = (
-        QM.find_pkgset_get_branch_with_pkgs, {'pkgs': tuple(pkg_ls)}
+    g.connection.request_line = QM.build(
+        QM.find_pkgset_get_branch_with_pkgs, tables={'pkg_names': pkg_ls}
     )
 
     status, response = g.connection.send_request()
@@ -1258,6 +1203,7 @@ def find_pkgset():
 
 @app.route('/build_dependency_set')
 @func_time(logger)
+@cached(validated_params + [('task', 'i')])
 def build_dependency_set():
     """
     The function return a list of all binary packages which use for build
@@ -1297,8 +1243,10 @@ def build_dependency_set():
         return get_helper(server.helper(request.path))
 
     if values['task']:
-        g.connection.request_line = \
-            "SELECT branch FROM Tasks WHERE task_id = {}".format(values['task'])
+        g.connection.request_line = QM.build(
+            "SELECT branch FROM Tasks WHERE task_id = %(task)s",
+            {'task': values['task']}
+        )
 
         status, response = g.connection.send_request()
         if status is False:
@@ -1319,8 +1267,9 @@ def build_dependency_set():
         pkg_ls = tuple(values['pkg_ls'].split(','))
         pbranch = values['branch']
 
-        g.connection.request_line = QM.build_dep_set_get_pkg_hshs.format(
-            pkgs=pkg_ls, branch=pbranch
+        g.connection.request_line = QM.build(
+            QM.build_dep_set_get_pkg_hshs, {'branch': pbranch},
+            tables={'pkg_names': pkg_ls}
         )
 
         status, response = g.connection.send_request()
@@ -1340,7 +1289,14 @@ def build_dependency_set():
             if arch not in pkg_deps.static_archs and len(arch) > 1
         ]
 
-    dep_hsh_list = pkg_deps.get_package_dep_set(pkgs=hshs, first=True)
+    # closure is searched in memory if provides index is loaded
+    pkg_deps.index = server.provides_indexes.get(
+        pbranch, pkg_deps.static_archs, g.connection.held_client()
+    )
+
+    dep_hsh_list = pkg_deps.get_package_dep_set(hshs)
+    if not isinstance(dep_hsh_list, dict):
+        return dep_hsh_list
 
     result_dict = pkg_deps.make_result_dict(
         list(dep_hsh_list.keys()) +
@@ -1348,11 +1304,14 @@ def build_dependency_set():
         dep_hsh_list
     )
 
-    return json.dumps(result_dict, sort_keys=False)
+    return utils.json_dumps(result_dict)
 
 
 @app.route('/packages')
 @func_time(logger)
+@cached(validated_params + [
+    ('pkgset', 's', 'repo_name'), ('pkgtype', 's'),
+])
 def repository_packages():
     """
     The function returns a list of all packages of the repository in json
@@ -1362,6 +1321,7 @@ def repository_packages():
         pkgset * - name of repository
         pkgtype - type of package (source, binary, both)
         arch - architecture(s) of packages
+        stream - send packages by blocks while reading them from database
 
     Output structure:
         name
@@ -1403,22 +1363,59 @@ def repository_packages():
 
     sourcef = pkgs_type_to_sql[pkgs_type]
 
-    g.connection.request_line = QM.packages_get_repo_packages.format(
-        branch=values['pkgset'], branch_l=values['pkgset'].lower(),
-        archs=archs, src=sourcef
-    )
+    g.connection.request_line = QM.build(QM.packages_get_repo_packages, {
+        'branch': values['pkgset'], 'branch_l': values['pkgset'].lower(),
+        'archs': tuple(archs), 'src': sourcef
+    })
+
+    fields = ['name', 'version', 'release', 'summary', 'maintainers', 'url',
+              'license', 'category', 'architectures', 'acl_list']
+
+    # send the result by blocks as soon as they are read from database
+    if server.get_one_value('stream', 'b'):
+        status, response = g.connection.send_request_iter(
+            namespace.STREAM_BLOCK_SIZE
+        )
+        if status is False:
+            return response
+
+        connection = g.connection
+
+        def generate():
+            try:
+                yield '['
+                separator = ''
+                for block in response:
+                    yield separator + ','.join(
+                        utils.json_dumps(dict(zip(fields, row)))
+                        for row in block
+                    )
+                    separator = ','
+                yield ']'
+            finally:
+                connection.close_stream()
+
+        stream_response = Response(stream_with_context(generate()),
+                                   mimetype='application/json')
+        # connection is released even if the response is never iterated
+        # (client is gone before the first chunk)
+        stream_response.call_on_close(connection.close_stream)
+
+        return stream_response
 
     status, response = g.connection.send_request()
     if status is False:
         return response
 
-    PkgMeta = namedtuple('PkgMeta', 'name version release summary maintainers '
-                                    'url license category architectures acl_list')
-    return jsonify([PkgMeta(*i)._asdict() for i in response])
+    return Response(
+        utils.json_dumps(utils.RowSerializer(fields).to_dicts(response)),
+        mimetype='application/json'
+    )
 
 
 @app.route('/task_info')
 @func_time(logger)
+@cached(validated_params + [('task', 'i'), ('rebuild', 's')], ttl=60)
 def task_info():
     server.url_logging()
 
@@ -1434,13 +1431,13 @@ def task_info():
     if try_iteration:
         try_iteration = tuple([int(i) for i in try_iteration.split('.')])
 
-    g.connection.request_line = """
+    g.connection.request_line = QM.build("""
     SELECT DISTINCT concat(toString(try), '.', toString(iteration)),
                 branch,
                 userid
     FROM Tasks
-    WHERE task_id = {}
-    """.format(task_id)
+    WHERE task_id = %(id)s
+    """, {'id': task_id})
 
     status, response = g.connection.send_request()
     if status is False:
@@ -1452,10 +1449,14 @@ def task_info():
     branch, user_id = response[0][1], response[0][2]
     all_rebuilds = [i[0] for i in response]
 
-    g.connection.request_line = QM.task_info_get_task_content.format(id=task_id)
+    g.connection.request_line = QM.build(
+        QM.task_info_get_task_content, {'id': task_id}
+    )
     if try_iteration:
-        g.connection.request_line = QM.task_info_get_task_content_rebuild.format(
-            id=task_id, ti=try_iteration)
+        g.connection.request_line = QM.build(
+            QM.task_info_get_task_content_rebuild,
+            {'id': task_id, 'ti': try_iteration}
+        )
 
     status, response = g.connection.send_request()
     if status is False:
@@ -1470,15 +1471,17 @@ def task_info():
     pkg_hshs = [val for sublist in [[i[0]] + i[4] for i in response]
                 for val in sublist]
 
-    g.connection.request_line = """SELECT pkghash,
+    g.connection.request_line = QM.build("""SELECT pkghash,
                                           name,
                                           version,
                                           release,
                                           arch,
                                           description
                                    FROM Package
-                                   WHERE pkghash IN {}
-                                   """.format(tuple(pkg_hshs))
+                                   WHERE pkghash IN
+                                       (SELECT hsh
+                                        FROM pkg_hshs)
+                                   """, tables={'pkg_hshs': pkg_hshs})
 
     status, response = g.connection.send_request()
     if status is False:
@@ -1486,46 +1489,24 @@ def task_info():
 
     name_hsh = utils.tuplelist_to_dict(response, 5)
 
-    http = utils.HtmlParser(
-        'a',
-        ['Name', 'Last modified', 'Size', 'Description', 'Parent Directory']
-    )
-
-    for hsh, subtask in pkg_subtask.items():
-        result_list = []
-        for i in ['approved', 'disapproved']:
-            url = "http://git.altlinux.org/tasks/{task}/acl/{act}/{subtask}/" \
-                  "".format(task=task_id, subtask=subtask, act=i)
-            result = http.parse_html(url)
-            if result:
-                result = result.split('::')
-                msg_format = [result[0].strip()] + \
-                             [k.strip() for k in result[1].split('\n')][:-1]
-            else:
-                msg_format = ''
+    # pages of finished task or of old iteration are not changed anymore
+    def iteration_key(value):
+        return tuple(int(i) for i in str(value).split('.'))
 
-            result_list.append(msg_format or '')
+    finished = task_status in task_artifacts.finished_statuses or \
+        iteration_key(try_iteration) < max(map(iteration_key, all_rebuilds))
 
-        pkg_subtask[hsh] = [pkg_subtask[hsh]] + result_list
-
-    beehive_result = requests.get(
-        "http://bb.ipa.basealt.ru/RESULT/{}/check-beehive-result.log"
-        "".format(task_id)
+    # approvals and logs are downloaded concurrently
+    approvals, beehive_result, task_msg, complete = task_artifacts.fetch(
+        task_id, try_iteration, list(pkg_subtask.values()), finished
     )
 
-    beehive_result = "" if beehive_result.status_code != 200 \
-        else beehive_result.content.decode()
-
-    task_msg_req = requests.get(
-        'http://git.altlinux.org/tasks/{task}/logs/events.{ti}.log'
-        ''.format(task=task_id, ti=try_iteration)
-    )
+    # don't cache the response without slow external data
+    if not complete:
+        g.connection.partial = True
 
-    task_msg = ''
-    if task_msg_req.status_code == 200:
-        message = re.findall(r'message:(.*)', task_msg_req.content.decode())
-        if message:
-            task_msg = message[0].strip()
+    for hsh, subtask in pkg_subtask.items():
+        pkg_subtask[hsh] = [subtask] + approvals[subtask]
 
     result_list = []
     for pkg in src_pkgs:
@@ -1557,6 +1538,7 @@ def task_info():
 
 @app.route('/task_diff')
 @func_time(logger)
+@cached(validated_params + [('task', 'i')], ttl=300)
 def task_diff():
     server.url_logging()
 
@@ -1568,8 +1550,9 @@ def task_diff():
     if not task_id:
         return get_helper(server.helper(request.path))
 
-    g.connection.request_line = QM.task_diff_get_task_pkgs.format(
-        id=task_id)
+    g.connection.request_line = QM.build(
+        QM.task_diff_get_task_pkgs, {'id': task_id}
+    )
 
     status, response = g.connection.send_request()
     if status is False:
@@ -1577,8 +1560,9 @@ def task_diff():
 
     task_pkgs = utils.join_tuples(response)
 
-    g.connection.request_line = (
-        QM.task_diff_get_repo_pkgs, {'hshs': task_pkgs, 'id': task_id}
+    g.connection.request_line = QM.build(
+        QM.task_diff_get_repo_pkgs, {'id': task_id},
+        tables={'pkg_hshs': task_pkgs}
     )
 
     status, response = g.connection.send_request()
@@ -1590,8 +1574,8 @@ def task_diff():
 
     repo_pkgs = utils.join_tuples(response)
 
-    g.connection.request_line = (
-        QM.task_diff_get_depends_by_hshs, {'hshs': task_pkgs}
+    g.connection.request_line = QM.build(
+        QM.task_diff_get_depends_by_hshs, tables={'pkg_hshs': task_pkgs}
     )
 
     status, response = g.connection.send_request()
@@ -1600,8 +1584,8 @@ def task_diff():
 
     task_deps = response
 
-    g.connection.request_line = (
-        QM.task_diff_get_depends_by_hshs, {'hshs': repo_pkgs}
+    g.connection.request_line = QM.build(
+        QM.task_diff_get_depends_by_hshs, tables={'pkg_hshs': repo_pkgs}
     )
 
     status, response = g.connection.send_request()
@@ -1640,18 +1624,100 @@ def task_diff():
                 if res_list:
                     result_dict[name][type_][arch] = res_list
 
-    return json.dumps(result_dict)
+    return utils.json_dumps(result_dict)
+
+
+@app.route('/cache_invalidate')
+def cache_invalidate():
+    """
+    Drop cached responses of all workers. Should be called after repository
+    import.
+
+    Input headers:
+        X-Admin-Token * - administrative token
+    """
+    server.url_logging()
+
+    check_token = server.check_admin_token()
+    if check_token is not True:
+        return check_token
+
+    return json.dumps({'generation': response_cache.invalidate()})
+
+
+@app.route('/query_stats')
+def query_stats():
+    """
+    Statistics of database queries of all running worker processes by
+    endpoint and SQL template.
+
+    Input headers:
+        X-Admin-Token * - administrative token
+
+    Input GET params:
+        reset - clear statistics of all workers after reading (true, false)
+    """
+    server.url_logging()
+
+    check_token = server.check_admin_token()
+    if check_token is not True:
+        return check_token
+
+    stats = query_profiler.stats()
+    if server.get_one_value('reset', type_='b'):
+        query_profiler.clear()
+
+    return utils.json_dumps(stats)
+
+
+@app.route('/metrics')
+def metrics_view():
+    """
+    Metrics of all worker processes in Prometheus text format.
+    """
+    return Response(metrics.render(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.before_request
 def init_db_connection():
+    # start loading of catalog and writing of metrics in worker process
+    server.catalog.start()
+    metrics.start()
+    query_profiler.start()
+
     g.connection = Connection()
 
+    # id of request in log records, can be given by proxy
+    g.request_id = request.headers.get('X-Request-Id', '')[:64] or \
+        uuid.uuid4().hex
+    g.request_start = time.time()
+    metrics.add('altrepo_http_requests_in_flight', 1)
+
+
+@app.after_request
+def count_request(response):
+    # route instead of path, so unknown urls don't make new series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+    metrics.inc('altrepo_http_requests_total', route=route,
+                method=request.method, status=str(response.status_code))
+    metrics.observe('altrepo_http_request_duration_seconds',
+                    time.time() - g.request_start, route=route)
+
+    response.headers['X-Request-Id'] = g.request_id
+
+    return response
+
 
 @app.teardown_request
 def drop_connection(exception):
     g.connection.drop_connection()
 
+    metrics.add('altrepo_http_requests_in_flight', -1)
+    metrics.sync()
+    query_profiler.sync()
+
 
 @app.errorhandler(404)
 def page_404(error):
@@ -1682,5 +1748,54 @@ def page_404(error):
     return json.dumps(helper, sort_keys=False)
 
 
+def preload():
+    """
+    Load read-only data in gunicorn master process before worker processes
+    are forked, so workers share it copy-on-write instead of loading it
+    every one.
+    """
+    start = time.time()
+    timings = []
+
+    if namespace.CATALOG_REFRESH:
+        step = time.time()
+        server.catalog.load()
+        timings.append(('catalog', time.time() - step))
+
+    for branch in namespace.PRELOAD_GRAPHS.split(','):
+        branch = branch.strip()
+        if not branch:
+            continue
+
+        # graph of /what_depends_src
+        step = time.time()
+        server.dep_graphs.get(branch, ['x86_64', 'noarch'])
+        timings.append(('graph {}'.format(branch), time.time() - step))
+
+        # provides index of /build_dependency_set
+        step = time.time()
+        server.provides_indexes.get(branch, ['x86_64', 'noarch'])
+        timings.append(('provides {}'.format(branch), time.time() - step))
+
+    # database connections of master process are not used by workers
+    db_pool.close()
+
+    # loaded objects are not scanned by garbage collector of workers, so
+    # their memory pages stay shared
+    gc.collect()
+    gc.freeze()
+
+    logger.info("Preloaded in {:.3f}s ({})".format(
+        time.time() - start,
+        ', '.join('{} {:.3f}s'.format(*step) for step in timings) or 'nothing'
+    ))
+
+
+# with preloading the application is imported by gunicorn master process
+if namespace.PRELOAD_APP:
+    preload()
+
+
 if __name__ == '__main__':
+    utils.setup_logging()
     app.run()
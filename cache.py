@@ -0,0 +1,386 @@
+import os
+import sys
+import time
+import marshal
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import g, request, Response
+
+import utils
+
+logger = utils.get_logger(__name__)
+
+
+class LRUCache:
+    """
+    In-process LRU cache limited by size of stored values.
+
+    Every item has its own time to live. Size of `str` and `bytes` values is
+    their length, for other values `sys.getsizeof` is used.
+
+    :param max_bytes: maximum summary size of stored values
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (expiration time, size, value)
+        self._items = OrderedDict()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _size(value):
+        if isinstance(value, (str, bytes)):
+            return len(value)
+        if isinstance(value, tuple):
+            return sum(LRUCache._size(i) for i in value)
+
+        return sys.getsizeof(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            if item[0] < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+
+            return item[2]
+
+    def set(self, key, value, ttl):
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._items:
+                self._pop(key)
+
+            self._items[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._items)))
+                self.evictions += 1
+
+    def _pop(self, key):
+        self._bytes -= self._items.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._items), 'bytes': self._bytes,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class DiskCache:
+    """
+    On-disk cache shared by all worker processes.
+
+    Every item is a file named by sha1 of the key. Values are stored by
+    `marshal`, so only plain values (`str`, `bytes`, numbers, tuples...) are
+    cached and loading of file doesn't execute code. Directory is private
+    to the user (see `utils.make_private_dir`). Files are written
+    atomically, reading of item updates its modification time, so when the
+    directory grows over `max_bytes` the least recently used files are
+    removed.
+
+    :param path: cache directory
+    :param max_bytes: maximum summary size of cache files
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None
+
+        utils.make_private_dir(self.path)
+
+    def _file(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.path, name)
+
+    def get(self, key, default=None):
+        path = self._file(key)
+
+        try:
+            with open(path, 'rb') as fd:
+                expires, value = marshal.load(fd)
+        except (OSError, EOFError, ValueError, TypeError):
+            return default
+
+        if expires is not None and expires < time.time():
+            self._remove(path)
+            return default
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl is not None else None
+        try:
+            data = marshal.dumps((expires, value))
+        except ValueError as error:
+            logger.error("Cache value is not serializable: {}".format(error))
+            return
+        if len(data) > self.max_bytes:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, self._file(key))
+        except OSError as error:
+            logger.error("Cache write error: {}".format(error))
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data)
+            if self._bytes is None or self._bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        self._remove(self._file(key))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        # size is counted again from directory, other processes also write
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        self._bytes = sum(file[1] for file in files)
+        if self._bytes <= self.max_bytes:
+            return
+
+        # remove the oldest files until 90% of limit
+        for _, size, path in sorted(files):
+            self._remove(path)
+            self._bytes -= size
+            if self._bytes <= self.max_bytes * 0.9:
+                break
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.startswith('.'):
+                self._remove(entry.path)
+
+        with self._lock:
+            self._bytes = 0
+
+
+class Generation:
+    """
+    Counter of repository imports shared by all worker processes.
+
+    Counter is kept in the file, workers reread it not often than once per
+    `check_interval` seconds. Components which keep data of repository
+    compare counter with value for their data and reload it after change.
+
+    :param path: path to the counter file
+    :param check_interval: seconds between file reads
+    """
+
+    def __init__(self, path, check_interval=1):
+        self.path = path
+        self.check_interval = check_interval
+        self._value = 0
+        self._checked = None
+
+        utils.make_private_dir(os.path.dirname(self.path))
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as fd:
+                return int(fd.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def current(self):
+        now = time.monotonic()
+        if self._checked is None or now - self._checked > self.check_interval:
+            self._value = self._read()
+            self._checked = now
+
+        return self._value
+
+    def bump(self):
+        value = self._read() + 1
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'w') as tmp:
+            tmp.write(str(value))
+        os.replace(tmp_path, self.path)
+
+        self._value, self._checked = value, time.monotonic()
+
+        return value
+
+
+class ResponseCache:
+    """
+    Cache of responses of read-only endpoints.
+
+    Responses are kept in the in-process LRU and (optionally) in the shared
+    on-disk tier. Key of response is the name of endpoint, normalized
+    values of its parameters and names of all arguments of request (views
+    answer with helper to request without arguments, and request with
+    unknown arguments only has the same values of parameters). All
+    responses are dropped after the repository import (see `invalidate`).
+
+    :param normalizer: function which returns normalized values of request
+                       parameters by list of parameters (ex.
+                       `LogicServer.get_dict_values`)
+    :param generation: shared `Generation` counter
+    :param max_bytes: size of in-process tier
+    :param disk_path: directory of on-disk tier
+    :param disk_max_bytes: size of on-disk tier (0 - disabled)
+    :param default_ttl: default time to live of response
+    :param metrics: `Metrics` for hits and misses (not counted if not set)
+    :param on_hit: function without arguments called instead of view for
+                   response from cache (ex. access log written by view)
+    """
+
+    def __init__(self, normalizer, generation, max_bytes, disk_path=None,
+                 disk_max_bytes=0, default_ttl=600, metrics=None,
+                 on_hit=None):
+        self.normalizer = normalizer
+        self.generation = generation
+        self.default_ttl = default_ttl
+        self.metrics = metrics
+        self.on_hit = on_hit
+
+        self.memory = LRUCache(max_bytes)
+        self.disk = None
+        if disk_path and disk_max_bytes:
+            self.disk = DiskCache(disk_path, disk_max_bytes)
+
+    def _key(self, endpoint, params):
+        values = self.normalizer(params)
+        return (self.generation.current(), endpoint,
+                tuple(sorted(values.items())), tuple(sorted(request.args)))
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk:
+            value = self.disk.get(key)
+
+        return value
+
+    def set(self, key, value, ttl):
+        self.memory.set(key, value, ttl)
+        if self.disk:
+            self.disk.set(key, value, ttl)
+
+    @staticmethod
+    def _is_cacheable(response):
+        # don't keep errors, they may be caused by database connection
+        connection = getattr(g, 'connection', None)
+        if connection is not None and (connection.error or connection.partial):
+            return False
+
+        if isinstance(response, str):
+            return not response.startswith('{"Error"')
+
+        return isinstance(response, Response) and \
+            response.status_code == 200 and not response.is_streamed
+
+    def cached(self, params, ttl=None):
+        """
+        Decorator of view function.
+
+        :param params: list of parameters of endpoint in format of
+                       `LogicServer.get_dict_values`
+        :param ttl: time to live of responses (default if not set)
+        """
+        ttl = ttl or self.default_ttl
+
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                key = self._key(function.__name__, params)
+
+                value = self.get(key)
+                if self.metrics is not None:
+                    self.metrics.inc(
+                        'altrepo_cache_requests_total', cache='response',
+                        result='miss' if value is None else 'hit'
+                    )
+
+                if value is not None:
+                    if self.on_hit is not None:
+                        self.on_hit()
+                    logger.debug("Response of {} from cache".format(
+                        function.__name__))
+                    if isinstance(value, tuple):
+                        return Response(value[0], mimetype=value[1])
+                    return value
+
+                response = function(*args, **kwargs)
+
+                if self._is_cacheable(response):
+                    value = response
+                    if isinstance(response, Response):
+                        value = (response.get_data(), response.mimetype)
+                    self.set(key, value, ttl)
+
+                return response
+
+            wrapper.__name__ = function.__name__
+            return wrapper
+
+        return decorator
+
+    def invalidate(self):
+        """
+        Drop all cached responses in all worker processes.
+
+        Should be called after repository import.
+        """
+        generation = self.generation.bump()
+
+        self.memory.clear()
+        if self.disk:
+            self.disk.clear()
+
+        logger.info("Response cache invalidated, generation {}"
+                    "".format(generation))
+
+        return generation
+
+    def stats(self):
+        stats = {'generation': self.generation.current(),
+                 'memory': self.memory.stats()}
+        return stats
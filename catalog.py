@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import threading
+
+import utils
+from querymgr import query_manager as QM
+
+logger = utils.get_logger(__name__)
+
+
+class RepositoryCatalog:
+    """
+    Branches, architectures and package names of repositories.
+
+    Catalog is loaded from database in the background thread of every worker
+    process and reloaded every `refresh_interval` seconds or after the
+    repository import (change of `generation`). Until the first load the
+    default branches and archs are used and package names are unknown.
+
+    :param pool: database connection pool
+    :param breaker: database circuit breaker
+    :param generation: shared counter of repository imports
+    :param branches: default list of branches
+    :param archs: default list of archs
+    :param refresh_interval: seconds between reloads (0 - catalog disabled)
+    """
+
+    def __init__(self, pool, breaker, generation, branches, archs,
+                 refresh_interval=600, check_interval=5):
+        self.pool = pool
+        self.breaker = breaker
+        self.generation = generation
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+
+        self.branches = frozenset(branches)
+        self.archs = frozenset(archs)
+        # (branch, sourcepackage) -> names of packages
+        self.packages = {}
+        self.loaded = False
+
+        self._loaded_generation = None
+        # time of the last load (`time.monotonic`)
+        self._loaded_at = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Load catalog from database.
+
+        :return: `True` if catalog was loaded
+        """
+        if self.breaker and not self.breaker.allow_request():
+            return False
+
+        generation = self.generation.current()
+        start = time.time()
+
+        try:
+            with self.pool.client(self.breaker) as client:
+                response = client.execute(QM.catalog_get_branch_packages)
+        except Exception:
+            # error is logged by the pool
+            return False
+
+        if not response:
+            return False
+
+        branches, archs, packages = set(), set(), {}
+        for branch, source, names, pkg_archs in response:
+            branches.add(branch)
+            archs.update(pkg_archs)
+            # names are interned to share strings between branches
+            packages[(branch, source)] = \
+                frozenset(sys.intern(name) for name in names)
+
+        self.branches, self.archs = frozenset(branches), frozenset(archs)
+        self.packages = packages
+        self.loaded = True
+        self._loaded_generation = generation
+        self._loaded_at = time.monotonic()
+
+        logger.info(
+            "Catalog loaded in {:.3f}s: {} branches, {} archs, {} names"
+            "".format(time.time() - start, len(branches), len(archs),
+                      sum(len(names) for names in packages.values()))
+        )
+
+        return True
+
+    def _run(self):
+        # catalog preloaded before fork is not loaded again until it expires
+        last_load = self._loaded_at
+
+        while True:
+            expired = last_load is None or \
+                time.monotonic() - last_load > self.refresh_interval
+
+            if not self.loaded or expired or \
+                    self._loaded_generation != self.generation.current():
+                self.load()
+                last_load = time.monotonic()
+
+            time.sleep(self.check_interval)
+
+    def start(self):
+        """
+        Start background loading in the current process. Should be called
+        in every worker process, repeated calls do nothing.
+        """
+        if not self.refresh_interval or self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+
+            thread = threading.Thread(
+                target=self._run, name='catalog', daemon=True
+            )
+            thread.start()
+
+    def missing_packages(self, names, branch=None, source=None):
+        """
+        Find package names which are not in the repository.
+
+        :param names: list of package names
+        :param branch: name of repository (any if not set)
+        :param source: source (1) or binary (0) packages (any if not set)
+        :return: `list` of missing names or `None` if catalog isn't loaded
+        """
+        if not self.loaded:
+            return None
+
+        name_sets = [
+            names_ for (branch_, source_), names_ in self.packages.items()
+            if (branch is None or branch_ == branch) and
+               (source is None or source_ == source)
+        ]
+
+        return [name for name in names
+                if not any(name in names_ for names_ in name_sets)]
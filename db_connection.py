@@ -1,66 +1,564 @@
-from clickhouse_driver import Client, errors
+import os
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from clickhouse_driver import Client
 from utils import get_logger, exception_to_logger, json_str_error, print_statusbar
 
 logger = get_logger(__name__)
 
 
-class DBConnection:
+class PoolTimeoutError(Exception):
+    pass
+
+
+class DBConnectionPool:
+    """
+    Bounded thread-safe pool of clickhouse clients.
+
+    Clients are created lazily up to `size` and stay connected between
+    requests. Before every checkout the client is checked: a client idle for
+    more than `max_idle` seconds is reconnected, a client idle for more than
+    `ping_interval` seconds is pinged first. The pool remembers the process
+    it was created in and starts from scratch after fork, so sockets are
+    never shared between gunicorn workers.
+
+    :param size: maximum number of clients in the pool
+    :param timeout: seconds to wait for a free client on checkout
+    :param max_idle: seconds after which an idle client is reconnected
+    :param ping_interval: seconds after which an idle client is pinged
+    """
+
     def __init__(self, clickhouse_host=None, clickhouse_name=None, dbuser=None,
-                 dbpass=None, db_query=None):
+                 dbpass=None, size=4, timeout=10, max_idle=300,
+                 ping_interval=30):
+        self.client_params = {
+            'host': clickhouse_host, 'database': clickhouse_name,
+            'user': dbuser, 'password': dbpass,
+        }
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
 
-        self.db_query = db_query
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Condition()
+        # (client, time of last release), the most recently used on the right
+        self._idle = deque()
+        self._opened = 0
+        self._waiting = 0
+        self._counters = {
+            'created': 0, 'checkouts': 0, 'timeouts': 0, 'reconnects': 0,
+            'discarded': 0,
+        }
+
+    def _check_fork(self):
+        # sockets inherited from the parent process must not be used
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _connect(self, client):
+        if client is None:
+            client = Client(**self.client_params)
+            self._count('created')
+
+        client.connection.connect()
+
+        return client
+
+    def _prepare(self, client, last_used):
+        if client is None:
+            return self._connect(client)
+
+        idle_time = time.monotonic() - last_used
+
+        if not client.connection.connected or idle_time > self.max_idle:
+            client.disconnect()
+            self._count('reconnects')
+            return self._connect(client)
+
+        if idle_time > self.ping_interval and not client.connection.ping():
+            client.disconnect()
+            self._count('reconnects')
+            return self._connect(client)
+
+        return client
+
+    def acquire(self, timeout=None):
+        """
+        Take a connected client from the pool.
+
+        :param timeout: seconds to wait for a free client (pool default if
+                        not set)
+        :return: `clickhouse_driver.Client`
+        """
+        self._check_fork()
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+
+        with self._lock:
+            while True:
+                if self._idle:
+                    client, last_used = self._idle.pop()
+                    break
+
+                if self._opened < self.size:
+                    client, last_used = None, None
+                    self._opened += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        "No free database connection in {} seconds."
+                        "".format(timeout)
+                    )
+
+                self._waiting += 1
+                self._lock.wait(remaining)
+                self._waiting -= 1
+
+            self._counters['checkouts'] += 1
+
+        try:
+            return self._prepare(client, last_used)
+        except Exception:
+            self._forget(client)
+            raise
+
+    def release(self, client, discard=False):
+        """
+        Return client to the pool.
+
+        :param client: client taken by `acquire`
+        :param discard: close the client instead of keeping it (ex. if the
+                        session state of connection is dirty)
+        """
+        if self._pid != os.getpid():
+            return
+
+        if discard:
+            self._forget(client)
+            return
+
+        expired = []
+        with self._lock:
+            now = time.monotonic()
+            self._idle.append((client, now))
+
+            # close clients that were not used for a long time
+            while self._idle and now - self._idle[0][1] > self.max_idle:
+                expired.append(self._idle.popleft()[0])
+                self._opened -= 1
+
+            self._lock.notify()
+
+        for client_ in expired:
+            client_.disconnect()
+
+    @contextmanager
+    def client(self, breaker=None, held=None):
+        """
+        Client of the pool for a block of queries.
+
+        Client is released after the block, or discarded if the block fails:
+        query may fail in the middle of result, so unread rows may be left
+        in the socket (`rows_pending` of `DBConnection`). Failures to connect
+        and failed queries are recorded by `breaker`, timeout of the pool is
+        not (database is alive, all connections are busy). Errors are logged
+        and raised.
+
+        :param breaker: `CircuitBreaker` of database
+        :param held: client the caller already holds, it is used as is and
+                     is not released
+        """
+        client = held
+        if client is None:
+            try:
+                client = self.acquire()
+            except PoolTimeoutError as error:
+                logger.error(error)
+                raise
+            except Exception as error:
+                logger.error(error)
+                if breaker:
+                    breaker.record_failure()
+                raise
+
+        try:
+            yield client
+        except Exception as error:
+            logger.error(exception_to_logger(error))
+            if breaker:
+                breaker.record_failure()
+            if held is None:
+                self.release(client, discard=True)
+            raise
+
+        if breaker:
+            breaker.record_success()
+        if held is None:
+            self.release(client)
+
+    def _forget(self, client):
+        if client is not None:
+            client.disconnect()
+
+        with self._lock:
+            self._opened -= 1
+            self._counters['discarded'] += 1
+            self._lock.notify()
+
+    def stats(self):
+        """
+        Pool size metrics.
+
+        :return: `dict` with pool size, open/idle/in use clients, waiting
+                 threads and checkout counters
+        """
+        with self._lock:
+            stats = {
+                'size': self.size,
+                'open': self._opened,
+                'idle': len(self._idle),
+                'in_use': self._opened - len(self._idle),
+                'waiting': self._waiting,
+            }
+            stats.update(self._counters)
+
+        return stats
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].disconnect()
+                self._opened -= 1
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for database connections.
+
+    While circuit is closed connections are allowed and consecutive failures
+    are counted. After `failure_threshold` failures circuit opens and all
+    connection attempts fail fast. When the open timeout expires, circuit
+    becomes half-open and lets a single probe through: success closes the
+    circuit, failure opens it again for twice as long (with jitter, up to
+    `max_reset_timeout`). One breaker is shared by all requests of worker
+    process.
+
+    :param failure_threshold: consecutive failures to open the circuit
+    :param reset_timeout: seconds the circuit stays open first time
+    :param max_reset_timeout: upper limit of the open state duration
+    :param backoff_base: first delay between connection attempts
+    :param max_backoff: upper limit of delay between connection attempts
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
 
-        self.clickhouse_client = Client(
-            host=clickhouse_host, database=clickhouse_name, user=dbuser,
-            password=dbpass
+    def __init__(self, failure_threshold=3, reset_timeout=5,
+                 max_reset_timeout=60, backoff_base=0.1, max_backoff=5):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened = 0
+        self._open_until = 0
+        self._probe_started = None
+        self._rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self):
+        """
+        Check whether a connection attempt is allowed now.
+
+        :return: `True` if connection may be made, `False` if it should
+                 fail fast
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN and now >= self._open_until:
+                self._state = self.HALF_OPEN
+                self._probe_started = None
+
+            # the only probe is allowed, the lost probe is replaced after
+            # reset timeout
+            if self._state == self.HALF_OPEN and (
+                    self._probe_started is None or
+                    now - self._probe_started > self.reset_timeout):
+                self._probe_started = now
+                return True
+
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+
+            if self._state == self.HALF_OPEN or \
+                    self._failures >= self.failure_threshold:
+                timeout = min(self.max_reset_timeout,
+                              self.reset_timeout * 2 ** self._opened)
+                self._opened += 1
+                self._state = self.OPEN
+                self._open_until = \
+                    time.monotonic() + random.uniform(timeout / 2, timeout)
+                self._probe_started = None
+
+                logger.error(
+                    "Database circuit is open for {:.1f} seconds after {} "
+                    "failures.".format(self._open_until - time.monotonic(),
+                                       self._failures)
+                )
+
+    def backoff(self, attempt):
+        """
+        Jittered exponential delay before the next connection attempt.
+
+        :param attempt: number of attempt (from 0)
+        :return: `float` delay in seconds
+        """
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_base * 2 ** attempt)
         )
 
-        try_conn = self._connection_test()
-        if try_conn:
-            raise try_conn
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'failures': self._failures,
+                'opened': self._opened,
+                'rejected': self._rejected,
+            }
+
+
+class DBConnection:
+    def __init__(self, pool, breaker=None, db_query=None, on_query=None):
+
+        self.db_query = db_query
+        # called with statistics of every finished query
+        self.on_query = on_query
+
+        self.pool = pool
+        self.breaker = breaker
+        self.clickhouse_client = None
+        # connection with temporary tables can't be given to other requests
+        self.dirty_session = False
+        self.rows_pending = False
 
         self.connection_status = False
+        self.connection_error = None
 
     def make_connection(self):
+        if self.breaker and not self.breaker.allow_request():
+            self.connection_error = "Database is unavailable."
+            return False
+
         try:
-            self.clickhouse_client.connection.connect()
+            self.clickhouse_client = self.pool.acquire()
+        except PoolTimeoutError as error:
+            # database is alive, all connections are busy
+            logger.error(error)
+            self.connection_error = error
+            return False
         except Exception as error:
             logger.error(error)
+            self.connection_error = error
+            if self.breaker:
+                self.breaker.record_failure()
             return False
 
+        # idle client of the pool is given without contact with the server,
+        # probe of half-open circuit checks the server by ping, otherwise
+        # success is recorded by completed query
+        if self.breaker and self.breaker.state != self.breaker.CLOSED:
+            try:
+                alive = self.clickhouse_client.connection.ping()
+            except Exception:
+                alive = False
+
+            if not alive:
+                logger.error("Database doesn't respond to ping.")
+                self.pool.release(self.clickhouse_client, discard=True)
+                self.clickhouse_client = None
+                self.connection_error = "Database is unavailable."
+                self.breaker.record_failure()
+                return False
+
+            self.breaker.record_success()
+
         self.connection_status = True
+        self.connection_error = None
 
         return True
 
-    def _connection_test(self):
-        try:
-            self.clickhouse_client.connection.connect()
-        except errors.Error as error:
-            logger.error(exception_to_logger(error))
-            return "Error of database connection."
+    def _record_success(self):
+        if self.breaker:
+            self.breaker.record_success()
+
+    def _query_stats(self, start, result_rows, error=False):
+        """
+        Statistics of finished query: name of SQL template, wall time, time
+        of query on the server (0 if server doesn't report it), client time
+        (receiving and deserialization of result), rows and bytes read by
+        the server and rows of result. Statistics are written to the log
+        and passed to `on_query`.
+        """
+        query = self._unpack(self.db_query)[0]
+
+        wall_time = time.time() - start
+        server_time, rows_read, bytes_read = 0.0, 0, 0
+
+        info = getattr(self.clickhouse_client, 'last_query', None)
+        progress = getattr(info, 'progress', None)
+        if progress:
+            # old versions of clickhouse-driver don't report elapsed time
+            server_time = int(getattr(progress, 'elapsed_ns', 0)) / 10 ** 9
+            rows_read, bytes_read = int(progress.rows), int(progress.bytes)
 
-        self.clickhouse_client.disconnect()
-        return None
+        stats = {
+            'template': getattr(query, 'name', None) or 'inline',
+            'wall_time': wall_time,
+            'server_time': server_time,
+            'client_time': max(wall_time - server_time, 0.0),
+            'rows_read': rows_read,
+            'bytes_read': bytes_read,
+            'result_rows': result_rows,
+            'error': error,
+        }
+
+        logger.debug(
+            "Query {} in {:.3f}s".format(stats['template'], wall_time),
+            extra={'query': stats}
+        )
+        if self.on_query is not None:
+            self.on_query(stats)
+
+        return stats
+
+    @staticmethod
+    def _unpack(db_query):
+        # query is text of query, (query, params) or (query, params,
+        # external tables) made by `QueryManager.build`
+        if isinstance(db_query, tuple):
+            return (tuple(db_query) + (None, None))[:3]
+
+        return db_query, None, None
 
     def send_request(self, trace=False):
         response_status = False
+        start = time.time()
+
+        query, params, external_tables = self._unpack(self.db_query)
+
+        if 'TEMPORARY TABLE' in query.upper():
+            self.dirty_session = True
 
         try:
-            if isinstance(self.db_query, tuple):
-                response = self.clickhouse_client.execute(
-                    self.db_query[0], self.db_query[1]
-                )
-            else:
-                response = self.clickhouse_client.execute(self.db_query)
+            response = self.clickhouse_client.execute(
+                query, params, external_tables=external_tables
+            )
             response_status = True
+            self._record_success()
         except Exception as error:
             logger.error(exception_to_logger(error))
             response = json_str_error("Error in sql query!")
             if trace:
                 print_statusbar([(error, 'd',)])
 
+        self._query_stats(
+            start, len(response) if response_status else 0,
+            error=not response_status
+        )
+
         return response_status, response
 
+    def send_request_iter(self, block_size):
+        query, params, external_tables = self._unpack(self.db_query)
+
+        start = time.time()
+        try:
+            blocks = self.clickhouse_client.execute_iter(
+                query, params, external_tables=external_tables,
+                settings={'max_block_size': block_size},
+                chunk_size=block_size
+            )
+            # errors of query are raised with the first block
+            first_block = next(blocks, None)
+        except Exception as error:
+            logger.error(exception_to_logger(error))
+            self._query_stats(start, 0, error=True)
+            return False, json_str_error("Error in sql query!")
+
+        self._record_success()
+
+        # the rest of result is in the socket until it is read
+        self.rows_pending = True
+
+        def read_blocks():
+            rows = 0
+            try:
+                if first_block is not None:
+                    rows += len(first_block)
+                    yield first_block
+                    for block in blocks:
+                        rows += len(block)
+                        yield block
+                self.rows_pending = False
+                self._query_stats(start, rows)
+            except Exception as error:
+                logger.error(exception_to_logger(error))
+                self._query_stats(start, rows, error=True)
+                # response is aborted, so client doesn't get truncated data
+                # as complete
+                raise
+
+        return True, read_blocks()
+
     def disconnect(self):
-        self.clickhouse_client.disconnect()
+        if self.clickhouse_client is not None:
+            self.pool.release(
+                self.clickhouse_client,
+                discard=self.dirty_session or self.rows_pending
+            )
+            self.clickhouse_client = None
+
+        self.dirty_session = False
+        self.rows_pending = False
         self.connection_status = False
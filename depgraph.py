@@ -0,0 +1,365 @@
+import sys
+import time
+import threading
+from collections import OrderedDict, defaultdict
+
+import utils
+from querymgr import query_manager as QM
+
+logger = utils.get_logger(__name__)
+
+
+class BuildDependencyGraph:
+    """
+    Dependency graph of source packages of repository.
+
+    Source package depends on other source package if it (build requires)
+    or its binary packages (requires) require something that is provided by
+    binary packages of other one. Dependencies are resolved by name of
+    dependency only, debuginfo packages are ignored.
+
+    :param binaries: rows (binary package name, source package name)
+    :param requires: rows (name of package which requires, 1 - source or
+                     0 - binary package, name of binary package which
+                     provides)
+    """
+
+    def __init__(self, binaries, requires):
+        # binary package -> source package
+        self.binary_source = {}
+        # source package -> binary packages
+        self.binaries = defaultdict(list)
+
+        for name, source in binaries:
+            name, source = sys.intern(name), sys.intern(source)
+            self.binary_source[name] = source
+            self.binaries[source].append(name)
+
+        # source package -> source packages, (forward, reverse) pairs
+        # for build requires (source) and requires of binary packages
+        self._src_deps, self._src_rdeps = defaultdict(set), defaultdict(set)
+        self._bin_deps, self._bin_rdeps = defaultdict(set), defaultdict(set)
+        # binary package -> source packages which require it
+        self._required_by = defaultdict(set)
+
+        for pkgname, sourcepackage, provider in requires:
+            provider_source = self.binary_source.get(provider)
+            if provider_source is None:
+                continue
+
+            if sourcepackage:
+                source = sys.intern(pkgname)
+                deps, rdeps = self._src_deps, self._src_rdeps
+            else:
+                source = self.binary_source.get(pkgname)
+                if source is None:
+                    continue
+                deps, rdeps = self._bin_deps, self._bin_rdeps
+
+            deps[source].add(provider_source)
+            rdeps[provider_source].add(source)
+            self._required_by[provider].add(source)
+
+    @staticmethod
+    def _union(source, binary, sets, key):
+        result = set()
+        if source:
+            result.update(sets[0].get(key, ()))
+        if binary:
+            result.update(sets[1].get(key, ()))
+
+        return result
+
+    def requires(self, name, source=True, binary=True):
+        """
+        Source packages which are required by package.
+
+        :param name: name of source package
+        :param source: use build requires of package
+        :param binary: use requires of binary packages of package
+        :return: `set` of names of source packages
+        """
+        return self._union(source, binary,
+                           (self._src_deps, self._bin_deps), name)
+
+    def required_by(self, name, source=True, binary=True):
+        """
+        Source packages which require package.
+
+        :param name: name of source package
+        :param source: use build requires of dependent packages
+        :param binary: use requires of binary packages of dependent packages
+        :return: `set` of names of source packages
+        """
+        return self._union(source, binary,
+                           (self._src_rdeps, self._bin_rdeps), name)
+
+    def required_by_binary(self, name):
+        """
+        Source packages which require binary package (by build requires or
+        requires of their binary packages).
+
+        :param name: name of binary package
+        :return: `set` of names of source packages
+        """
+        if name not in self.binary_source:
+            return set()
+
+        return set(self._required_by.get(name, ()))
+
+    def dependents(self, names, depth=1, source=True, binary=True):
+        """
+        Breadth-first search of source packages which depend on given ones.
+
+        :param names: names of source packages
+        :param depth: maximum length of dependency chain
+        :param source: use build requires of dependent packages
+        :param binary: use requires of binary packages of dependent packages
+        :return: `set` of names of found and given packages
+        """
+        found = set(names)
+        frontier = set(names)
+
+        for _ in range(depth):
+            next_frontier = set()
+            for name in frontier:
+                next_frontier.update(
+                    self.required_by(name, source, binary) - found
+                )
+
+            if not next_frontier:
+                break
+
+            found.update(next_frontier)
+            frontier = next_frontier
+
+        return found
+
+
+class BuildProvidesIndex:
+    """
+    Provides and requires of binary packages of repository by package hash,
+    so closures of build dependencies are searched in memory.
+
+    :param provides: rows (name of dependency, hashes of binary packages
+                     which provide it)
+    :param requires: rows (hash of binary package, names of its requires)
+    """
+
+    def __init__(self, provides, requires):
+        # name of dependency -> binary packages which provide it
+        self.provides = {}
+        for name, hshs in provides:
+            self.provides[sys.intern(name)] = tuple(hshs)
+
+        # binary package -> names of its requires
+        self.requires = {}
+        for hsh, names in requires:
+            self.requires[hsh] = tuple(sys.intern(name) for name in names)
+
+        self.binaries = set(self.requires)
+        for hshs in self.provides.values():
+            self.binaries.update(hshs)
+
+    def resolve(self, names):
+        """
+        Binary packages which provide dependencies.
+
+        :param names: names of dependencies
+        :return: `set` of hashes of binary packages
+        """
+        result = set()
+        for name in names:
+            result.update(self.provides.get(name, ()))
+
+        return result
+
+    def get_requires(self, hshs):
+        """
+        Binary packages which provide requires of binary packages of
+        repository, like `build_dep_set_get_srchsh_for_binary.sql`.
+
+        :param hshs: hashes of binary packages
+        :return: list of (hash, hashes of providing binary packages) of
+                 packages with provided requires
+        """
+        result = []
+        for hsh in hshs:
+            providers = self.resolve(self.requires.get(hsh, ()))
+            if providers:
+                result.append((hsh, tuple(providers)))
+
+        return result
+
+
+class DependencyGraphs:
+    """
+    Dependency graphs of repositories loaded from database on demand.
+
+    Graph is built by branch and set of architectures of binary packages
+    and is kept until the next repository import (change of `generation`)
+    or for `refresh_interval` seconds, so imports are seen without
+    invalidation. Expired graph is served to other requests while one of
+    them reloads it, and is kept if reloading fails.
+    Architectures are limited by `allowed_archs`, so unknown ones don't
+    make new graphs, and only `max_variants` of the least recently used
+    sets of architectures are kept for every branch, so requests for other
+    branches don't evict graphs of branch.
+
+    :param pool: database connection pool
+    :param breaker: database circuit breaker
+    :param generation: shared counter of repository imports
+    :param max_variants: maximum number of kept graphs of branch
+    :param allowed_archs: function which returns known architectures (ex.
+                          of repository catalog), any are used if not set
+    :param refresh_interval: seconds between reloads of graph (0 - graph is
+                             kept until the next import)
+    """
+
+    description = 'Dependency graph'
+    counted = ('binary packages', 'requires')
+
+    def __init__(self, pool, breaker, generation, max_variants=3,
+                 allowed_archs=None, refresh_interval=0):
+        self.pool = pool
+        self.breaker = breaker
+        self.generation = generation
+        self.max_variants = max_variants
+        self.allowed_archs = allowed_archs
+        self.refresh_interval = refresh_interval
+
+        # (generation, branch, archs) -> (graph, time of load)
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = defaultdict(threading.Lock)
+
+    @staticmethod
+    def _queries():
+        return [QM.depgraph_get_binaries, QM.depgraph_get_requires]
+
+    @staticmethod
+    def _build(binaries, requires):
+        return BuildDependencyGraph(binaries, requires)
+
+    def _load(self, branch, archs, client=None):
+        if self.breaker and not self.breaker.allow_request():
+            return None
+
+        start = time.time()
+
+        params = {'branch': branch, 'archs': archs}
+        try:
+            # client of request is used as is, it is released by its owner
+            with self.pool.client(self.breaker, held=client) as client:
+                rows = [client.execute(query, params)
+                        for query in self._queries()]
+        except Exception:
+            # error is logged by the pool
+            return None
+
+        graph = self._build(*rows)
+
+        logger.info(
+            "{} of {} {} built in {:.3f}s: {} {}, {} {}".format(
+                self.description, branch, list(archs), time.time() - start,
+                len(rows[0]), self.counted[0], len(rows[1]), self.counted[1]
+            )
+        )
+
+        return graph
+
+    def get(self, branch, archs, client=None):
+        """
+        Get dependency graph, graph is loaded if it is not ready yet.
+
+        Request which already holds a connection of the pool should pass its
+        client, so it doesn't wait for the second connection of the pool.
+
+        :param branch: name of repository
+        :param archs: architectures of binary packages
+        :param client: database client to load graph with, connection of
+                       the pool is used if not set
+        :return: `BuildDependencyGraph` or `None` if loading failed or
+                 architectures are unknown
+        """
+        archs = set(archs)
+        if self.allowed_archs is not None:
+            archs &= set(self.allowed_archs())
+        if not archs:
+            return None
+
+        key = (self.generation.current(), branch, tuple(sorted(archs)))
+
+        with self._lock:
+            item = self._graphs.get(key)
+            if item is not None:
+                self._graphs.move_to_end(key)
+                if not self._expired(item):
+                    return item[0]
+            load_lock = self._load_locks[key]
+
+        # concurrent requests wait for the same graph instead of loading it,
+        # expired graph is served while it is reloaded
+        if item is not None:
+            if not load_lock.acquire(blocking=False):
+                return item[0]
+        else:
+            load_lock.acquire()
+
+        try:
+            with self._lock:
+                loaded = self._graphs.get(key)
+                if loaded is not None and not self._expired(loaded):
+                    return loaded[0]
+
+            graph = self._load(branch, key[2], client)
+
+            if graph is None:
+                # lock is kept, so waiting and new requests load the graph
+                # one by one, expired graph is better than nothing
+                return item[0] if item is not None else None
+
+            with self._lock:
+                self._graphs[key] = (graph, time.monotonic())
+                self._load_locks.pop(key, None)
+
+                # drop old generations and the least recently used variants
+                # of branch
+                for old_key in list(self._graphs):
+                    if old_key[0] != key[0]:
+                        del self._graphs[old_key]
+                for old_key in list(self._load_locks):
+                    if old_key[0] != key[0]:
+                        del self._load_locks[old_key]
+
+                variants = [old_key for old_key in self._graphs
+                            if old_key[1] == branch]
+                for old_key in variants[:-self.max_variants]:
+                    del self._graphs[old_key]
+        finally:
+            load_lock.release()
+
+        return graph
+
+    def _expired(self, item):
+        return bool(self.refresh_interval) and \
+            time.monotonic() - item[1] > self.refresh_interval
+
+
+class ProvidesIndexes(DependencyGraphs):
+    """
+    Provides indexes of binary packages of repositories for
+    `/build_dependency_set`, loaded and kept like dependency graphs.
+    """
+
+    description = 'Provides index'
+    counted = ('provides', 'binary packages with requires')
+
+    @staticmethod
+    def _queries():
+        return [QM.build_dep_set_get_provides,
+                QM.build_dep_set_get_binary_requires]
+
+    @staticmethod
+    def _build(provides, requires):
+        return BuildProvidesIndex(provides, requires)
@@ -1,8 +1,10 @@
-import rpm
 from flask import g
+from functools import lru_cache
 from collections import defaultdict
 
 import utils
+from querymgr import query_manager as QM
+from libs.rpmvercmp import compare_evr, compare_evr_many
 
 
 class ConflictFilter:
@@ -23,12 +25,12 @@ class ConflictFilter:
     def _get_dict_conflict_provide(self, hshs):
 
         # get conflicts and provides by hash
-        g.connection.request_line = (
+        g.connection.request_line = QM.build(
             "SELECT DISTINCT pkghash, dptype, dpname, dpversion, flag FROM "
-            "Depends WHERE pkghash IN %(hshs)s AND dptype IN "
-            "('conflict', 'provide', 'obsolete')", {
-                'hshs': tuple(hshs), 'branch': self.pbranch, 'arch': self.parch
-            }
+            "Depends WHERE pkghash IN (SELECT hsh FROM pkg_hshs) AND dptype "
+            "IN ('conflict', 'provide', 'obsolete')",
+            {'branch': self.pbranch, 'arch': self.parch},
+            tables={'pkg_hshs': hshs}
         )
 
         status, response = g.connection.send_request()
@@ -40,9 +42,10 @@ class ConflictFilter:
             dptype = 'conflict' if args[0] == 'obsolete' else args[0]
             hsh_dpt_dict[hsh][dptype] += [tuple(args[1:])]
 
-        g.connection.request_line = (
+        g.connection.request_line = QM.build(
             "SELECT pkghash, epoch, version, release, disttag FROM "
-            "Package WHERE pkghash IN %(hshs)s", {'hshs': tuple(hshs)}
+            "Package WHERE pkghash IN (SELECT hsh FROM pkg_hshs)",
+            tables={'pkg_hshs': hshs}
         )
 
         status, response = g.connection.send_request()
@@ -51,7 +54,21 @@ class ConflictFilter:
 
         return hsh_dpt_dict, utils.tuplelist_to_dict(response, 4)
 
-    def _get_conflicts(self, dA, dB, hshA, hshB, hsh_evrd):
+    @staticmethod
+    def _index_provides(provides):
+        """
+        Group provides of package by name.
+
+        :param provides: list of provides (name, version, flag)
+        :return: `dict` name - `list` of provides
+        """
+        index = defaultdict(list)
+        for provd in provides:
+            index[provd[0]].append(provd)
+
+        return index
+
+    def _get_conflicts(self, dA, dB, hshA, hshB, hsh_evrd, provides=None):
         """
         Finds conflicts between two packages.
 
@@ -62,31 +79,40 @@ class ConflictFilter:
         :param dB: dict conflicts/provides package B
         :param hshA: hash package A
         :param hshB: hash package B
+        :param provides: provides of package B indexed by name (see
+                         `_index_provides`), made from `dB` if not set
         :return: `list` of `tuple` (package hash, conflict hash) for package A
         """
+        if provides is None:
+            provides = self._index_provides(dB['provide'])
+
         conflicts = []
+        versioned = []
         for confl in dA['conflict']:
-            for provd in dB['provide']:
-                if confl[0] == provd[0]:
-                    # add conflict in list if conflict without version
-                    if confl[1] == '' or confl[2] == 0:
-                        conflicts.append((hshA, hshB))
-                    else:
-                        # version of provide
-                        vv1 = tuple(hsh_evrd[hshB])
-                        # version of conflict
-                        vv2 = self._split_version(confl[1])
-
-                        # make compare versions
-                        eq = self._compare_version(vv1, vv2)
-
-                        flag = confl[2]
-
-                        # check conflict version flag (>, <, =, >=, <=)
-                        if (eq == -1 and flag & 1 << 1 != 0) or \
-                                (eq == 0 and flag & 1 << 3 != 0) or \
-                                (eq == 1 and flag & 1 << 2 != 0):
-                            conflicts.append((hshA, hshB))
+            for _ in provides.get(confl[0], ()):
+                # add conflict in list if conflict without version
+                if confl[1] == '' or confl[2] == 0:
+                    conflicts.append((hshA, hshB))
+                else:
+                    versioned.append(confl)
+
+        if versioned:
+            # version of provide
+            vv1 = tuple(hsh_evrd[hshB])
+
+            # compare with versions of all conflicts at once
+            eqs = compare_evr_many(
+                vv1, [self._split_version(confl[1]) for confl in versioned]
+            )
+
+            for confl, eq in zip(versioned, eqs):
+                flag = confl[2]
+
+                # check conflict version flag (>, <, =, >=, <=)
+                if (eq == -1 and flag & 1 << 1 != 0) or \
+                        (eq == 0 and flag & 1 << 3 != 0) or \
+                        (eq == 1 and flag & 1 << 2 != 0):
+                    conflicts.append((hshA, hshB))
 
         return conflicts
 
@@ -109,15 +135,21 @@ class ConflictFilter:
         # also (epoch, version, release, disttag)
         hsh_dpt_dict, hsh_evrd = self._get_dict_conflict_provide(uniq_hshs)
 
+        # provides of every package are indexed by name once per request
+        provides = {hsh: self._index_provides(hsh_dpt_dict[hsh]['provide'])
+                    for hsh in uniq_hshs}
+
         conflicts = []
         for hshA, hshB in confl_list:
             # A - conflicts; B - provides
             conflA = self._get_conflicts(
-                hsh_dpt_dict[hshA], hsh_dpt_dict[hshB], hshA, hshB, hsh_evrd
+                hsh_dpt_dict[hshA], hsh_dpt_dict[hshB], hshA, hshB, hsh_evrd,
+                provides[hshB]
             )
             # A - provides; B - conflicts
             conflB = self._get_conflicts(
-                hsh_dpt_dict[hshB], hsh_dpt_dict[hshA], hshB, hshA, hsh_evrd
+                hsh_dpt_dict[hshB], hsh_dpt_dict[hshA], hshB, hshA, hsh_evrd,
+                provides[hshA]
             )
 
             conflicts += utils.remove_duplicate(conflA + conflB)
@@ -125,12 +157,14 @@ class ConflictFilter:
         return conflicts
 
     @staticmethod
+    @lru_cache(maxsize=65536)
     def _split_version(vers):
         """
         Split version of package.
 
         Version of packages may be contains also epoch, release, dist tag.
         It method split the version and returns each item separately.
+        Results are cached, the same versions are met in many packages.
 
         :param vers: version of package (dpversion in datatbase)
         :return: `int`: epoch, `str`: version, `str`: release, `str`: disttag
@@ -169,8 +203,8 @@ class ConflictFilter:
         """
         Compare versions of packages.
 
-        The method compares versions (epoch, version, release, disttag) using
-        the rpm module.
+        The method compares versions (epoch, version, release, disttag) in
+        the same way as rpm library (see `libs.rpmvercmp`).
 
         :param vv1: version of first package
         :param vv2: version of second package
@@ -178,24 +212,4 @@ class ConflictFilter:
                  `1` if the first version is larger
                  `-1` if the first version is less
         """
-        v1 = rpm.hdr()
-        v2 = rpm.hdr()
-
-        v1[rpm.RPMTAG_EPOCH] = vv1[0]
-        v2[rpm.RPMTAG_EPOCH] = vv2[0]
-
-        v1[rpm.RPMTAG_VERSION] = vv1[1]
-        v2[rpm.RPMTAG_VERSION] = vv2[1]
-        if vv1[2]:
-            v1[rpm.RPMTAG_RELEASE] = vv1[2]
-        if vv2[2]:
-            v2[rpm.RPMTAG_RELEASE] = vv2[2]
-
-        # check disttag, if true, add it
-        if vv1[3] != '' and vv2[3]:
-            v1[rpm.RPMTAG_DISTTAG] = vv1[3]
-            v2[rpm.RPMTAG_DISTTAG] = vv2[3]
-
-        eq = rpm.versionCompare(v1, v2)
-
-        return eq
+        return compare_evr(vv1, vv2)
@@ -1,4 +1,5 @@
-from collections import defaultdict
+from array import array
+from collections import deque
 
 
 class Graph:
@@ -6,37 +7,188 @@ class Graph:
     Class for build tree of dependencies.
 
     Class contains methods for build tree of dependencies, make topological
-    sort and auxiliary methods.
+    sort and search of strongly connected components. Vertices are numbers
+    from 0 to `vertices - 1`, adjacency is kept in flat arrays (targets of
+    edges of vertex `v` are `targets[offsets[v]:offsets[v + 1]]`), so large
+    graphs don't need a list object per vertex. Both algorithms are
+    iterative and linear in the size of graph.
 
     :param vertices: number of tree tops
     """
 
     def __init__(self, vertices):
-        self.graph = defaultdict(list)
         self.V = vertices
+        self._sources = array('l')
+        self._targets = array('l')
+        self._offsets = None
+        self._adjacency = None
 
     def add_edge(self, u, v):
-        self.graph[u].append(v)
+        self._sources.append(u)
+        self._targets.append(v)
+        self._offsets = None
 
-    def _topological_sort_util(self, v, visited, stack):
-        visited[v] = True
+    def _build(self):
+        """
+        Group edges by source vertex (counting sort), order of edges of
+        every vertex is kept.
+        """
+        offsets = array('l', [0]) * (self.V + 1)
+        for u in self._sources:
+            offsets[u + 1] += 1
+        for v in range(self.V):
+            offsets[v + 1] += offsets[v]
+
+        position = offsets[:-1]
+        adjacency = array('l', [0]) * len(self._targets)
+        for u, v in zip(self._sources, self._targets):
+            adjacency[position[u]] = v
+            position[u] += 1
+
+        self._offsets, self._adjacency = offsets, adjacency
 
-        for i in self.graph[v]:
-            if visited[i] is False:
-                self._topological_sort_util(i, visited, stack)
+    def neighbours(self, v):
+        if self._offsets is None:
+            self._build()
 
-        stack.insert(0, v)
+        return self._adjacency[self._offsets[v]:self._offsets[v + 1]]
 
     def topological_sort(self):
-        visited = [False] * self.V
+        """
+        Kahn's algorithm. For every edge (u, v) vertex u is placed before
+        vertex v, independent vertices keep their order.
+
+        :return: `list` of sorted vertices, vertices of cycles are not
+                 included
+        """
+        if self._offsets is None:
+            self._build()
+
+        in_degree = array('l', [0]) * self.V
+        for v in self._adjacency:
+            in_degree[v] += 1
+
+        queue = deque(v for v in range(self.V) if not in_degree[v])
         stack = []
 
-        for i in range(self.V):
-            if visited[i] is False:
-                self._topological_sort_util(i, visited, stack)
+        while queue:
+            u = queue.popleft()
+            stack.append(u)
+            for v in self.neighbours(u):
+                in_degree[v] -= 1
+                if not in_degree[v]:
+                    queue.append(v)
 
         return stack
 
+    def depth_first_order(self):
+        """
+        Reverse postorder of depth-first search started from vertices in
+        order of their numbers, edges of vertex are walked in order of
+        addition (the order of the former recursive sort). For every edge
+        (u, v) of acyclic graph vertex u is placed before vertex v.
+
+        :return: `list` of all vertices
+        """
+        if self._offsets is None:
+            self._build()
+
+        offsets, adjacency = self._offsets, self._adjacency
+
+        visited = bytearray(self.V)
+        order = []
+
+        for root in range(self.V):
+            if visited[root]:
+                continue
+
+            # (vertex, position of the next edge)
+            work = [(root, offsets[root])]
+            visited[root] = 1
+
+            while work:
+                v, edge = work[-1]
+
+                if edge < offsets[v + 1]:
+                    work[-1] = (v, edge + 1)
+                    w = adjacency[edge]
+                    if not visited[w]:
+                        visited[w] = 1
+                        work.append((w, offsets[w]))
+                    continue
+
+                work.pop()
+                order.append(v)
+
+        order.reverse()
+
+        return order
+
+    def strongly_connected_components(self):
+        """
+        Tarjan's algorithm without recursion.
+
+        Component is found after all components reachable from it, so for
+        every edge (u, v) component of v is before component of u.
+
+        :return: `list` of components (`list` of vertices)
+        """
+        if self._offsets is None:
+            self._build()
+
+        offsets, adjacency = self._offsets, self._adjacency
+
+        index = array('l', [-1]) * self.V
+        low_link = array('l', [0]) * self.V
+        on_stack = bytearray(self.V)
+        stack, components = [], []
+        counter = 0
+
+        for root in range(self.V):
+            if index[root] != -1:
+                continue
+
+            # (vertex, position of the next edge)
+            work = [(root, offsets[root])]
+            index[root] = low_link[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+
+            while work:
+                v, edge = work[-1]
+
+                if edge < offsets[v + 1]:
+                    work[-1] = (v, edge + 1)
+                    w = adjacency[edge]
+                    if index[w] == -1:
+                        index[w] = low_link[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = 1
+                        work.append((w, offsets[w]))
+                    elif on_stack[w] and index[w] < low_link[v]:
+                        low_link[v] = index[w]
+                    continue
+
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low_link[v] < low_link[u]:
+                        low_link[u] = low_link[v]
+
+                if low_link[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component[::-1])
+
+        return components
+
 
 class SortList:
     """
@@ -71,86 +223,89 @@ class SortList:
             name_to_num[num] = list_[num]
         return num_to_name, name_to_num
 
-    def _search_circle_deps(self):
+    def _make_graph(self, num_to_name):
         """
-        Method search if packages from the list have dependencies on each other.
-
-        :return: `list` of circle dependencies
+        Graph package - dependency, dependencies which are not in the list
+        are skipped.
         """
-        circle_deps = {}
+        g = Graph(len(num_to_name))
+
         for package, reqs in self.package_reqs.items():
-            for dep in reqs:
-                if dep in self.package_reqs:
-                    if package in self.package_reqs[dep] and package != dep:
-                        if package not in circle_deps:
-                            circle_deps[package] = {}
+            for req in reqs:
+                if req in num_to_name and req != package:
+                    g.add_edge(num_to_name[package], num_to_name[req])
 
-                        circle_deps[package][dep] = len(self.package_reqs[dep])
+        return g
+
+    def _circle_deps(self, components, name_to_num):
+        circle_deps = {}
+        for component in components:
+            if len(component) < 2:
+                continue
+
+            # all packages of cycle share the same dict
+            cycle = {
+                name_to_num[dep]: len(self.package_reqs[name_to_num[dep]])
+                for dep in component
+            }
+            for package in component:
+                circle_deps[name_to_num[package]] = cycle
 
         return circle_deps
 
-    def _fill_empty_deps(self):
+    def _search_circle_deps(self):
         """
-        If package no dependencies add None.
+        Method search packages from the list which have cyclic dependencies
+        (strongly connected components of dependency graph).
+
+        :return: `dict` package - `dict` package of its cycle (including
+                 itself) - number of its dependencies
         """
-        for package, reqs in self.package_reqs.items():
-            if not reqs:
-                self.package_reqs[package].append(None)
+        num_to_name, name_to_num = self._numbered_list(
+            list(self.package_reqs.keys())
+        )
+        g = self._make_graph(num_to_name)
+
+        return self._circle_deps(
+            g.strongly_connected_components(), name_to_num
+        )
 
     def sort_list(self):
         """"
         Main public class method.
 
         Sort packages by dependencies add find circle dependencies.
+        Dependencies are placed before packages which require them, packages
+        of the same cycle are placed together. Packages without cycles are
+        sorted in the same order as by the former recursive sort.
 
-        :return: `list` of circle dependencies, `list` of sorted packages
+        :return: `dict` of circle dependencies, `list` of sorted packages
         """
-        # list of packages to sort
-        packages_ls = list(self.package_reqs.keys())
-
-        # get circle dependencies
-        circle_deps = self._search_circle_deps()
-
-        # remove circle dependencies
-        for dep in circle_deps:
-            for pkg in circle_deps[dep]:
-                if circle_deps[dep][pkg] >= circle_deps[pkg][dep]:
-                    self.package_reqs[pkg].remove(dep)
-
-        # reverse (packages <-> dependencies) in dict
-        normalize_req_list = defaultdict(list)
-        for key, val in self.package_reqs.items():
-            for req in val:
-                normalize_req_list[req].append(key)
-
-        self.package_reqs = normalize_req_list
-
-        # number of tree tops
-        num_non_req = len(packages_ls)
-
         # make two dict for convert package names in numbers and back
-        num_to_name, name_to_num = self._numbered_list(packages_ls)
-        # add abstract empty top for packages without dependencies
-        num_to_name[None] = num_non_req
-
-        # add None if package no dependencies
-        self._fill_empty_deps()
-
-        # convert package names in name - deps dict in numbers
-        num_name_reqs = {}
-        for package, reqs in self.package_reqs.items():
-            num_name_reqs[num_to_name[package]] = \
-                [num_to_name[req] for req in reqs]
-
-        g = Graph(num_non_req + 1)
-
-        # add pair pkg name - dependencies in tree tops
-        for key, val in num_name_reqs.items():
-            for vertex in val:
-                g.add_edge(key, vertex)
-
-        # make back convert numbers to names in sorted list
-        sorted_list = [name_to_num[num] for num in g.topological_sort()
-                       if num != num_non_req]
-
-        return circle_deps, sorted_list
+        num_to_name, name_to_num = self._numbered_list(
+            list(self.package_reqs.keys())
+        )
+
+        g = self._make_graph(num_to_name)
+        # components are numbered in order of their first packages, so
+        # graph of components without cycles is the graph of packages
+        components = sorted(g.strongly_connected_components(), key=min)
+
+        component_of = array('l', [0]) * g.V
+        for num, component in enumerate(components):
+            for package in component:
+                component_of[package] = num
+
+        # graph of components, dependency - package which requires it
+        condensed = Graph(len(components))
+        for package in range(g.V):
+            for req in g.neighbours(package):
+                if component_of[req] != component_of[package]:
+                    condensed.add_edge(component_of[req],
+                                       component_of[package])
+
+        sorted_list = [name_to_num[package]
+                       for num in condensed.depth_first_order()
+                       for package in components[num]]
+
+        return self._circle_deps(components, name_to_num), sorted_list
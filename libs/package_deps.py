@@ -1,134 +1,208 @@
+import time
+from collections import defaultdict
+
 from flask import g
 
 import utils
 from querymgr import query_manager as QM
 
+logger = utils.get_logger(__name__)
+
 
 class PackageDependencies:
     """
-    In this class, temporary tables are used to record the results of queries.
-    This is necessary in order to avoid exceeding the limit count of input data
-    in clickhouse database.
+    Hashes of packages are passed to queries as external tables. This is
+    necessary in order to avoid exceeding the limit count of input data
+    in clickhouse database, and every level of dependencies is one query.
     """
 
-    def __init__(self, pbranch):
+    def __init__(self, pbranch, index=None):
         self.pbranch = pbranch
         self.static_archs = ['x86_64', 'noarch']
         self.dep_dict = {}
-        self._tmp_table = 'tmp_pkg_hshs'
-
-    def get_package_dep_set(self, pkgs=None, first=False):
-
-        g.connection.request_line = QM.build_dep_set_get_srchsh_for_binary.format(
-            pkgs=pkgs,
-            branch=self.pbranch,
-            archs=tuple(self.static_archs)
+        # `BuildProvidesIndex` of branch and `static_archs`, requires of
+        # binary packages of repository are resolved without database
+        self.index = index
+
+    def _get_requires(self, hshs):
+        """
+        Binary packages which provide requires of packages.
+
+        :param hshs: hashes of packages
+        :return: status, list of (hash, hashes of providing binaries) or
+                 error message
+        """
+        if self.index is not None:
+            return self._get_requires_by_index(hshs)
+
+        g.connection.request_line = QM.build(
+            QM.build_dep_set_get_srchsh_for_binary,
+            {'branch': self.pbranch, 'archs': tuple(self.static_archs)},
+            tables={'pkg_hshs': hshs}
         )
 
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
+        return g.connection.send_request()
 
-        # FIXME needed optimization
-        tmp_list = []
-        for key, val in response:
-            if first:
-                self.dep_dict[key] = val
-                tmp_list += [hsh for hsh in val if hsh not in tmp_list]
-            else:
-                for pkg, hshs in self.dep_dict.items():
-                    if key in hshs:
-                        uniq_hshs = [l for l in val if l not in self.dep_dict[pkg]]
-                        self.dep_dict[pkg] += tuple(uniq_hshs)
-                        tmp_list += uniq_hshs
-
-        g.connection.request_line = "DROP TABLE IF EXISTS {tmp_tbl}" \
-                                    "".format(tmp_tbl=self._tmp_table)
-
-        status, response = g.connection.send_request()
-        if status is False:
-            pass
+    def _get_requires_by_index(self, hshs):
+        known = [hsh for hsh in hshs if hsh in self.index.binaries]
+        result = self.index.get_requires(known)
 
-        g.connection.request_line = \
-            "CREATE TEMPORARY TABLE {tmp_tbl} (hsh UInt64)".format(
-                tmp_tbl=self._tmp_table
-            )
+        # only input source packages are not in the index
+        unknown = [hsh for hsh in hshs if hsh not in self.index.binaries]
+        if not unknown:
+            return True, result
 
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-        g.connection.request_line = (
-            "INSERT INTO {tmp_tbl} (hsh) VALUES".format(tmp_tbl=self._tmp_table),
-            tuple([(hsh,) for hsh in tmp_list])
+        g.connection.request_line = QM.build(
+            QM.build_dep_set_get_source_requires, tables={'pkg_hshs': unknown}
         )
 
         status, response = g.connection.send_request()
         if status is False:
-            return response
-
-        if not tmp_list:
-            return self.dep_dict
+            return status, response
+
+        for hsh, names in response:
+            providers = self.index.resolve(names)
+            if providers:
+                result.append((hsh, tuple(providers)))
+
+        return True, result
+
+    def _add(self, pkg, hshs):
+        # add hashes and their known dependencies to closure of input
+        # package, hashes with unknown dependencies go to the next level
+        members = self._members[pkg]
+        closure = self.dep_dict[pkg]
+
+        stack = [hshs]
+        while stack:
+            for hsh in stack.pop():
+                if hsh in members:
+                    continue
+
+                members.add(hsh)
+                closure.append(hsh)
+                self._owners[hsh].add(pkg)
+
+                requires = self._requires.get(hsh)
+                if requires is None:
+                    self._frontier.add(hsh)
+                elif requires:
+                    stack.append(requires)
+
+    def get_package_dep_set(self, pkgs):
+        """
+        Build dependencies of source packages: binary packages which provide
+        requires of source package, binary packages which provide their
+        requires and so on.
+
+        Closures of all input packages are built together level by level.
+        Every level is one query for requires of hashes which were not
+        queried yet, `self._owners` (hash - input packages which closure
+        has the hash) adds new dependencies to every closure without search
+        in other closures.
+
+        :param pkgs: hashes of source packages
+        :return: `dict` hash of source package - list of hashes of binary
+                 packages or error message
+        """
+        self.dep_dict = {}
+        # input package - set of hashes of its closure
+        self._members = {}
+        # hash - input packages which closure has the hash
+        self._owners = defaultdict(set)
+        # hash - hashes of binary packages which provide its requires
+        self._requires = {}
+        self._frontier = set(pkgs)
+
+        level = 0
+        while self._frontier:
+            start = time.time()
+            level += 1
+
+            frontier, self._frontier = self._frontier, set()
+            status, response = self._get_requires(frontier)
+            if status is False:
+                return response
+
+            for hsh in frontier:
+                self._requires[hsh] = ()
+            for hsh, requires in response:
+                self._requires[hsh] = tuple(requires)
+
+            if level == 1:
+                for hsh, requires in response:
+                    self.dep_dict[hsh] = []
+                    self._members[hsh] = set()
+                    self._add(hsh, requires)
+            else:
+                for hsh, requires in response:
+                    for pkg in tuple(self._owners[hsh]):
+                        self._add(pkg, requires)
+
+            logger.debug(
+                "Build dependencies level {} in {:.3f}s: {} packages "
+                "queried, {} with requires, {} new".format(
+                    level, time.time() - start, len(frontier),
+                    len(response), len(self._frontier)
+                )
+            )
 
-        return self.get_package_dep_set(
-            pkgs="SELECT hsh FROM {}".format(self._tmp_table)
+        logger.info(
+            "Build dependencies of {} packages in {} levels: {} "
+            "packages".format(len(self.dep_dict), level, len(self._owners))
         )
 
+        return self.dep_dict
+
     @staticmethod
-    def make_result_dict(hsh_list, hsh_dict):
+    def _group_archs(dict_info, hsh_dict):
+        """
+        Packages of closures of input packages, archs of packages with the
+        same name, version and release are merged. Archs merged for closure
+        of one input package are kept for the next ones.
+
+        :param dict_info: `dict` hash - [name, version, release, epoch,
+                          archs]
+        :param hsh_dict: `dict` hash of input package - hashes of closure
+        :return: `dict` name of input package - `dict` number - package
+        """
         fields = ['name', 'version', 'release', 'epoch', 'archs']
 
-        g.connection.request_line = "CREATE TEMPORARY TABLE all_hshs (hsh UInt64)"
+        archs = {hsh: set(info[4]) for hsh, info in dict_info.items()}
 
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-        g.connection.request_line = ("INSERT INTO all_hshs (hsh) VALUES",
-                                     tuple([(hsh,) for hsh in hsh_list]))
-
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-        g.connection.request_line = QM.build_dep_set_get_meta_by_hshs.format(
-            tuple(hsh_list)
-        )
-
-        status, response = g.connection.send_request()
-        if status is False:
-            return response
-
-        dict_info = utils.tuplelist_to_dict(response, 5)
-
-        # FIXME needed optimization (archs)
         result_dict = {}
         for pkg, hshs in hsh_dict.items():
-
-            counter = 0
-            control_list, pkg_req_dict = [], {}
+            groups = defaultdict(list)
             for hsh in hshs:
-                first = dict_info[hsh]
+                groups[tuple(dict_info[hsh][:3])].append(hsh)
 
-                archs = ()
-                for hh in hshs:
-                    second = dict_info[hh]
+            for members in groups.values():
+                merged = set().union(*(archs[hsh] for hsh in members))
+                for hsh in members:
+                    archs[hsh] = merged
 
-                    if first[:3] == second[:3]:
-                        archs += tuple(second[4])
+            control_set, pkg_req_dict = set(), {}
+            for hsh in hshs:
+                row = tuple(dict_info[hsh][:4]) + (tuple(sorted(archs[hsh])),)
+                if row in control_set:
+                    continue
 
-                dict_info[hsh][4] = tuple(set(archs))
+                control_set.add(row)
+                pkg_req_dict[len(pkg_req_dict)] = dict(zip(fields, row))
 
-                if dict_info[hsh] not in control_list:
-                    control_list.append(dict_info[hsh])
+            result_dict[dict_info[pkg][0]] = pkg_req_dict
 
-                    pkg_info_dict = {}
-                    for i in range(len(fields)):
-                        pkg_info_dict[fields[i]] = dict_info[hsh][i]
+        return result_dict
 
-                    pkg_req_dict[counter] = pkg_info_dict
-                    counter += 1
+    @classmethod
+    def make_result_dict(cls, hsh_list, hsh_dict):
+        g.connection.request_line = QM.build(
+            QM.build_dep_set_get_meta_by_hshs,
+            tables={'all_hshs': set(hsh_list)}
+        )
 
-            result_dict[dict_info[pkg][0]] = pkg_req_dict
+        status, response = g.connection.send_request()
+        if status is False:
+            return response
 
-        return result_dict
+        return cls._group_archs(utils.tuplelist_to_dict(response, 5), hsh_dict)
@@ -0,0 +1,123 @@
+import re
+from functools import lru_cache
+
+# alphanumeric segments and tilde/caret separators, other characters only
+# separate segments
+_SEGMENTS = re.compile(r'[0-9]+|[a-zA-Z]+|~|\^')
+
+
+@lru_cache(maxsize=65536)
+def split_version(version):
+    """
+    Split version string to segments. Numeric segments are converted to
+    `int`, so leading zeros are ignored in comparison.
+
+    :param version: version or release string
+    :return: `tuple` of segments
+    """
+    return tuple(int(seg) if seg.isdigit() else seg
+                 for seg in _SEGMENTS.findall(version or ''))
+
+
+def compare_segments(segs1, segs2):
+    """
+    Compare versions split by `split_version` in the same way as
+    `rpmvercmp` of rpm library.
+
+    :return: `0` if versions are identical
+             `1` if the first version is larger
+             `-1` if the first version is less
+    """
+    len1, len2 = len(segs1), len(segs2)
+    i = 0
+
+    while True:
+        seg1 = segs1[i] if i < len1 else None
+        seg2 = segs2[i] if i < len2 else None
+        i += 1
+
+        if seg1 is None and seg2 is None:
+            return 0
+
+        # tilde sorts before everything else, even end of version
+        if seg1 == '~' or seg2 == '~':
+            if seg1 != '~':
+                return 1
+            if seg2 != '~':
+                return -1
+            continue
+
+        # caret sorts after end of version but before everything else
+        if seg1 == '^' or seg2 == '^':
+            if seg1 is None:
+                return -1
+            if seg2 is None:
+                return 1
+            if seg1 != '^':
+                return 1
+            if seg2 != '^':
+                return -1
+            continue
+
+        if seg1 is None:
+            return -1
+        if seg2 is None:
+            return 1
+
+        # numeric segment is newer than alpha one
+        num1, num2 = isinstance(seg1, int), isinstance(seg2, int)
+        if num1 != num2:
+            return 1 if num1 else -1
+
+        if seg1 != seg2:
+            return 1 if seg1 > seg2 else -1
+
+
+def rpmvercmp(version1, version2):
+    """
+    Compare two version (or release) strings like `rpmvercmp` of rpm
+    library.
+    """
+    if version1 == version2:
+        return 0
+
+    return compare_segments(split_version(version1), split_version(version2))
+
+
+def compare_evr(evr1, evr2):
+    """
+    Compare (epoch, version, release, disttag) of two packages.
+
+    Missing epoch is 0. Release is compared only if both versions have it
+    and disttag only if both versions have it.
+
+    :return: `0` if versions are identical
+             `1` if the first version is larger
+             `-1` if the first version is less
+    """
+    epoch1, epoch2 = int(evr1[0] or 0), int(evr2[0] or 0)
+    if epoch1 != epoch2:
+        return 1 if epoch1 > epoch2 else -1
+
+    eq = rpmvercmp(evr1[1], evr2[1])
+    if eq:
+        return eq
+
+    for value1, value2 in zip(evr1[2:4], evr2[2:4]):
+        if value1 and value2:
+            eq = rpmvercmp(value1, value2)
+            if eq:
+                return eq
+
+    return 0
+
+
+def compare_evr_many(evr, evrs):
+    """
+    Compare version with list of versions.
+
+    :param evr: (epoch, version, release, disttag)
+    :param evrs: list of (epoch, version, release, disttag)
+    :return: `list` of results of `compare_evr(evr, item)`
+    """
+    return [compare_evr(evr, item) for item in evrs]
@@ -1,26 +1,90 @@
+import os
+import hmac
 import time
-from flask import request, g
-from urllib.parse import unquote
+import logging
+from flask import request, g, has_request_context
+from urllib.parse import unquote, urlencode
 
 import utils
-from utils import func_time
 from paths import namespace
-from db_connection import DBConnection
+from cache import LRUCache, Generation
+from catalog import RepositoryCatalog
+from profiling import QueryProfiler
+from metrics import Metrics, SERVICE_METRICS
+from depgraph import DependencyGraphs, ProvidesIndexes
+from db_connection import DBConnection, DBConnectionPool, CircuitBreaker, \
+    PoolTimeoutError
 
 logger = utils.get_logger(__name__)
 
+# state of worker process is created at the first use, when options are
+# read by `run_app.start`, not at import of the module
+
+# clients are shared by all requests of worker process
+db_pool = utils.LazyObject(lambda: DBConnectionPool(
+    namespace.DATABASE_HOST, namespace.DATABASE_NAME,
+    namespace.DATABASE_USER, namespace.DATABASE_PASS,
+    size=namespace.DATABASE_POOL_SIZE,
+    timeout=namespace.DATABASE_POOL_TIMEOUT,
+    max_idle=namespace.DATABASE_POOL_MAX_IDLE
+))
+
+# fail fast while database is down instead of blocking the worker
+db_breaker = utils.LazyObject(lambda: CircuitBreaker(
+    failure_threshold=namespace.DATABASE_BREAKER_THRESHOLD,
+    reset_timeout=namespace.DATABASE_BREAKER_TIMEOUT,
+    max_backoff=namespace.TRY_TIMEOUT
+))
+
+# statistics of database queries by endpoint, worker processes share them
+# by snapshot files beside snapshots of metrics
+query_profiler = utils.LazyObject(lambda: QueryProfiler(
+    os.path.join(namespace.CACHE_DIR, 'metrics')
+))
+
+# metrics of service, worker processes share them by snapshot files
+metrics = utils.LazyObject(lambda: Metrics(
+    os.path.join(namespace.CACHE_DIR, 'metrics'),
+    declarations=SERVICE_METRICS
+))
+
+# counter of repository imports, shared by worker processes
+import_generation = utils.LazyObject(lambda: Generation(
+    os.path.join(namespace.CACHE_DIR, '.generation')
+))
+
 
 class LogicServer:
     def __init__(self):
         # make configuration before app start
         self._init()
 
+        # branches, archs and package names from database, the lists are
+        # used until catalog is loaded
+        self.catalog = RepositoryCatalog(
+            db_pool, db_breaker, import_generation,
+            branches=['c8.1', 'p8', 'p7', 'p9', 'Sisyphus', 'c8'],
+            archs=['x86_64', 'noarch', 'x86_64-i586', 'armh', 'arm', 'i586',
+                   'pentium4', 'athlon', 'pentium3', 'i686', 'armv5tel', 'k6',
+                   'aarch64', 'ppc64le', 'e2kv4', 'e2k', 'mipsel'],
+            refresh_interval=namespace.CATALOG_REFRESH
+        )
+
+        # build dependency graphs of repositories
+        self.dep_graphs = DependencyGraphs(
+            db_pool, db_breaker, import_generation,
+            allowed_archs=lambda: self.catalog.archs,
+            refresh_interval=namespace.GRAPH_REFRESH
+        )
+
+        # provides indexes of repositories for build dependencies closures
+        self.provides_indexes = ProvidesIndexes(
+            db_pool, db_breaker, import_generation,
+            allowed_archs=lambda: self.catalog.archs,
+            refresh_interval=namespace.GRAPH_REFRESH
+        )
+
         # base constant values
-        self.known_branches = ['c8.1', 'p8', 'p7', 'p9', 'Sisyphus', 'c8']
-        self.known_archs = ['x86_64', 'noarch', 'x86_64-i586', 'armh', 'arm',
-                            'i586', 'pentium4', 'athlon', 'pentium3', 'i686',
-                            'armv5tel', 'k6', 'aarch64', 'ppc64le', 'e2kv4',
-                            'e2k', 'mipsel']
         self.default_archs = ['x86_64', 'i586', 'aarch64', 'armh', 'ppc64le',
                               'noarch']
         self.package_params = [
@@ -36,6 +100,18 @@ class LogicServer:
             'payloadflags', 'platform',
         ]
 
+        # (branch, name, version, source) of packages found by
+        # `check_input_params`
+        self.known_packages = LRUCache(namespace.VALIDATION_CACHE_SIZE)
+
+    @property
+    def known_branches(self):
+        return self.catalog.branches
+
+    @property
+    def known_archs(self):
+        return self.catalog.archs
+
     # init method, starts before application starts
     @staticmethod
     def _init():
@@ -150,6 +226,7 @@ class LogicServer:
                     'pkgset *': 'branch name (require argument)',
                     'pkgtype': 'type of packages (source, binary, both)',
                     'arch': 'allowed set multiple archs (arch=x86_64,i586)',
+                    'stream': 'send result by blocks (true, default:false)',
                 }
             },
             '/task_info': {
@@ -224,7 +301,7 @@ class LogicServer:
         parchs = self.get_one_value('arch', 's')
         if parchs:
             for arch in parchs.split(','):
-                if arch and arch not in server.known_archs:
+                if arch and arch not in self.known_archs:
                     return utils.json_str_error('Unknown arch of package!')
 
         # check branch
@@ -234,52 +311,93 @@ class LogicServer:
 
         # check package params
         pname = self.get_one_value('name', 's', 'pkg_name')
+        pversion = self.get_one_value('version', 's')
 
-        def check_package():
-            default_req = "SELECT name FROM last_packages"
-            args = "name = %(name)s"
+        pkg_ls = self.get_one_value('pkg_ls', 's', 'pkg_name')
 
-            pversion = self.get_one_value('version', 's')
-            if pversion:
-                args = "{} AND version = %(vers)s".format(args)
+        if pname:
+            pkg_ls = pname
 
-            if pbranch:
-                args = "{} AND assigment_name = %(branch)s".format(args)
+        if pkg_ls:
+            missing = self._missing_packages(
+                pkg_ls.split(','), pversion, pbranch, source
+            )
+            # database error
+            if isinstance(missing, str):
+                return missing
 
-            if source in (0, 1):
-                args = "{} AND sourcepackage = %(source)d".format(args)
+            if missing:
+                message = "Package(s) with input parameters is not in the " \
+                          "repository: {}".format(', '.join(missing))
+                logger.debug(message)
+                return utils.json_str_error(message)
 
-            g.connection.request_line = "{} WHERE {}".format(default_req, args)
+        return True
 
-            g.connection.request_line = (
-                g.connection.request_line,
-                {'name': pname, 'vers': pversion, 'branch': pbranch,
-                 'source': source}
-            )
+    def _missing_packages(self, names, pversion, pbranch, source):
+        """
+        Check the existence of packages by one query.
+
+        Names are checked by catalog if it is loaded and version is not set.
+        Otherwise found packages are kept in the validation cache for a short
+        time, so only unknown names are sent to database.
+
+        :param names: list of package names
+        :param pversion: version of packages
+        :param pbranch: name of repository
+        :param source: check source (1) or binary (0) packages only
+        :return: `list` of names not found in repository or error message
+        """
+        if source in (0, 1):
+            source = int(source)
+        else:
+            source = None
 
-            status, response = g.connection.send_request()
-            if status is False:
-                return response
+        def key(name):
+            return pbranch, name, pversion, source
 
-            if not response:
-                return False
+        names = [name for name in dict.fromkeys(names) if name]
 
-            return True
+        # catalog knows names of packages but not versions
+        if not pversion:
+            missing = self.catalog.missing_packages(names, pbranch, source)
+            if missing is not None:
+                return missing
 
-        pkg_ls = self.get_one_value('pkg_ls', 's', 'pkg_name')
+        unknown = [name for name in names
+                   if self.known_packages.get(key(name)) is None]
 
-        if pname:
-            pkg_ls = pname
+        if not unknown:
+            return []
 
-        if pname or pkg_ls:
-            for pname in pkg_ls.split(','):
-                if not check_package():
-                    message = "Package(s) with input parameters is not in the " \
-                              "repository."
-                    logger.debug(message)
-                    return utils.json_str_error(message)
+        args = "name IN %(names)s"
 
-        return True
+        if pversion:
+            args = "{} AND version = %(vers)s".format(args)
+
+        if pbranch:
+            args = "{} AND assigment_name = %(branch)s".format(args)
+
+        if source is not None:
+            args = "{} AND sourcepackage = %(source)d".format(args)
+
+        g.connection.request_line = (
+            "SELECT DISTINCT name FROM last_packages WHERE {}".format(args),
+            {'names': tuple(unknown), 'vers': pversion, 'branch': pbranch,
+             'source': source}
+        )
+
+        status, response = g.connection.send_request()
+        if status is False:
+            return response
+
+        found = set(utils.join_tuples(response))
+        for name in found:
+            self.known_packages.set(
+                key(name), True, namespace.VALIDATION_CACHE_TTL
+            )
+
+        return [name for name in unknown if name not in found]
 
     # get values of input parameters by structure of parameters
     def get_values_by_params(self, input_params, values_only=False):
@@ -337,7 +455,30 @@ class LogicServer:
 
     @staticmethod
     def url_logging():
-        logger.info(unquote(request.url))
+        # secrets given in url by mistake are not logged
+        args = [(key, value) for key, value in request.args.items(multi=True)
+                if key not in utils.SENSITIVE_PARAMS]
+
+        url = request.base_url
+        if args:
+            url += '?' + urlencode(args)
+
+        logger.info(unquote(url))
+
+    @staticmethod
+    def check_admin_token():
+        if not namespace.ADMIN_TOKEN:
+            return utils.json_str_error('Administrative queries are disabled.')
+
+        # token is passed in header, so it doesn't get to logs with url,
+        # comparison in constant time doesn't reveal matched prefix, bytes
+        # are compared since `str` arguments must be ASCII only
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(),
+                                   namespace.ADMIN_TOKEN.encode()):
+            return utils.json_str_error('Invalid token!')
+
+        return True
 
 
 server = LogicServer()
@@ -347,40 +488,124 @@ class Connection:
 
     def __init__(self, request_line=None):
         self.request_line = request_line
+        self.endpoint = request.path if has_request_context() else None
         self.db_connection = DBConnection(
-            namespace.DATABASE_HOST, namespace.DATABASE_NAME,
-            namespace.DATABASE_USER, namespace.DATABASE_PASS
+            db_pool, db_breaker, on_query=self._record_query
         )
-
-    @func_time(logger)
-    def send_request(self, trace=False):
-        rl = self.request_line
-        if isinstance(rl, tuple):
-            rl = rl[0]
-
-        if bool(rl) is False:
-            return False, 'SQL query not found in query manager.'
-
+        # request got an error from database
+        self.error = False
+        # response is incomplete (ex. external data is not loaded in time)
+        self.partial = False
+        # connection is used by streaming response after the request end
+        self.stream_open = False
+
+    def _record_query(self, stats):
+        query_profiler.record(self.endpoint, stats)
+
+        metrics.inc('altrepo_db_queries_total', template=stats['template'],
+                    status='error' if stats['error'] else 'ok')
+        metrics.observe('altrepo_db_query_duration_seconds',
+                        stats['wall_time'], template=stats['template'])
+
+    def _connect(self):
         status = self.db_connection.connection_status
         if not status:
             for try_ in range(namespace.TRY_CONNECTION_NUMBER):
                 logger.debug(
                     'Attempt to connect to the database #{}'.format(try_)
                 )
+                if try_:
+                    metrics.inc('altrepo_db_connect_retries_total')
 
                 status = self.db_connection.make_connection()
                 if status:
                     break
 
-                time.sleep(namespace.TRY_TIMEOUT)
+                # don't wait for the database if circuit is open or if all
+                # pool connections are busy
+                error = self.db_connection.connection_error
+                if db_breaker.state != db_breaker.CLOSED or \
+                        isinstance(error, PoolTimeoutError):
+                    break
 
-        if status:
+                time.sleep(db_breaker.backoff(try_))
+
+            if not status:
+                metrics.inc('altrepo_db_connect_failures_total')
+
+        return status
+
+    def send_request(self, trace=False):
+        rl = self.request_line
+        if isinstance(rl, tuple):
+            rl = rl[0]
+
+        if bool(rl) is False:
+            return False, 'SQL query not found in query manager.'
+
+        if self._connect():
+            self.db_connection.db_query = self.request_line
+            status, response = self.db_connection.send_request(trace)
+            if status is False:
+                self.error = True
+            return status, response
+        else:
+            self.error = True
+            return False, 'Database connection error.'
+
+    def send_request_iter(self, block_size):
+        """
+        Send request and get result by blocks of rows.
+
+        Connection stays busy until the result is read to the end, so it is
+        not dropped at the end of request, `close_stream` should be called
+        instead.
+
+        :param block_size: number of rows in block
+        :return: status, iterator of lists of rows or error message
+        """
+        if not self.request_line:
+            return False, 'SQL query not found in query manager.'
+
+        if self._connect():
             self.db_connection.db_query = self.request_line
-            return self.db_connection.send_request(trace)
+            status, response = self.db_connection.send_request_iter(
+                block_size
+            )
+            if status is False:
+                self.error = True
+            else:
+                self.stream_open = True
+            return status, response
         else:
+            self.error = True
             return False, 'Database connection error.'
 
+    def held_client(self):
+        """
+        Database client of the pool held by the request, data loaded on
+        demand during the request is read with it instead of the second
+        connection of the pool.
+
+        :return: client or `None` if request is not connected yet
+        """
+        if self.db_connection.connection_status:
+            return self.db_connection.clickhouse_client
+
+        return None
+
+    def close_stream(self):
+        self.stream_open = False
+        self.drop_connection()
+
     def drop_connection(self):
-        if self.db_connection:
+        if self.stream_open:
+            return
+
+        if self.db_connection and self.db_connection.connection_status:
             self.db_connection.disconnect()
-            logger.debug('Connection closed.')
+            # pool state is collected under the lock of pool, skip it on
+            # every request if debug messages are not logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Connection returned to pool. Pool state: {}'
+                             ''.format(db_pool.stats()))
@@ -0,0 +1,320 @@
+import os
+import fcntl
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+import utils
+from snapshots import WorkerSnapshots
+
+logger = utils.get_logger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# (name, type, help) of metrics of service
+SERVICE_METRICS = [
+    ('altrepo_http_requests_total', 'counter',
+     'Requests by route, method and status'),
+    ('altrepo_http_request_duration_seconds', 'histogram',
+     'Request processing time by route'),
+    ('altrepo_http_requests_in_flight', 'gauge',
+     'Requests being processed'),
+    ('altrepo_db_queries_total', 'counter',
+     'Database queries by SQL template and status'),
+    ('altrepo_db_query_duration_seconds', 'histogram',
+     'Database query time by SQL template'),
+    ('altrepo_db_connect_retries_total', 'counter',
+     'Repeated attempts to get database connection'),
+    ('altrepo_db_connect_failures_total', 'counter',
+     'Requests failed to get database connection'),
+    ('altrepo_cache_requests_total', 'counter',
+     'Cache lookups by cache and result (hit, miss, revalidated)'),
+    ('altrepo_external_request_duration_seconds', 'histogram',
+     'Downloads of external task data by status'),
+    ('altrepo_task_fetch_duration_seconds', 'histogram',
+     'Time of loading of all external data of task'),
+    ('altrepo_task_fetch_incomplete_total', 'counter',
+     'Loadings of external task data stopped by deadline'),
+]
+
+
+class Metrics:
+    """
+    Prometheus metrics of service aggregated over gunicorn worker
+    processes.
+
+    Every worker keeps its metrics in memory and writes a snapshot to
+    `<path>/<pid>` by `WorkerSnapshots` (not often than once per
+    `sync_interval` seconds, see `sync` and `start`). `render` merges the
+    memory of current worker with snapshots of other workers: counters and
+    histograms are summed over all processes, including finished ones,
+    gauges only over running processes. Snapshots of finished workers are
+    merged into the common archive file, so restarted workers
+    (`max_requests`) don't leave files behind. Snapshots are json files in
+    the private directory of the user (see `utils.make_private_dir`).
+
+    Metrics are declared before use, undeclared ones are not rendered.
+
+    :param path: directory of worker snapshots
+    :param sync_interval: minimal seconds between snapshots
+    :param declarations: list of (name, type, help) of metrics
+    """
+
+    archive = 'archive'
+
+    def __init__(self, path, sync_interval=1, declarations=()):
+        self.path = path
+        self.sync_interval = sync_interval
+
+        # name -> (type, help, buckets)
+        self.declared = {}
+        for declaration in declarations:
+            self.declare(*declaration)
+
+        self._lock = threading.Lock()
+        self._snapshots = WorkerSnapshots(
+            self.path, lambda: self._encode(self._snapshot()),
+            sync_interval=sync_interval, name='metrics'
+        )
+        self._reset()
+
+        utils.make_private_dir(self.path)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # (name, labels) -> value
+        self._counters = defaultdict(float)
+        self._gauges = defaultdict(float)
+        # (name, labels) -> [count of bucket, ..., count of +Inf, sum]
+        self._histograms = {}
+        self._snapshots.reset()
+
+    def _check_fork(self):
+        # metrics of parent process belong to its own snapshot
+        if self._pid != os.getpid():
+            self._reset()
+
+    def declare(self, name, type_, help_, buckets=DEFAULT_BUCKETS):
+        """
+        :param name: name of metric
+        :param type_: 'counter', 'gauge' or 'histogram'
+        :param help_: description of metric
+        :param buckets: upper bounds of histogram buckets
+        """
+        self.declared[name] = (type_, help_, tuple(buckets))
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._check_fork()
+            self._counters[(name, self._labels(labels))] += value
+            self._snapshots.changed = True
+
+    def add(self, name, value, **labels):
+        """
+        Change value of gauge.
+        """
+        with self._lock:
+            self._check_fork()
+            self._gauges[(name, self._labels(labels))] += value
+            self._snapshots.changed = True
+
+    def observe(self, name, value, **labels):
+        buckets = self.declared[name][2]
+        key = (name, self._labels(labels))
+
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(buckets) + 2)
+
+            histogram[bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+            self._snapshots.changed = True
+
+    def _snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {key: list(value)
+                               for key, value in self._histograms.items()},
+            }
+
+    @staticmethod
+    def _encode(snapshot):
+        # json has no tuple keys: (name, labels) -> [name, labels, value]
+        return {kind: [[name, labels, value]
+                       for (name, labels), value in values.items()]
+                for kind, values in snapshot.items()}
+
+    @staticmethod
+    def _decode(data):
+        return {kind: {(name, tuple(tuple(label) for label in labels)): value
+                       for name, labels, value in data[kind]}
+                for kind in ('counters', 'gauges', 'histograms')}
+
+    def _write(self, name, snapshot):
+        self._snapshots.write(name, self._encode(snapshot))
+
+    def _read(self, name):
+        try:
+            return self._decode(self._snapshots.read(name))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def sync(self, force=False):
+        """
+        Write snapshot of worker metrics, should be called after every
+        request.
+
+        :param force: don't wait for `sync_interval`
+        """
+        self._snapshots.sync(force)
+
+    def start(self):
+        """
+        Start background writing of snapshots in the current process, so
+        counters of idle worker and the last counters of finished worker
+        are not lost. Should be called in every worker process, repeated
+        calls do nothing.
+        """
+        self._snapshots.start()
+
+    def clear(self):
+        """
+        Remove snapshots of all processes, should be called by master
+        process before start of workers.
+        """
+        if not os.path.isdir(self.path):
+            return
+
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                os.remove(entry.path)
+
+    @staticmethod
+    def _merge(total, snapshot, gauges=True):
+        for key, value in snapshot['counters'].items():
+            total['counters'][key] = total['counters'].get(key, 0) + value
+
+        if gauges:
+            for key, value in snapshot['gauges'].items():
+                total['gauges'][key] = total['gauges'].get(key, 0) + value
+
+        for key, value in snapshot['histograms'].items():
+            histogram = total['histograms'].get(key)
+            if histogram is None or len(histogram) != len(value):
+                total['histograms'][key] = list(value)
+            else:
+                total['histograms'][key] = [a + b for a, b in
+                                            zip(histogram, value)]
+
+    @staticmethod
+    def _empty():
+        return {'counters': {}, 'gauges': {}, 'histograms': {}}
+
+    def collect(self):
+        """
+        Metrics of all worker processes.
+
+        :return: `dict` with merged counters, gauges and histograms
+        """
+        total = self._empty()
+        self._merge(total, self._snapshot())
+
+        if not os.path.isdir(self.path):
+            return total
+
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            archive = self._read(self.archive) or self._empty()
+            archived = False
+
+            for pid, name in self._snapshots.others():
+                snapshot = self._read(name)
+                if snapshot is None:
+                    continue
+
+                if utils.process_alive(pid):
+                    self._merge(total, snapshot)
+                else:
+                    self._merge(archive, snapshot, gauges=False)
+                    os.remove(os.path.join(self.path, name))
+                    archived = True
+
+            if archived:
+                self._write(self.archive, archive)
+
+        self._merge(total, archive, gauges=False)
+
+        return total
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+                .replace('\n', '\\n')
+
+        return '{' + ','.join('{}="{}"'.format(key, escape(value))
+                              for key, value in labels) + '}'
+
+    @staticmethod
+    def _format_value(value):
+        if value == int(value):
+            return str(int(value))
+        return repr(value)
+
+    def render(self):
+        """
+        Metrics of all worker processes in Prometheus text format.
+        """
+        total = self.collect()
+
+        samples = defaultdict(list)
+        for kind in ('counters', 'gauges', 'histograms'):
+            for (name, labels), value in total[kind].items():
+                samples[name].append((labels, value))
+
+        lines = []
+        for name in sorted(self.declared):
+            type_, help_, buckets = self.declared[name]
+            lines.append('# HELP {} {}'.format(name, help_))
+            lines.append('# TYPE {} {}'.format(name, type_))
+
+            for labels, value in sorted(samples.get(name, [])):
+                if type_ != 'histogram':
+                    lines.append('{}{} {}'.format(
+                        name, self._format_labels(labels),
+                        self._format_value(value)
+                    ))
+                    continue
+
+                cumulative = 0
+                bounds = [repr(float(b)) for b in buckets] + ['+Inf']
+                for bound, count in zip(bounds, value[:-1]):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(
+                        name, self._format_labels(labels, [('le', bound)]),
+                        cumulative
+                    ))
+                lines.append('{}_sum{} {}'.format(
+                    name, self._format_labels(labels),
+                    self._format_value(value[-1])
+                ))
+                lines.append('{}_count{} {}'.format(
+                    name, self._format_labels(labels), cumulative
+                ))
+
+        return '\n'.join(lines) + '\n'
@@ -8,10 +8,32 @@ class BasePathNamespace:
     PROJECT_NAME = "altrepo_server"
     CONFIG_FILE = "/etc/{}/dbconfig.conf".format(PROJECT_NAME)
     LOG_FILE = "/home/{}/{}.log".format(getpass.getuser(), PROJECT_NAME)
+    # DEBUG, INFO, WARNING or ERROR
+    LOG_LEVEL = 'INFO'
+    # json or text
+    LOG_FORMAT = 'json'
+    # part of DEBUG records which are written to log (0 - 1)
+    LOG_DEBUG_SAMPLE = 1.0
     # application launch parameters
     DEFAULT_HOST = '127.0.0.1'
     DEFAULT_PORT = 5000
     WORKER_PROCESSES = '1'
+    # gunicorn worker model: sync, gthread, gevent or eventlet
+    WORKER_CLASS = 'sync'
+    # threads of gthread worker
+    WORKER_THREADS = 1
+    # simultaneous clients of gevent and eventlet workers
+    WORKER_CONNECTIONS = 1000
+    # worker is restarted after this number of requests (0 - never)
+    MAX_REQUESTS = 0
+    MAX_REQUESTS_JITTER = 0
+    # seconds to wait for requests on keep-alive connection
+    KEEPALIVE = 2
+    BACKLOG = 2048
+    # load application before forking of worker processes
+    PRELOAD_APP = False
+    # branches of dependency graphs loaded by preloading (comma separated)
+    PRELOAD_GRAPHS = ''
     # database parameters
     DATABASE_HOST = ''
     DATABASE_NAME = ''
@@ -19,6 +41,35 @@ class BasePathNamespace:
     TRY_TIMEOUT = 5
     DATABASE_USER = 'default'
     DATABASE_PASS = ''
+    DATABASE_POOL_SIZE = 4
+    DATABASE_POOL_TIMEOUT = 10
+    DATABASE_POOL_MAX_IDLE = 300
+    DATABASE_BREAKER_THRESHOLD = 3
+    DATABASE_BREAKER_TIMEOUT = 5
+    # response cache parameters
+    CACHE_SIZE = 64
+    # private directory of the user (mode 0700), files of shared caches are
+    # loaded by worker processes
+    CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', PROJECT_NAME)
+    CACHE_DISK_SIZE = 0
+    # responses are dropped after import only by `/cache_invalidate`, which
+    # requires ADMIN_TOKEN, otherwise they are stale for up to CACHE_TTL
+    CACHE_TTL = 300
+    VALIDATION_CACHE_SIZE = 4 * 1024 ** 2
+    VALIDATION_CACHE_TTL = 300
+    # seconds between reloads of repository catalog (0 - disabled)
+    CATALOG_REFRESH = 600
+    # seconds between reloads of dependency graphs (0 - until invalidation)
+    GRAPH_REFRESH = 600
+    # number of rows in block of streaming responses
+    STREAM_BLOCK_SIZE = 1000
+    # token for administrative queries (disabled if empty)
+    ADMIN_TOKEN = ''
+    # downloads of external task data (approvals, logs)
+    TASK_FETCH_WORKERS = 16
+    TASK_FETCH_TIMEOUT = 5
+    TASK_FETCH_DEADLINE = 10
+    TASK_CACHE_SIZE = 0
 
 
 namespace = BasePathNamespace()
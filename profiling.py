@@ -0,0 +1,188 @@
+import os
+import threading
+from collections import defaultdict
+
+import utils
+from cache import Generation
+from snapshots import WorkerSnapshots
+
+logger = utils.get_logger(__name__)
+
+
+class QueryProfiler:
+    """
+    Statistics of database queries by endpoint and SQL template.
+
+    Every query is recorded by `DBConnection` as `dict` with template name,
+    wall time of query, time of query on the server, client time (wall
+    time minus server time: receiving and deserialization of result), rows
+    and bytes read by the server and rows of result.
+
+    Statistics are kept by worker process. If `path` is set, every worker
+    writes them to `<path>/queries.<pid>` by `WorkerSnapshots` (not often
+    than once per `sync_interval` seconds, see `sync` and `start`),
+    so `stats` merges statistics of all running workers. Reset of
+    statistics is shared by the counter file `<path>/.queries_reset`.
+
+    :param path: directory of worker snapshots (statistics of current
+                 worker only if not set)
+    :param sync_interval: minimal seconds between snapshots
+    """
+
+    counters = ('rows_read', 'bytes_read', 'result_rows')
+    timers = ('wall_time', 'server_time', 'client_time')
+    def __init__(self, path=None, sync_interval=1):
+        self.path = path
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        # (endpoint, template) -> statistics
+        self._stats = {}
+        self._pid = os.getpid()
+        self._snapshots = WorkerSnapshots(
+            self.path, self._dump, prefix='queries.',
+            sync_interval=sync_interval, name='queries'
+        )
+
+        self._resets = None
+        self._reset = 0
+        if self.path:
+            utils.make_private_dir(self.path)
+            self._resets = Generation(os.path.join(self.path,
+                                                   '.queries_reset'))
+            self._reset = self._resets.current()
+
+    def _empty(self):
+        stats = {'queries': 0, 'errors': 0, 'max_wall_time': 0.0}
+        stats.update({key: 0 for key in self.counters})
+        stats.update({key: 0.0 for key in self.timers})
+
+        return stats
+
+    def _check_state(self):
+        # statistics of parent process and statistics before reset by
+        # other worker are dropped
+        reset = self._resets.current() if self._resets else 0
+        if self._pid != os.getpid() or self._reset != reset:
+            self._pid, self._reset = os.getpid(), reset
+            self._stats = {}
+            self._snapshots.reset()
+
+    def record(self, endpoint, query):
+        """
+        Add query to statistics.
+
+        :param endpoint: path of request
+        :param query: `dict` of query statistics
+        """
+        key = (endpoint, query['template'])
+
+        with self._lock:
+            self._check_state()
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = self._empty()
+
+            stats['queries'] += 1
+            if query['error']:
+                stats['errors'] += 1
+            for field in self.counters + self.timers:
+                stats[field] += query[field]
+            stats['max_wall_time'] = max(stats['max_wall_time'],
+                                         query['wall_time'])
+            self._snapshots.changed = True
+
+    def _items(self):
+        with self._lock:
+            self._check_state()
+            return [(key, dict(stats)) for key, stats in self._stats.items()]
+
+    def _dump(self):
+        items = self._items()
+        return {
+            'reset': self._reset,
+            'stats': [[endpoint, template, stats]
+                      for (endpoint, template), stats in items],
+        }
+
+    def sync(self, force=False):
+        """
+        Write snapshot of worker statistics, should be called after every
+        request.
+
+        :param force: don't wait for `sync_interval`
+        """
+        if self.path:
+            self._snapshots.sync(force)
+
+    def start(self):
+        """
+        Start background writing of snapshots in the current process, so
+        statistics of idle worker are not stale. Should be called in every
+        worker process, repeated calls do nothing.
+        """
+        if self.path:
+            self._snapshots.start()
+
+    def _workers(self):
+        # statistics of other running workers with the current reset
+        for pid, name in self._snapshots.others():
+            if not utils.process_alive(pid):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+                continue
+
+            snapshot = self._snapshots.read(name)
+            try:
+                if snapshot['reset'] != self._reset:
+                    continue
+                items = [((endpoint, template), dict(stats))
+                         for endpoint, template, stats in snapshot['stats']]
+            except (ValueError, KeyError, TypeError):
+                continue
+
+            yield items
+
+    def stats(self):
+        """
+        Statistics of queries of all running workers since the last reset.
+
+        :return: `dict` with number of merged `workers` and `endpoints`:
+                 `dict` endpoint - `dict` template - statistics with totals
+                 and mean wall time
+        """
+        total = dict(self._items())
+        workers = 1
+
+        for items in self._workers() if self.path else ():
+            workers += 1
+            for key, stats in items:
+                merged = total.get(key)
+                if merged is None:
+                    total[key] = stats
+                    continue
+
+                for field in ('queries', 'errors') + self.counters + \
+                        self.timers:
+                    merged[field] += stats.get(field, 0)
+                merged['max_wall_time'] = max(merged['max_wall_time'],
+                                              stats.get('max_wall_time', 0))
+
+        result = defaultdict(dict)
+        for (endpoint, template), stats in sorted(total.items()):
+            stats['mean_wall_time'] = stats['wall_time'] / stats['queries']
+            result[endpoint][template] = stats
+
+        return {'workers': workers, 'endpoints': dict(result)}
+
+    def clear(self):
+        """
+        Clear statistics of all workers.
+        """
+        with self._lock:
+            if self._resets:
+                self._reset = self._resets.bump()
+            self._stats = {}
+            self._snapshots.changed = False
@@ -1,7 +1,36 @@
 import os
+import time
+
+
+class SQLTemplate(str):
+    """
+    Text of SQL template with its name. The name is kept by `format`, so
+    executed queries are profiled by template.
+    """
+
+    def __new__(cls, text, name):
+        template = super().__new__(cls, text)
+        template.name = name
+        return template
+
+    def __getnewargs__(self):
+        return str(self), self.name
+
+    def format(self, *args, **kwargs):
+        return SQLTemplate(super().format(*args, **kwargs), self.name)
 
 
 class QueryManager:
+    """
+    SQL templates from `sql.d` as attributes `<directory>_<file>`.
+
+    Templates are read-only after loading, so the manager is shared by
+    threads and greenlets of worker process.
+    """
+
+    # structure of external tables by name, the other tables are lists of
+    # package hashes
+    table_structures = {'pkg_names': [('name', 'String')]}
 
     def __init__(self):
         self.logger = None
@@ -16,6 +45,34 @@ class QueryManager:
 
         return ''
 
+    @classmethod
+    def build(cls, template, params=None, tables=None):
+        """
+        Request line of `Connection` with parameters bound by database driver
+        instead of formatting of SQL text.
+
+        Lists of package hashes are sent as external tables with column
+        `hsh UInt64` beside the query, so text of query doesn't depend on
+        input data and is not growing with it. Query refers to the table by
+        its name, ex. `pkghash IN (SELECT hsh FROM pkg_hshs)`. Lists of
+        package names are sent as table `pkg_names` with column
+        `name String`.
+
+        :param template: SQL template with `%(name)s` parameters
+        :param params: `dict` of values of parameters
+        :param tables: `dict` name of external table - iterable of hashes
+                       (names for `pkg_names`)
+        :return: (query, params, external tables)
+        """
+        external_tables = [
+            {'name': name,
+             'structure': cls.table_structures.get(name, [('hsh', 'UInt64')]),
+             'data': [(value,) for value in values]}
+            for name, values in (tables or {}).items()
+        ]
+
+        return template, params or {}, external_tables
+
     @staticmethod
     def __find_sql():
         sql_struct = {}
@@ -29,10 +86,22 @@ class QueryManager:
         return sql_struct
 
     def init_manager(self, logger):
-        self.logger = logger
+        start = time.time()
+
+        queries = {}
         for k, v in self.__find_sql().items():
             with open(v, 'r') as fd:
-                setattr(self, k, fd.read())
+                queries[k] = SQLTemplate(fd.read(), k)
+
+        # readers don't lock: templates are added by one `dict.update`
+        # with string keys, which is atomic in CPython, so all templates
+        # appear at once
+        self.logger = logger
+        self.__dict__.update(queries)
+
+        logger.info("SQL templates loaded in {:.3f}s: {} files".format(
+            time.time() - start, len(queries)
+        ))
 
 
 query_manager = QueryManager()
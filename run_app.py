@@ -1,9 +1,138 @@
+import os
 import sys
+import configparser
+
+# plain namespace of options, it doesn't import anything which creates
+# locks or threads
+from paths import namespace
+
+# worker classes of gunicorn and modules which they require
+WORKER_CLASSES = {
+    'sync': None, 'gthread': None, 'gevent': 'gevent', 'eventlet': 'eventlet',
+}
+
+
+def preload_patch_module(argv):
+    """
+    Module of async worker which should patch standard library in master
+    process.
+
+    With preloading the application (its locks, threads of logging and
+    connections) is loaded by master process before fork, so the patching
+    is done before import of other modules, options are taken from command
+    line and config file before they are parsed by `start`. Without
+    preloading gunicorn patches worker processes itself.
+
+    :param argv: command line arguments
+    :return: name of module or `None` if patching is not needed
+    """
+    options = {}
+    for index, arg in enumerate(argv):
+        for key in ('--worker-class', '--config'):
+            if arg == key and index + 1 < len(argv):
+                options[key] = argv[index + 1]
+            elif arg.startswith(key + '='):
+                options[key] = arg.split('=', 1)[1]
+
+    config = configparser.ConfigParser(inline_comment_prefixes="#")
+    try:
+        config.read(options.get('--config', namespace.CONFIG_FILE))
+    except configparser.Error:
+        return None
+
+    application = {}
+    for section in config.sections():
+        if section.lower() == 'application':
+            application = dict(config.items(section))
+
+    worker_class = options.get('--worker-class') or \
+        application.get('worker_class') or namespace.WORKER_CLASS
+    preload = application.get('preload') or namespace.PRELOAD_APP
+
+    if str(preload).strip().lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+
+    return WORKER_CLASSES.get(worker_class.lower())
+
+
+_patch_module = preload_patch_module(sys.argv)
+try:
+    if _patch_module == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    elif _patch_module == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+except ImportError:
+    # missing module is reported by `worker_args`
+    pass
+
+import importlib
 from collections import defaultdict
 from gunicorn.app.wsgiapp import run
 
 import utils
-from paths import namespace
+from metrics import Metrics
+
+
+def worker_args():
+    """
+    Gunicorn options of worker model.
+
+    Async workers patch standard library in worker process after fork,
+    with preloading application the patching is done in master process at
+    import of the module (see `preload_patch_module`).
+
+    :return: `list` of command line options
+    """
+    worker_class = namespace.WORKER_CLASS.lower()
+    if worker_class not in WORKER_CLASSES:
+        utils.print_statusbar([(
+            "Unknown worker class '{}', allowed: {}".format(
+                namespace.WORKER_CLASS, ', '.join(WORKER_CLASSES)
+            ), 'e'
+        )])
+        sys.exit(1)
+
+    module = WORKER_CLASSES[worker_class]
+    if module:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            utils.print_statusbar([(
+                "Worker class '{}' requires module {}".format(
+                    worker_class, module
+                ), 'e'
+            )])
+            sys.exit(1)
+
+    args = [
+        '-w', namespace.WORKER_PROCESSES, '-k', worker_class,
+        '--keep-alive', str(namespace.KEEPALIVE),
+        '--backlog', str(namespace.BACKLOG),
+    ]
+
+    if worker_class == 'gthread':
+        args += ['--threads', str(namespace.WORKER_THREADS)]
+        # every thread holds database connection while it works
+        if namespace.WORKER_THREADS > namespace.DATABASE_POOL_SIZE:
+            utils.print_statusbar([(
+                "Database pool size {} is less than number of threads {}, "
+                "requests will wait for free connection".format(
+                    namespace.DATABASE_POOL_SIZE, namespace.WORKER_THREADS
+                ), 'w'
+            )])
+    elif module:
+        args += ['--worker-connections', str(namespace.WORKER_CONNECTIONS)]
+
+    if namespace.MAX_REQUESTS:
+        args += ['--max-requests', str(namespace.MAX_REQUESTS),
+                 '--max-requests-jitter', str(namespace.MAX_REQUESTS_JITTER)]
+
+    if namespace.PRELOAD_APP:
+        args.append('--preload')
+
+    return args
 
 
 def start():
@@ -11,8 +140,21 @@ def start():
         ('DATABASE_HOST', str), ('DATABASE_NAME', str),
         ('TRY_CONNECTION_NUMBER', int), ('TRY_TIMEOUT', int),
         ('DATABASE_USER', str), ('DATABASE_PASS', str),
+        ('DATABASE_POOL_SIZE', int), ('DATABASE_POOL_TIMEOUT', int),
+        ('DATABASE_POOL_MAX_IDLE', int), ('DATABASE_BREAKER_THRESHOLD', int),
+        ('DATABASE_BREAKER_TIMEOUT', int),
         ('DEFAULT_HOST', str), ('DEFAULT_PORT', int),
-        ('WORKER_PROCESSES', str), ('LOG_FILE', str)
+        ('WORKER_PROCESSES', str), ('WORKER_CLASS', str),
+        ('WORKER_THREADS', int), ('WORKER_CONNECTIONS', int),
+        ('MAX_REQUESTS', int), ('MAX_REQUESTS_JITTER', int), ('KEEPALIVE', int),
+        ('BACKLOG', int), ('PRELOAD_APP', utils.str_to_bool),
+        ('PRELOAD_GRAPHS', str),
+        ('LOG_FILE', str), ('ADMIN_TOKEN', str), ('LOG_LEVEL', str),
+        ('LOG_FORMAT', str), ('LOG_DEBUG_SAMPLE', float),
+        ('CACHE_SIZE', int), ('CACHE_DIR', str), ('CACHE_DISK_SIZE', int),
+        ('CACHE_TTL', int), ('CATALOG_REFRESH', int), ('GRAPH_REFRESH', int),
+        ('TASK_FETCH_WORKERS', int), ('TASK_FETCH_TIMEOUT', float),
+        ('TASK_FETCH_DEADLINE', float), ('TASK_CACHE_SIZE', int)
     ]
 
     pars_args = [
@@ -21,8 +163,12 @@ def start():
         ('--dbhost', str, None, 'database host'),
         ('--dbname', str, None, 'database name'),
         ('--dbuser', str, None, 'database user'),
+        ('--dbpool', int, None, 'database connections per worker process'),
         ('--config', str, namespace.CONFIG_FILE, 'namespace to db config file'),
         ('--prcs', str, None, 'number of worker processes'),
+        ('--worker-class', str, None,
+         'type of worker processes (sync, gthread, gevent, eventlet)'),
+        ('--threads', int, None, 'number of threads of gthread worker'),
         ('--logs', str, None, 'namespace to log files'),
     ]
 
@@ -44,14 +190,48 @@ def start():
                 ('try_numbers', namespace.TRY_CONNECTION_NUMBER),
                 ('try_timeout', namespace.TRY_TIMEOUT),
                 ('user', namespace.DATABASE_USER),
-                ('password', namespace.DATABASE_PASS)
+                ('password', namespace.DATABASE_PASS),
+                ('pool_size', namespace.DATABASE_POOL_SIZE),
+                ('pool_timeout', namespace.DATABASE_POOL_TIMEOUT),
+                ('pool_max_idle', namespace.DATABASE_POOL_MAX_IDLE),
+                ('breaker_threshold', namespace.DATABASE_BREAKER_THRESHOLD),
+                ('breaker_timeout', namespace.DATABASE_BREAKER_TIMEOUT)
             ],
             'application': [
                 ('host', namespace.DEFAULT_HOST),
                 ('port', namespace.DEFAULT_PORT),
-                ('processes', namespace.WORKER_PROCESSES)
+                ('processes', namespace.WORKER_PROCESSES),
+                ('worker_class', namespace.WORKER_CLASS),
+                ('threads', namespace.WORKER_THREADS),
+                ('worker_connections', namespace.WORKER_CONNECTIONS),
+                ('max_requests', namespace.MAX_REQUESTS),
+                ('max_requests_jitter', namespace.MAX_REQUESTS_JITTER),
+                ('keepalive', namespace.KEEPALIVE),
+                ('backlog', namespace.BACKLOG),
+                ('preload', namespace.PRELOAD_APP),
+                ('preload_graphs', namespace.PRELOAD_GRAPHS)
+            ],
+            'other': [
+                ('logfiles', namespace.LOG_FILE),
+                ('admin_token', namespace.ADMIN_TOKEN),
+                ('log_level', namespace.LOG_LEVEL),
+                ('log_format', namespace.LOG_FORMAT),
+                ('log_debug_sample', namespace.LOG_DEBUG_SAMPLE)
             ],
-            'other': [('logfiles', namespace.LOG_FILE)]
+            'cache': [
+                ('size', namespace.CACHE_SIZE),
+                ('dir', namespace.CACHE_DIR),
+                ('disk_size', namespace.CACHE_DISK_SIZE),
+                ('ttl', namespace.CACHE_TTL),
+                ('catalog_refresh', namespace.CATALOG_REFRESH),
+                ('graph_refresh', namespace.GRAPH_REFRESH)
+            ],
+            'external': [
+                ('workers', namespace.TASK_FETCH_WORKERS),
+                ('timeout', namespace.TASK_FETCH_TIMEOUT),
+                ('deadline', namespace.TASK_FETCH_DEADLINE),
+                ('cache_size', namespace.TASK_CACHE_SIZE)
+            ]
         }
 
         val_list = []
@@ -67,7 +247,9 @@ def start():
                 )
 
     parser_keys = [
-        'dbhost', 'dbname', '', '', 'dbuser', '', 'host', 'port', 'prcs', 'logs'
+        'dbhost', 'dbname', '', '', 'dbuser', '', 'dbpool', '', '', '', '',
+        'host', 'port', 'prcs', 'worker_class', 'threads', '', '', '', '', '',
+        '', '', 'logs', '', '', '', '', '', '', '', '', '', '', '', '', '', ''
     ]
 
     for i in range(len(parser_keys)):
@@ -79,10 +261,16 @@ def start():
                     launch_props[i][0], launch_props[i][1](pars_val)
                 )
 
+    # log file and options are known only now
+    utils.setup_logging()
+
     sys.argv = [
         sys.argv[0], '-b', '{}:{:d}'.format(namespace.DEFAULT_HOST,
                                             namespace.DEFAULT_PORT),
-        '-w', namespace.WORKER_PROCESSES, 'app:app'
+        *worker_args(), 'app:app'
     ]
 
+    # metrics of workers of the previous start
+    Metrics(os.path.join(namespace.CACHE_DIR, 'metrics')).clear()
+
     run()
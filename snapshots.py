@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+import utils
+
+logger = utils.get_logger(__name__)
+
+
+class WorkerSnapshots:
+    """
+    Json snapshots of state of worker processes, one file `<prefix><pid>`
+    per process in the private directory of the user (see
+    `utils.make_private_dir`).
+
+    Owner of state sets `changed` on every change and calls `sync` after
+    request: snapshot is written only if state is changed and not often
+    than once per `sync_interval` seconds. `start` runs the background
+    thread of worker which writes changes of idle worker and the last
+    changes at exit. Snapshots of other processes are listed by `others`.
+
+    :param path: directory of snapshots
+    :param dump: function without arguments which returns json serializable
+                 state of the current process
+    :param prefix: prefix of names of snapshot files
+    :param sync_interval: minimal seconds between snapshots (0 - snapshot
+                          is written after every request, without thread)
+    :param name: name of state for thread and log messages
+    """
+
+    def __init__(self, path, dump, prefix='', sync_interval=1,
+                 name='snapshots'):
+        self.path = path
+        self.dump = dump
+        self.prefix = prefix
+        self.sync_interval = sync_interval
+        self.name = name
+        # state is changed after the last snapshot
+        self.changed = False
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._synced = None
+        # process of background thread
+        self._started_pid = None
+
+    def reset(self):
+        """
+        Forget snapshot of the current state, ex. state of parent process
+        which is dropped by forked worker.
+        """
+        self._pid = os.getpid()
+        self._synced = None
+        self.changed = False
+
+    def write(self, name, data):
+        utils.make_private_dir(self.path)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as tmp:
+                json.dump(data, tmp)
+            os.replace(tmp_path, os.path.join(self.path, name))
+        except OSError as error:
+            logger.error("Snapshot of {} write error: {}".format(self.name,
+                                                                 error))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def read(self, name):
+        """
+        :return: data of snapshot or `None` if it is missing or broken
+        """
+        try:
+            with open(os.path.join(self.path, name), 'r') as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+    def sync(self, force=False):
+        """
+        Write snapshot of the current process if state is changed.
+
+        :param force: don't wait for `sync_interval`
+        """
+        now = time.monotonic()
+        if not self.changed or not force and self._synced is not None and \
+                now - self._synced < self.sync_interval:
+            return
+
+        self._synced = now
+        self.changed = False
+        self.write(self.prefix + str(os.getpid()), self.dump())
+
+    def _flush(self):
+        if self.changed and self._pid == os.getpid():
+            self.sync(force=True)
+
+    def start(self):
+        """
+        Start background writing of snapshots in the current process.
+        Should be called in every worker process, repeated calls do nothing.
+        """
+        if not self.sync_interval or self._started_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+
+        utils.run_periodically(self._flush, self.sync_interval, self.name)
+
+    def others(self):
+        """
+        Snapshots of other processes, running and finished.
+
+        :return: iterator of (pid, name of snapshot file)
+        """
+        if not os.path.isdir(self.path):
+            return
+
+        for entry in os.scandir(self.path):
+            pid = entry.name[len(self.prefix):]
+            if entry.name.startswith(self.prefix) and pid.isdigit() and \
+                    int(pid) != os.getpid():
+                yield int(pid), entry.name
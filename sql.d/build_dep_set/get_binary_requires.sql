@@ -0,0 +1,8 @@
+SELECT pkghash,
+       groupUniqArray(dpname)
+FROM last_depends
+WHERE dptype = 'require'
+  AND assigment_name = %(branch)s
+  AND sourcepackage = 0
+  AND arch IN %(archs)s
+GROUP BY pkghash
@@ -1,5 +1,5 @@
 SELECT pkg.pkghash
 FROM last_packages
-WHERE name IN ({pkgs})
-  AND assigment_name = '{branch}'
+WHERE name IN (SELECT name FROM pkg_names)
+  AND assigment_name = %(branch)s
   AND sourcepackage = 1
@@ -0,0 +1,8 @@
+SELECT dpname,
+       groupUniqArray(pkghash)
+FROM last_depends
+WHERE dptype = 'provide'
+  AND assigment_name = %(branch)s
+  AND sourcepackage = 0
+  AND arch IN %(archs)s
+GROUP BY dpname
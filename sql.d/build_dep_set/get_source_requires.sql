@@ -0,0 +1,8 @@
+SELECT pkghash,
+       groupUniqArray(dpname)
+FROM Depends
+WHERE pkghash IN
+    (SELECT hsh
+     FROM pkg_hshs)
+  AND dptype = 'require'
+GROUP BY pkghash
@@ -4,14 +4,16 @@ FROM
   (SELECT pkghash AS srchsh,
           dpname
    FROM Depends
-   WHERE pkghash IN ({pkgs})
+   WHERE pkghash IN
+       (SELECT hsh
+        FROM pkg_hshs)
      AND dptype = 'require') AS sourceDep
 INNER JOIN
   (SELECT pkghash,
           dpname
    FROM last_depends
    WHERE dptype = 'provide'
-     AND assigment_name = '{branch}'
+     AND assigment_name = %(branch)s
      AND sourcepackage = 0
-     AND arch IN ({archs})) AS binaryDeps USING dpname
+     AND arch IN %(archs)s) AS binaryDeps USING dpname
 GROUP BY srchsh
\ No newline at end of file
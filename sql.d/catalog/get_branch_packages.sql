@@ -0,0 +1,7 @@
+SELECT assigment_name,
+       sourcepackage,
+       groupUniqArray(name),
+       groupUniqArray(arch)
+FROM last_packages
+GROUP BY assigment_name,
+         sourcepackage
\ No newline at end of file
@@ -0,0 +1,6 @@
+SELECT DISTINCT name,
+                sourcepkgname
+FROM last_packages_with_source
+WHERE assigment_name = %(branch)s
+  AND arch IN %(archs)s
+  AND name NOT LIKE '%%-debuginfo'
\ No newline at end of file
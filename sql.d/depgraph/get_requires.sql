@@ -0,0 +1,22 @@
+SELECT DISTINCT pkgname,
+                sourcepackage,
+                Prv.pkgname
+FROM
+  (SELECT DISTINCT pkgname,
+                   sourcepackage,
+                   dpname
+   FROM last_depends
+   WHERE assigment_name = %(branch)s
+     AND dptype = 'require'
+     AND (sourcepackage = 1
+          OR arch IN %(archs)s)
+     AND pkgname NOT LIKE '%%-debuginfo') AS Req
+INNER JOIN
+  (SELECT DISTINCT dpname,
+                   pkgname
+   FROM last_depends
+   WHERE assigment_name = %(branch)s
+     AND dptype = 'provide'
+     AND sourcepackage = 0
+     AND arch IN %(archs)s
+     AND pkgname NOT LIKE '%%-debuginfo') AS Prv USING dpname
\ No newline at end of file
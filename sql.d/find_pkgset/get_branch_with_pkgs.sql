@@ -9,7 +9,7 @@ SELECT DISTINCT assigment_name,
                 toString(toDateTime(any(buildtime))) AS buildtime,
                 groupUniqArray(arch)
 FROM last_packages_with_source
-WHERE (sourcepkgname IN %(pkgs)s)
+WHERE (sourcepkgname IN (SELECT name FROM pkg_names))
   AND (name NOT LIKE '%%-debuginfo')
 GROUP BY assigment_name,
          sourcepkgname,
@@ -1,7 +1,7 @@
 SELECT pkghash,
        name
 FROM last_packages
-WHERE name IN %(pkgs)s
+WHERE name IN (SELECT name FROM pkg_names)
   AND assigment_name = %(branch)s
   AND sourcepackage = 0
   AND arch IN %(arch)s
\ No newline at end of file
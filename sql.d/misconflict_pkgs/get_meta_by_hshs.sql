@@ -4,7 +4,7 @@ SELECT name,
        epoch,
        groupUniqArray(arch)
 FROM last_packages
-WHERE name IN %(pkgs)s
+WHERE name IN (SELECT name FROM pkg_names)
   AND assigment_name = %(branch)s
   AND sourcepackage = 0
   AND arch IN %(arch)s
@@ -1,5 +1,7 @@
 SELECT name,
        groupUniqArray(arch)
 FROM Package
-WHERE pkghash IN {hshs}
+WHERE pkghash IN
+    (SELECT hsh
+     FROM pkg_hshs)
 GROUP BY name
\ No newline at end of file
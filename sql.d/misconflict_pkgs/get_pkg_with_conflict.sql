@@ -16,7 +16,7 @@ FROM
          WHERE hashname IN
              (SELECT hashname
               FROM File
-              WHERE pkghash IN %(hshs)s
+              WHERE pkghash IN (SELECT hsh FROM pkg_hshs)
                 AND fileclass != 'directory')
            AND pkghash IN
              (SELECT pkghash
@@ -25,7 +25,7 @@ FROM
                   (SELECT pkghash
                    FROM last_assigments
                    WHERE assigment_name= %(branch)s
-                     AND pkghash NOT IN %(hshs)s )
+                     AND pkghash NOT IN (SELECT hsh FROM pkg_hshs) )
                 AND sourcepackage = 0
                 AND name NOT LIKE '%%-debuginfo'
                 AND arch IN %(arch)s)) AS LeftPkg
@@ -33,7 +33,7 @@ FROM
         (SELECT pkghash,
                 hashname
          FROM File
-         WHERE pkghash IN %(hshs)s) AS InPkg USING hashname
+         WHERE pkghash IN (SELECT hsh FROM pkg_hshs)) AS InPkg USING hashname
       GROUP BY (InPkg.pkghash,
                 pkghash)) AS Sel1
    LEFT JOIN
@@ -1,4 +1,9 @@
-SELECT pkghash{in_}
+SELECT pkghash,
+       filename
 FROM File
-WHERE pkghash IN ({pkghash})
-  AND {param}
+WHERE pkghash IN
+    (SELECT pkg.pkghash
+     FROM last_packages
+     WHERE assigment_name = %(branch)s
+       AND arch IN %(arch)s)
+  AND filename LIKE %(elem)s
@@ -0,0 +1,9 @@
+SELECT pkghash,
+       filename
+FROM File
+WHERE pkghash IN
+    (SELECT pkg.pkghash
+     FROM last_packages
+     WHERE assigment_name = %(branch)s
+       AND arch IN %(arch)s)
+  AND filemd5 = %(elem)s
@@ -7,4 +7,6 @@ SELECT pkghash,
        arch,
        %(branch)s
 FROM Package
-WHERE pkghash IN %(hashs)s
+WHERE pkghash IN
+    (SELECT hsh
+     FROM pkg_hshs)
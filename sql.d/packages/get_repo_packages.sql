@@ -13,10 +13,10 @@ LEFT JOIN
   (SELECT acl_for AS name,
           acl_list
    FROM last_acl
-   WHERE acl_branch = '{branch_l}') AS Acl USING name
-WHERE assigment_name = '{branch}'
-  AND sourcepackage IN {src}
-  AND arch IN {archs}
+   WHERE acl_branch = %(branch_l)s) AS Acl USING name
+WHERE assigment_name = %(branch)s
+  AND sourcepackage IN %(src)s
+  AND arch IN %(archs)s
   AND name NOT LIKE '%%-debuginfo'
 GROUP BY name,
          version,
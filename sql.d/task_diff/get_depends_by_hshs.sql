@@ -8,7 +8,9 @@ INNER JOIN
                    dpname,
                    dptype
    FROM Depends
-   WHERE pkghash IN %(hshs)s
+   WHERE pkghash IN
+       (SELECT hsh
+        FROM pkg_hshs)
      AND dptype IN ('provide',
                     'require',
                     'obsolete',
@@ -3,7 +3,9 @@ FROM last_packages
 WHERE name IN
     (SELECT DISTINCT name
      FROM Package
-     WHERE pkghash IN %(hshs)s
+     WHERE pkghash IN
+         (SELECT hsh
+          FROM pkg_hshs)
        AND name NOT LIKE '%%-debuginfo')
   AND assigment_name IN
     (SELECT branch
@@ -3,13 +3,13 @@ FROM Package
 WHERE pkghash IN
     (SELECT arrayJoin(pkgs)
      FROM Tasks
-     WHERE task_id = {id}
+     WHERE task_id = %(id)s
        AND (try,
             iteration) IN
          (SELECT max(try),
                  argMax(iteration, try)
           FROM Tasks
-          WHERE task_id = {id}))
+          WHERE task_id = %(id)s))
   AND arch IN ('x86_64',
                'x86_64-i586',
                'i586')
\ No newline at end of file
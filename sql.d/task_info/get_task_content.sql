@@ -4,13 +4,13 @@ SELECT sourcepkg_hash,
        concat(toString(try), '.', toString(iteration)) AS ti,
        groupUniqArray(arrayJoin(pkgs))
 FROM Tasks
-WHERE task_id = {id}
+WHERE task_id = %(id)s
   AND (try,
        iteration) IN
     (SELECT max(try),
             argMax(iteration, try)
      FROM Tasks
-     WHERE task_id = {id})
+     WHERE task_id = %(id)s)
 GROUP BY sourcepkg_hash,
          status,
          subtask,
@@ -4,9 +4,9 @@ SELECT sourcepkg_hash,
        concat(toString(try), '.', toString(iteration)) AS ti,
        groupUniqArray(arrayJoin(pkgs))
 FROM Tasks
-WHERE task_id = {id}
+WHERE task_id = %(id)s
   AND (try,
-       iteration) = {ti}
+       iteration) = %(ti)s
 GROUP BY sourcepkg_hash,
          status,
          subtask,
@@ -1,8 +1,6 @@
 SELECT DISTINCT acl_for,
                 groupUniqArray(acl_list)
 FROM last_acl
-WHERE acl_for IN
-    (SELECT pkgname
-     FROM {tmp_table})
+WHERE acl_for IN (SELECT name FROM pkg_names)
   AND acl_branch = %(branch)s
 GROUP BY acl_for
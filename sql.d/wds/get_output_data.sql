@@ -18,9 +18,7 @@ INNER JOIN
           assigment_name,
           buildtime
    FROM last_packages
-   WHERE name IN
-       (SELECT *
-        FROM {tmp_table})
+   WHERE name IN (SELECT name FROM pkg_names)
      AND assigment_name = %(branch)s
      AND sourcepackage = 1) AS SrcPkg USING filename
 WHERE assigment_name = %(branch)s
@@ -0,0 +1,299 @@
+import os
+import re
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import utils
+
+logger = utils.get_logger(__name__)
+
+
+class FetchError(Exception):
+    """
+    Page is not downloaded (connection error, timeout or error status of
+    server) and there is no copy of it in the cache.
+    """
+
+
+class TaskArtifacts:
+    """
+    External data of task: approvals of subtasks, result of beehive check and
+    message from the task events log.
+
+    Pages are downloaded concurrently by the thread pool of worker process
+    with shared keep-alive session. Every download is limited by `timeout`
+    and all downloads of request by `deadline`, pages which are not loaded in
+    time or fail (ex. page can't be decoded or parsed) are empty in the
+    result.
+
+    Downloaded pages are kept in the optional on-disk cache by task, try,
+    iteration and subtask. Pages of finished iterations don't change and
+    are taken from the cache as is, pages of iteration in progress are
+    revalidated by ETag/Last-Modified. Only found (200) and missing (404)
+    pages are cached, other errors are retried by the next request.
+
+    :param git_url: base url of task pages
+    :param beehive_url: base url of beehive check results
+    :param workers: number of parallel downloads
+    :param timeout: timeout of single download (seconds)
+    :param deadline: time limit of all downloads of request (seconds)
+    :param cache: `DiskCache` of pages (not cached if not set)
+    :param metrics: `Metrics` of downloads (not counted if not set)
+    """
+
+    acl_actions = ['approved', 'disapproved']
+    # statuses of tasks which are not changed anymore
+    finished_statuses = ['DONE']
+
+    def __init__(self, git_url='http://git.altlinux.org',
+                 beehive_url='http://bb.ipa.basealt.ru', workers=16,
+                 timeout=5, deadline=10, cache=None, metrics=None):
+        self.git_url = git_url
+        self.beehive_url = beehive_url
+        self.workers = workers
+        self.timeout = timeout
+        self.deadline = deadline
+        self.cache = cache
+        self.metrics = metrics
+
+        self._pid = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self.session = None
+        self.html_parser = utils.HtmlParser(
+            'a', ['Name', 'Last modified', 'Size', 'Description',
+                  'Parent Directory']
+        )
+
+    def _check_fork(self):
+        # threads and sockets are not inherited by forked worker processes
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=2, pool_maxsize=self.workers
+            )
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='task-fetch'
+            )
+            self._pid = os.getpid()
+
+    def _inc(self, name, **labels):
+        if self.metrics is not None:
+            self.metrics.inc(name, **labels)
+
+    def _observe(self, name, value, **labels):
+        if self.metrics is not None:
+            self.metrics.observe(name, value, **labels)
+
+    def _get(self, url, key=None, finished=False):
+        """
+        Download page.
+
+        :param url: url of page
+        :param key: key of page in the cache (not cached if not set)
+        :param finished: page doesn't change anymore
+        :return: content of page or `None` if page is missing (404)
+        :raise FetchError: page is not downloaded and not cached
+        """
+        cached = None
+        if self.cache is not None and key is not None:
+            cached = self.cache.get(key + (url,))
+
+        if cached is not None and finished:
+            self._inc('altrepo_cache_requests_total', cache='task_pages',
+                      result='hit')
+            return cached[2]
+
+        headers = {}
+        if cached is not None:
+            etag, modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if modified:
+                headers['If-Modified-Since'] = modified
+
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, timeout=self.timeout,
+                                        headers=headers)
+        except requests.RequestException as error:
+            self._observe('altrepo_external_request_duration_seconds',
+                          time.monotonic() - start, status='error')
+            return self._failed(url, error, cached)
+
+        self._observe('altrepo_external_request_duration_seconds',
+                      time.monotonic() - start,
+                      status=str(response.status_code))
+
+        if response.status_code == 304 and cached is not None:
+            self._inc('altrepo_cache_requests_total', cache='task_pages',
+                      result='revalidated')
+            return cached[2]
+
+        if self.cache is not None and key is not None:
+            self._inc('altrepo_cache_requests_total', cache='task_pages',
+                      result='miss')
+
+        content = None
+        if response.status_code == 200:
+            content = response.content.decode()
+        elif response.status_code != 404:
+            # server errors, rate limits and denied access are temporary,
+            # they are not cached
+            return self._failed(
+                url, 'status {}'.format(response.status_code), cached
+            )
+
+        # missing pages (404) of finished iterations are cached too
+        if key is not None and self.cache is not None and \
+                (content is not None or finished):
+            self.cache.set(key + (url,), (
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'), content
+            ))
+
+        return content
+
+    @staticmethod
+    def _failed(url, error, cached):
+        # the previous version of page is better than nothing
+        if cached is not None:
+            logger.warning("Failed to load {}, cached page is used: {}"
+                           "".format(url, error))
+            return cached[2]
+
+        raise FetchError("Failed to load {}: {}".format(url, error))
+
+    def acl_message(self, task_id, subtask, action, key=None,
+                    finished=False):
+        """
+        Message of approval or disapproval of subtask.
+
+        :return: `list` (author, message lines) or `''`
+        """
+        url = "{base}/tasks/{task}/acl/{act}/{subtask}/".format(
+            base=self.git_url, task=task_id, subtask=subtask, act=action
+        )
+
+        result = None
+        listing = self._get(url, key, finished)
+        if listing:
+            link = self.html_parser.find_link(listing)
+            if link is not None:
+                result = self._get(os.path.join(url, link), key, finished)
+
+        if not result:
+            return ''
+
+        result = result.split('::')
+        return [result[0].strip()] + \
+            [k.strip() for k in result[1].split('\n')][:-1]
+
+    def beehive_result(self, task_id, key=None, finished=False):
+        result = self._get("{}/RESULT/{}/check-beehive-result.log".format(
+            self.beehive_url, task_id
+        ), key, finished)
+
+        return result or ''
+
+    def task_message(self, task_id, try_iteration, key=None, finished=False):
+        result = self._get("{}/tasks/{}/logs/events.{}.log".format(
+            self.git_url, task_id, try_iteration
+        ), key, finished)
+
+        if result:
+            message = re.findall(r'message:(.*)', result)
+            if message:
+                return message[0].strip()
+
+        return ''
+
+    def fetch(self, task_id, try_iteration, subtasks, finished=False):
+        """
+        Download all external data of task concurrently.
+
+        :param task_id: task id
+        :param try_iteration: try and iteration of task
+        :param subtasks: list of subtask numbers
+        :param finished: iteration of task is finished
+        :return: `dict` subtask - [approved, disapproved], beehive result,
+                 task message, `True` if all downloads are finished in time
+                 without errors
+        """
+        self._check_fork()
+
+        start = time.monotonic()
+        key = ('task', task_id, str(try_iteration))
+
+        futures = {}
+        for subtask in set(subtasks):
+            for action in self.acl_actions:
+                futures[(subtask, action)] = self._executor.submit(
+                    self.acl_message, task_id, subtask, action,
+                    key + (subtask,), finished
+                )
+        futures['beehive'] = self._executor.submit(
+            self.beehive_result, task_id, key, finished
+        )
+        futures['message'] = self._executor.submit(
+            self.task_message, task_id, try_iteration, key, finished
+        )
+
+        _, not_done = wait(futures.values(), timeout=self.deadline)
+        for future in not_done:
+            future.cancel()
+
+        # pages which are not loaded or parsed are empty in the result
+        failed = set()
+
+        def result(key):
+            future = futures[key]
+            if future in not_done:
+                return ''
+            try:
+                return future.result()
+            except FetchError as error:
+                if future not in failed:
+                    failed.add(future)
+                    logger.warning("Task {}: {}".format(task_id, error))
+            except Exception as error:
+                if future not in failed:
+                    failed.add(future)
+                    logger.error("Task {}: failed to load {}: {!r}".format(
+                        task_id, key, error
+                    ))
+            return ''
+
+        approvals = {
+            subtask: [result((subtask, action))
+                      for action in self.acl_actions]
+            for subtask in subtasks
+        }
+        beehive, message = result('beehive'), result('message')
+
+        self._observe('altrepo_task_fetch_duration_seconds',
+                      time.monotonic() - start)
+        if not_done or failed:
+            self._inc('altrepo_task_fetch_incomplete_total')
+        if not_done:
+            logger.warning(
+                "Task {}: {} of {} external downloads are not finished in "
+                "{}s".format(task_id, len(not_done), len(futures),
+                             self.deadline)
+            )
+        logger.debug("Task {}: external data loaded in {:.3f}s".format(
+            task_id, time.monotonic() - start
+        ))
+
+        return approvals, beehive, message, not (not_done or failed)
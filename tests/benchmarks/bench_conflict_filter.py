@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))
+                .replace('/tests/benchmarks', ''))
+
+from libs.conflict_filter import ConflictFilter
+
+try:
+    import rpm
+except ImportError:
+    rpm = None
+
+
+class BenchConflictFilter(ConflictFilter):
+    """
+    Conflict filter with prepared conflicts and provides instead of
+    database.
+    """
+
+    def __init__(self, hsh_dpt_dict, hsh_evrd):
+        super().__init__(None, None)
+        self.data = hsh_dpt_dict, hsh_evrd
+
+    def _get_dict_conflict_provide(self, hshs):
+        return self.data
+
+
+class NestedLoopConflictFilter(BenchConflictFilter):
+    """
+    Previous search of conflicts: every conflict of package A is checked
+    with every provide of package B.
+    """
+
+    def _get_conflicts(self, dA, dB, hshA, hshB, hsh_evrd, provides=None):
+        conflicts = []
+        for confl in dA['conflict']:
+            for provd in dB['provide']:
+                if confl[0] == provd[0]:
+                    if confl[1] == '' or confl[2] == 0:
+                        conflicts.append((hshA, hshB))
+                    else:
+                        vv1 = tuple(hsh_evrd[hshB])
+                        vv2 = self._split_version(confl[1])
+                        eq = self._compare_version(vv1, vv2)
+                        flag = confl[2]
+                        if (eq == -1 and flag & 1 << 1 != 0) or \
+                                (eq == 0 and flag & 1 << 3 != 0) or \
+                                (eq == 1 and flag & 1 << 2 != 0):
+                            conflicts.append((hshA, hshB))
+
+        return conflicts
+
+
+class LegacyConflictFilter(NestedLoopConflictFilter):
+    """
+    Previous search of conflicts with comparison of versions by rpm
+    headers.
+    """
+
+    @staticmethod
+    def _split_version(vers):
+        return ConflictFilter._split_version.__wrapped__(vers)
+
+    @staticmethod
+    def _compare_version(vv1, vv2):
+        v1 = rpm.hdr()
+        v2 = rpm.hdr()
+
+        v1[rpm.RPMTAG_EPOCH] = vv1[0]
+        v2[rpm.RPMTAG_EPOCH] = vv2[0]
+
+        v1[rpm.RPMTAG_VERSION] = vv1[1]
+        v2[rpm.RPMTAG_VERSION] = vv2[1]
+        if vv1[2]:
+            v1[rpm.RPMTAG_RELEASE] = vv1[2]
+        if vv2[2]:
+            v2[rpm.RPMTAG_RELEASE] = vv2[2]
+
+        if vv1[3] != '' and vv2[3]:
+            v1[rpm.RPMTAG_DISTTAG] = vv1[3]
+            v2[rpm.RPMTAG_DISTTAG] = vv2[3]
+
+        return rpm.versionCompare(v1, v2)
+
+
+def make_task(packages, provides, conflicts, pairs):
+    """
+    Packages of task with many provides and versioned conflicts, like
+    kernel headers or glibc.
+    """
+    random.seed(packages)
+    names = ['provide-{}'.format(i) for i in range(packages * provides // 2)]
+
+    hsh_dpt_dict = defaultdict(lambda: defaultdict(list))
+    hsh_evrd = {}
+
+    for hsh in range(packages):
+        version = '{}.{}.{}'.format(
+            random.randint(0, 5), random.randint(0, 20), random.randint(0, 9)
+        )
+        release = 'alt{}'.format(random.randint(1, 3))
+        hsh_evrd[hsh] = [random.randint(0, 1), version, release,
+                         'sisyphus+{}'.format(random.randint(1, 10 ** 5))]
+
+        for name in random.sample(names, provides):
+            hsh_dpt_dict[hsh]['provide'].append(
+                (name, '{}-{}'.format(version, release), 8)
+            )
+
+        for name in random.sample(names, conflicts):
+            conflict_version = '{}:{}.{}-alt{}'.format(
+                random.randint(0, 1), random.randint(0, 5),
+                random.randint(0, 20), random.randint(1, 3)
+            )
+            flag = random.choice([0, 2, 4, 8, 10, 12])
+            hsh_dpt_dict[hsh]['conflict'].append(
+                (name, conflict_version if flag else '', flag)
+            )
+
+    confl_list = [tuple(random.sample(range(packages), 2))
+                  for _ in range(pairs)]
+
+    return confl_list, hsh_dpt_dict, hsh_evrd
+
+
+def measure(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of conflicts filter of /misconflict_packages'
+    )
+    parser.add_argument('--packages', type=int, default=200,
+                        help='number of packages')
+    parser.add_argument('--provides', type=int, default=1000,
+                        help='number of provides of package')
+    parser.add_argument('--conflicts', type=int, default=200,
+                        help='number of conflicts of package')
+    parser.add_argument('--pairs', type=int, default=500,
+                        help='number of pairs of packages')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of repeats')
+    args = parser.parse_args()
+
+    confl_list, hsh_dpt_dict, hsh_evrd = make_task(
+        args.packages, args.provides, args.conflicts, args.pairs
+    )
+
+    current_filter = BenchConflictFilter(hsh_dpt_dict, hsh_evrd)
+    result = current_filter.detect_conflict(confl_list)
+    current = measure(
+        lambda: current_filter.detect_conflict(confl_list), args.repeat
+    )
+
+    print("pairs: {}, conflicts found: {}".format(len(confl_list),
+                                                  len(result)))
+    print("ConflictFilter: {:.3f}s".format(current))
+
+    nested_filter = NestedLoopConflictFilter(hsh_dpt_dict, hsh_evrd)
+    assert sorted(result) == sorted(nested_filter.detect_conflict(confl_list))
+    nested = measure(
+        lambda: nested_filter.detect_conflict(confl_list), args.repeat
+    )
+
+    print("without provides index: {:.3f}s".format(nested))
+    print("speedup: {:.2f}x".format(nested / current))
+
+    if rpm is None:
+        print("legacy ConflictFilter: skipped, rpm module is not installed")
+        return
+
+    legacy_filter = LegacyConflictFilter(hsh_dpt_dict, hsh_evrd)
+    assert sorted(result) == sorted(legacy_filter.detect_conflict(confl_list))
+    legacy = measure(
+        lambda: legacy_filter.detect_conflict(confl_list), args.repeat
+    )
+
+    print("legacy ConflictFilter: {:.3f}s".format(legacy))
+    print("speedup: {:.2f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))
+                .replace('/tests/benchmarks', ''))
+
+from libs.deps_sorting import SortList
+
+
+def legacy_sort_list(package_reqs):
+    # previous implementation of SortList.sort_list: 2-cycles search,
+    # recursive DFS with `stack.insert(0, v)`
+    package_reqs = {key: list(val) for key, val in package_reqs.items()}
+    packages_ls = list(package_reqs.keys())
+
+    circle_deps = {}
+    for package, reqs in package_reqs.items():
+        for dep in reqs:
+            if dep in package_reqs and package in package_reqs[dep] and \
+                    package != dep:
+                circle_deps.setdefault(package, {})[dep] = \
+                    len(package_reqs[dep])
+
+    for dep in circle_deps:
+        for pkg in circle_deps[dep]:
+            if circle_deps[dep][pkg] >= circle_deps[pkg][dep]:
+                package_reqs[pkg].remove(dep)
+
+    normalize_req_list = defaultdict(list)
+    for key, val in package_reqs.items():
+        for req in val:
+            normalize_req_list[req].append(key)
+
+    num_to_name = {name: num for num, name in enumerate(packages_ls)}
+    num_to_name[None] = len(packages_ls)
+    for package in packages_ls:
+        if not normalize_req_list[package]:
+            normalize_req_list[package].append(None)
+
+    graph = defaultdict(list)
+    for package, reqs in normalize_req_list.items():
+        for req in reqs:
+            graph[num_to_name[package]].append(num_to_name[req])
+
+    visited = [False] * (len(packages_ls) + 1)
+    stack = []
+
+    def util(v):
+        visited[v] = True
+        for i in graph[v]:
+            if visited[i] is False:
+                util(i)
+        stack.insert(0, v)
+
+    for i in range(len(packages_ls) + 1):
+        if visited[i] is False:
+            util(i)
+
+    return circle_deps, [packages_ls[num] for num in stack
+                         if num != len(packages_ls)]
+
+
+def make_graph(vertices, degree, cycles):
+    random.seed(vertices)
+    names = ['package-{}'.format(i) for i in range(vertices)]
+
+    package_reqs = {}
+    for i, name in enumerate(names):
+        package_reqs[name] = [
+            names[random.randrange(i)] for _ in range(min(i, degree))
+        ]
+
+    # back edges make cycles
+    for _ in range(cycles):
+        i = random.randrange(vertices - 1)
+        j = random.randrange(i + 1, vertices)
+        package_reqs[names[i]].append(names[j])
+
+    return package_reqs
+
+
+def measure(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run_legacy(package_reqs, repeat):
+    # deep recursion needs a large stack
+    result = []
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * len(package_reqs)))
+    threading.stack_size(512 * 1024 ** 2)
+
+    thread = threading.Thread(target=lambda: result.append(
+        measure(lambda: legacy_sort_list(package_reqs), repeat)
+    ))
+    thread.start()
+    thread.join()
+
+    return result[0] if result else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of sorting of packages by dependencies'
+    )
+    parser.add_argument('--vertices', type=int, default=50000,
+                        help='number of packages')
+    parser.add_argument('--degree', type=int, default=4,
+                        help='number of dependencies of package')
+    parser.add_argument('--cycles', type=int, default=100,
+                        help='number of back edges (cycles)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of repeats')
+    parser.add_argument('--no-legacy', action='store_true',
+                        help="don't run previous implementation")
+    args = parser.parse_args()
+
+    package_reqs = make_graph(args.vertices, args.degree, args.cycles)
+
+    current = measure(
+        lambda: SortList(package_reqs, None).sort_list(), args.repeat
+    )
+    circle, _ = SortList(package_reqs, None).sort_list()
+
+    print("packages: {}, dependencies: {}, packages in cycles: {}".format(
+        len(package_reqs), sum(len(reqs) for reqs in package_reqs.values()),
+        len(circle)
+    ))
+    print("SortList: {:.3f}s".format(current))
+
+    if not args.no_legacy:
+        legacy = run_legacy(package_reqs, args.repeat)
+        print("legacy SortList: {:.3f}s".format(legacy))
+        print("speedup: {:.2f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))
+                .replace('/tests/benchmarks', ''))
+
+import utils
+
+BAD_LIST = ['Name', 'Last modified', 'Size', 'Description',
+            'Parent Directory']
+
+
+def make_listing(entries):
+    # Apache-like directory listing with `entries` files
+    rows = ''.join(
+        '<tr><td><a href="file{0}">file{0}</a></td>'
+        '<td>2020-01-01 00:00</td><td>1K</td></tr>\n'.format(i)
+        for i in range(entries)
+    )
+    return '<html><body><table><tr><th><a href="?C=N">Name</a>' \
+           '</th><th><a href="?C=M">Last modified</a></th></tr>' \
+           '<tr><td><a href="../">Parent Directory</a></td></tr>\n' \
+           '{}</table></body></html>'.format(rows)
+
+
+def legacy_find_link(listing):
+    # previous search of link of utils.HtmlParser.parse_html
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(listing, 'lxml')
+
+    for tag in soup.find_all('a'):
+        if tag.text not in BAD_LIST:
+            return tag.text
+
+
+def measure(function, listing, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(listing)
+    elapsed = time.perf_counter() - start
+
+    return result, repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of search of file in directory listing'
+    )
+    parser.add_argument('--repeat', type=int, default=300,
+                        help='number of searches')
+    parser.add_argument('--entries', type=int, default=1000,
+                        help='number of files in listing')
+    args = parser.parse_args()
+
+    listing = make_listing(args.entries)
+    html_parser = utils.HtmlParser('a', BAD_LIST)
+
+    current_result, current = measure(
+        html_parser.find_link, listing, args.repeat
+    )
+    print("HtmlParser.find_link: {:>10.1f} listings/s".format(current))
+
+    try:
+        legacy_result, legacy = measure(
+            legacy_find_link, listing, args.repeat
+        )
+    except ImportError:
+        print("legacy search: bs4 is not installed")
+    else:
+        assert legacy_result == current_result
+        print("legacy search: {:>10.1f} listings/s".format(legacy))
+        print("speedup: {:.2f}x".format(current / legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import copy
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))
+                .replace('/tests/benchmarks', ''))
+
+from libs.package_deps import PackageDependencies
+
+
+class BenchPackageDependencies(PackageDependencies):
+    """
+    Build dependencies with prepared requires instead of database.
+    """
+
+    def __init__(self, requires):
+        super().__init__('Sisyphus')
+        self.requires = requires
+        self.queries = 0
+
+    def _get_requires(self, hshs):
+        self.queries += 1
+        return True, [(hsh, self.requires[hsh]) for hsh in set(hshs)
+                      if self.requires.get(hsh)]
+
+
+class LegacyPackageDependencies(BenchPackageDependencies):
+    """
+    Previous search of build dependencies: recursion by levels with search
+    of owners of hash in all closures and list membership checks.
+    """
+
+    def get_package_dep_set(self, pkgs=None, first=False):
+        status, response = self._get_requires(pkgs)
+
+        tmp_list = []
+        for key, val in response:
+            if first:
+                self.dep_dict[key] = list(val)
+                tmp_list += [hsh for hsh in val if hsh not in tmp_list]
+            else:
+                for pkg, hshs in self.dep_dict.items():
+                    if key in hshs:
+                        uniq_hshs = [l for l in val
+                                     if l not in self.dep_dict[pkg]]
+                        self.dep_dict[pkg] += tuple(uniq_hshs)
+                        tmp_list += uniq_hshs
+
+        if not tmp_list:
+            return self.dep_dict
+
+        return self.get_package_dep_set(pkgs=tmp_list)
+
+
+def legacy_group_archs(dict_info, hsh_dict):
+    # previous PackageDependencies.make_result_dict without query
+    fields = ['name', 'version', 'release', 'epoch', 'archs']
+
+    result_dict = {}
+    for pkg, hshs in hsh_dict.items():
+
+        counter = 0
+        control_list, pkg_req_dict = [], {}
+        for hsh in hshs:
+            first = dict_info[hsh]
+
+            archs = ()
+            for hh in hshs:
+                second = dict_info[hh]
+
+                if first[:3] == second[:3]:
+                    archs += tuple(second[4])
+
+            dict_info[hsh][4] = tuple(set(archs))
+
+            if dict_info[hsh] not in control_list:
+                control_list.append(dict_info[hsh])
+
+                pkg_info_dict = {}
+                for i in range(len(fields)):
+                    pkg_info_dict[fields[i]] = dict_info[hsh][i]
+
+                pkg_req_dict[counter] = pkg_info_dict
+                counter += 1
+
+        result_dict[dict_info[pkg][0]] = pkg_req_dict
+
+    return result_dict
+
+
+def sort_archs(result_dict):
+    # order of archs of previous implementation is order of set
+    for pkg_req_dict in result_dict.values():
+        for pkg_info_dict in pkg_req_dict.values():
+            pkg_info_dict['archs'] = tuple(sorted(pkg_info_dict['archs']))
+
+    return result_dict
+
+
+def make_metadata(dep_dict, archs):
+    """
+    Metadata of packages of closures: every package is built for several
+    archs, so packages with the same name, version and release are merged.
+    """
+    archs_list = ['x86_64', 'i586', 'noarch', 'aarch64', 'ppc64le']
+    dict_info = {}
+    for pkg in dep_dict:
+        dict_info[pkg] = ['source-{}'.format(pkg), '1.0', 'alt1', 0, ['src']]
+
+    hshs = sorted({hsh for closure in dep_dict.values() for hsh in closure})
+    for hsh in hshs:
+        name = 'package-{}'.format(hsh // archs)
+        dict_info[hsh] = [name, '1.0', 'alt1', 0,
+                          [archs_list[hsh % archs % len(archs_list)]]]
+
+    return dict_info
+
+
+def make_repository(sources, binaries, build_requires, requires):
+    """
+    Source packages with many build requires, like libreoffice, and
+    binary packages of repository with their requires.
+    """
+    random.seed(binaries)
+    hshs = list(range(sources, sources + binaries))
+
+    deps = {}
+    for hsh in range(sources):
+        deps[hsh] = random.sample(hshs, build_requires)
+
+    # requires point to "lower" libraries mostly, so closure is deep
+    for index, hsh in enumerate(hshs):
+        lower = hshs[index + 1:] or hshs
+        deps[hsh] = random.sample(lower, min(len(lower), requires))
+
+    return deps
+
+
+def measure(cls, requires, sources, repeat):
+    best, result, queries = None, None, 0
+    for _ in range(repeat):
+        pkg_deps = cls(requires)
+        start = time.perf_counter()
+        if cls is LegacyPackageDependencies:
+            result = pkg_deps.get_package_dep_set(sources, first=True)
+        else:
+            result = pkg_deps.get_package_dep_set(sources)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        queries = pkg_deps.queries
+
+    return result, best, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of build dependencies closure of '
+                    '/build_dependency_set'
+    )
+    parser.add_argument('--sources', type=int, default=1,
+                        help='number of input source packages')
+    parser.add_argument('--binaries', type=int, default=5000,
+                        help='number of binary packages in repository')
+    parser.add_argument('--build-requires', type=int, default=300,
+                        help='number of build requires of source package')
+    parser.add_argument('--requires', type=int, default=3,
+                        help='number of requires of binary package')
+    parser.add_argument('--archs', type=int, default=3,
+                        help='number of archs of binary package')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of repeats')
+    args = parser.parse_args()
+
+    requires = make_repository(args.sources, args.binaries,
+                               args.build_requires, args.requires)
+    sources = list(range(args.sources))
+
+    result, current, queries = measure(
+        BenchPackageDependencies, requires, sources, args.repeat
+    )
+    closure = sum(len(hshs) for hshs in result.values())
+
+    print("closure: {} packages, {} queries".format(closure, queries))
+    print("PackageDependencies: {:.3f}s".format(current))
+
+    legacy_result, legacy, legacy_queries = measure(
+        LegacyPackageDependencies, requires, sources, args.repeat
+    )
+    assert {pkg: set(hshs) for pkg, hshs in result.items()} == \
+        {pkg: set(hshs) for pkg, hshs in legacy_result.items()}
+
+    print("legacy PackageDependencies: {:.3f}s, {} queries".format(
+        legacy, legacy_queries
+    ))
+    print("speedup: {:.2f}x".format(legacy / current))
+
+    dict_info = make_metadata(result, args.archs)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        grouped = PackageDependencies._group_archs(dict_info, result)
+    current = (time.perf_counter() - start) / args.repeat
+
+    print("result of {} packages: {:.3f}s".format(
+        sum(len(pkgs) for pkgs in grouped.values()), current
+    ))
+
+    legacy_info = copy.deepcopy(dict_info)
+    start = time.perf_counter()
+    legacy_grouped = legacy_group_archs(legacy_info, result)
+    legacy = time.perf_counter() - start
+    assert grouped == sort_archs(legacy_grouped)
+
+    print("legacy result: {:.3f}s".format(legacy))
+    print("speedup: {:.2f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
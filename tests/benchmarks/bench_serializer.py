@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))
+                .replace('/tests/benchmarks', ''))
+
+import utils
+
+
+def legacy_convert_to_json(keys, values, sort=False):
+    # previous implementation of utils.convert_to_json
+    js = {}
+
+    for i in range(len(values)):
+        js[i] = dict([(keys[j], values[i][j])
+                      for j in range(len(values[i]))])
+
+        for key in js[i]:
+            if key == 'date':
+                js[i]['date'] = datetime.datetime.strftime(
+                    js[i]['date'], '%Y-%m-%d %H:%M:%S'
+                )
+
+    return json.dumps(js, sort_keys=sort)
+
+
+def make_rows(count):
+    keys = ['name', 'version', 'release', 'epoch', 'serial_', 'buildtime',
+            'arch', 'date']
+    now = datetime.datetime.now()
+
+    rows = [
+        ('package-{}'.format(i), '{}.{}'.format(i % 10, i % 7),
+         'alt{}'.format(i % 3), 0, i, random.randint(10 ** 9, 2 * 10 ** 9),
+         random.choice(['x86_64', 'i586', 'noarch']),
+         now - datetime.timedelta(seconds=i))
+        for i in range(count)
+    ]
+
+    return keys, rows
+
+
+def measure(function, keys, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(keys, rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return len(rows) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of serialization of database rows to json'
+    )
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='number of rows')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of repeats')
+    args = parser.parse_args()
+
+    keys, rows = make_rows(args.rows)
+
+    assert json.loads(legacy_convert_to_json(keys, rows)) == \
+        json.loads(utils.convert_to_json(keys, rows))
+
+    backend = 'orjson' if utils.orjson else 'json'
+
+    legacy = measure(legacy_convert_to_json, keys, rows, args.repeat)
+    current = measure(utils.convert_to_json, keys, rows, args.repeat)
+
+    print("legacy convert_to_json: {:>12.0f} rows/s".format(legacy))
+    print("RowSerializer ({}): {:>12.0f} rows/s".format(backend, current))
+    print("speedup: {:.2f}x".format(current / legacy))
+
+
+if __name__ == '__main__':
+    main()
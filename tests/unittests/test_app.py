@@ -0,0 +1,85 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import app
+from paths import namespace
+
+
+class TestAdminQueries(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.client = app.app.test_client()
+
+        self.patchers = [
+            patch.object(namespace, 'ADMIN_TOKEN', 'secret-token'),
+            patch('app.response_cache'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        app.response_cache.invalidate.return_value = 2
+
+    def tearDown(self) -> None:
+        for patcher in self.patchers:
+            patcher.stop()
+
+    @staticmethod
+    def logged(logger):
+        return ' '.join(str(call) for call in logger.mock_calls)
+
+    def test_cache_invalidate(self):
+        logger = MagicMock()
+        with patch('logic_server.logger', logger):
+            response = self.client.get(
+                '/cache_invalidate',
+                headers={'X-Admin-Token': 'secret-token'}
+            )
+
+        assert {'generation': 2} == json.loads(response.get_data())
+        assert 'secret-token' not in self.logged(logger)
+
+    def test_cache_invalidate_token_in_url(self):
+        logger = MagicMock()
+        with patch('logic_server.logger', logger):
+            response = self.client.get(
+                '/cache_invalidate?token=secret-token'
+            )
+
+        assert 'Error' in json.loads(response.get_data())
+        app.response_cache.invalidate.assert_not_called()
+        assert '/cache_invalidate' in self.logged(logger)
+        assert 'secret-token' not in self.logged(logger)
+
+    def test_cache_invalidate_wrong_token(self):
+        for token in ('secret', 'secret-token\xff', ''):
+            response = self.client.get(
+                '/cache_invalidate', headers={'X-Admin-Token': token}
+            )
+            assert 'Invalid token!' in response.get_data(as_text=True)
+
+        with patch.object(namespace, 'ADMIN_TOKEN', ''):
+            response = self.client.get('/cache_invalidate',
+                                       headers={'X-Admin-Token': ''})
+        assert 'disabled' in response.get_data(as_text=True)
+        app.response_cache.invalidate.assert_not_called()
+
+    def test_query_stats(self):
+        logger = MagicMock()
+        with patch('logic_server.logger', logger), \
+                patch('app.query_profiler') as profiler:
+            profiler.stats.return_value = {'workers': 2, 'endpoints': {}}
+            response = self.client.get(
+                '/query_stats?reset=true&token=secret-token',
+                headers={'X-Admin-Token': 'secret-token'}
+            )
+
+        assert {'workers': 2, 'endpoints': {}} == \
+            json.loads(response.get_data())
+        profiler.clear.assert_called_once()
+        assert 'reset=true' in self.logged(logger)
+        assert 'secret-token' not in self.logged(logger)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import time
+import pickle
+import unittest
+import tempfile
+from unittest.mock import MagicMock, patch
+from flask import Flask, request
+
+from cache import LRUCache, DiskCache, Generation, ResponseCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_size_limit(self):
+        cache = LRUCache(10)
+
+        cache.set('a', '12345', 60)
+        cache.set('b', '12345', 60)
+        assert '12345' == cache.get('a')
+
+        # 'b' is the least recently used
+        cache.set('c', '123', 60)
+        assert None is cache.get('b')
+        assert '12345' == cache.get('a')
+        assert '123' == cache.get('c')
+        assert 1 == cache.stats()['evictions']
+
+        # too large value is not stored
+        cache.set('d', '12345678901', 60)
+        assert None is cache.get('d')
+
+    def test_ttl(self):
+        cache = LRUCache(100)
+
+        cache.set('a', 'value', 0.01)
+        time.sleep(0.02)
+
+        assert None is cache.get('a')
+        assert 0 == cache.stats()['bytes']
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_set_get(self):
+        cache = DiskCache(self.tmp_dir.name, 1024)
+
+        cache.set(('endpoint', 'key'), ('value', 1), 60)
+        assert ('value', 1) == cache.get(('endpoint', 'key'))
+        # other instance (worker) reads the same data
+        assert ('value', 1) == DiskCache(self.tmp_dir.name, 1024).get(
+            ('endpoint', 'key')
+        )
+
+        cache.set('expired', 'value', -1)
+        assert None is cache.get('expired')
+
+    def test_eviction(self):
+        cache = DiskCache(self.tmp_dir.name, 600)
+
+        cache.set('old', 'x' * 200)
+        old_time = time.time() - 100
+        os.utime(cache._file('old'), (old_time, old_time))
+
+        cache.set('new_1', 'x' * 200)
+        cache.set('new_2', 'x' * 200)
+
+        assert None is cache.get('old')
+        assert 'x' * 200 == cache.get('new_2')
+
+    def test_not_pickle(self):
+        cache = DiskCache(self.tmp_dir.name, 1024)
+
+        # file in pickle format isn't loaded
+        with open(cache._file('key'), 'wb') as fd:
+            pickle.dump((None, 'value'), fd)
+        assert None is cache.get('key')
+
+        # only plain values are cached
+        cache.set('key', object())
+        assert None is cache.get('key')
+
+    def test_private_dir(self):
+        path = os.path.join(self.tmp_dir.name, 'cache', 'tasks')
+        DiskCache(path, 1024)
+
+        assert 0o700 == os.stat(path).st_mode & 0o777
+        assert 0o700 == os.stat(os.path.dirname(path)).st_mode & 0o777
+
+        # directory writable by others is not used
+        os.chmod(path, 0o777)
+        with self.assertRaises(PermissionError):
+            DiskCache(path, 1024)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+
+        generation = Generation(os.path.join(self.tmp_dir.name, '.generation'))
+        self.cache = ResponseCache(
+            lambda params: {p[0]: request.args.get(p[0]) for p in params},
+            generation, 1024
+        )
+
+        self.calls = 0
+
+        @self.cache.cached([('name', 's')])
+        def view():
+            self.calls += 1
+            return '{"name": "%s"}' % request.args.get('name')
+
+        self.view = view
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_cached(self):
+        with patch('cache.g', MagicMock(connection=None)):
+            with self.app.test_request_context('/?name=glibc&other=1'):
+                assert '{"name": "glibc"}' == self.view()
+            with self.app.test_request_context('/?other=2&name=glibc'):
+                assert '{"name": "glibc"}' == self.view()
+            with self.app.test_request_context('/?name=perl'):
+                assert '{"name": "perl"}' == self.view()
+
+        assert 2 == self.calls
+
+    def test_unknown_args(self):
+        with patch('cache.g', MagicMock(connection=None)):
+            with self.app.test_request_context('/'):
+                self.view()
+            with self.app.test_request_context('/?other=1'):
+                self.view()
+            with self.app.test_request_context('/?name='):
+                self.view()
+
+        assert 3 == self.calls
+
+    def test_on_hit(self):
+        self.cache.on_hit = MagicMock()
+
+        with patch('cache.g', MagicMock(connection=None)):
+            with self.app.test_request_context('/?name=glibc'):
+                self.view()
+                self.cache.on_hit.assert_not_called()
+                self.view()
+
+        self.cache.on_hit.assert_called_once_with()
+
+    def test_invalidate(self):
+        with patch('cache.g', MagicMock(connection=None)):
+            with self.app.test_request_context('/?name=glibc'):
+                self.view()
+                self.cache.invalidate()
+                self.view()
+
+        assert 2 == self.calls
+
+    def test_errors_not_cached(self):
+        with patch('cache.g', MagicMock(connection=MagicMock(error=True))):
+            with self.app.test_request_context('/?name=glibc'):
+                self.view()
+                self.view()
+
+        assert 2 == self.calls
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+from catalog import RepositoryCatalog
+from db_connection import DBConnectionPool, PoolTimeoutError
+
+
+class TestRepositoryCatalog(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.client = MagicMock()
+        self.client.execute.return_value = [
+            ('p9', 1, ['glibc', 'perl'], ['x86_64', 'i586']),
+            ('p9', 0, ['glibc-core', 'perl-base'], ['x86_64', 'noarch']),
+            ('p10', 1, ['glibc', 'python3'], ['aarch64']),
+        ]
+
+        self.pool = MagicMock()
+        self.pool.acquire.return_value = self.client
+        self.pool.client = partial(DBConnectionPool.client, self.pool)
+
+        self.generation = MagicMock()
+        self.generation.current.return_value = 0
+
+        self.catalog = RepositoryCatalog(
+            self.pool, None, self.generation, ['p8'], ['x86_64']
+        )
+
+        self.patcher = patch('catalog.QM')
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+    def test_defaults(self):
+        assert frozenset(['p8']) == self.catalog.branches
+        assert None is self.catalog.missing_packages(['glibc'])
+
+    def test_load(self):
+        assert True is self.catalog.load()
+        self.pool.release.assert_called_once_with(self.client)
+
+        assert frozenset(['p9', 'p10']) == self.catalog.branches
+        assert frozenset(['x86_64', 'i586', 'noarch', 'aarch64']) == \
+            self.catalog.archs
+
+    def test_load_error(self):
+        self.client.execute.side_effect = ConnectionError('refused')
+        self.catalog.breaker = MagicMock()
+
+        assert False is self.catalog.load()
+        assert frozenset(['p8']) == self.catalog.branches
+        self.pool.release.assert_called_once_with(self.client, discard=True)
+        self.catalog.breaker.record_failure.assert_called_once()
+
+    def test_load_breaker(self):
+        self.catalog.breaker = MagicMock()
+
+        assert True is self.catalog.load()
+        self.catalog.breaker.record_success.assert_called_once()
+
+        # all connections are busy, database is not failed
+        self.pool.acquire.side_effect = PoolTimeoutError('busy')
+        assert False is self.catalog.load()
+        self.catalog.breaker.record_failure.assert_not_called()
+
+    def test_missing_packages(self):
+        self.catalog.load()
+
+        assert [] == self.catalog.missing_packages(['glibc', 'perl'], 'p9', 1)
+        assert ['perl'] == self.catalog.missing_packages(
+            ['python3', 'perl'], 'p10', 1
+        )
+        assert ['glibc'] == self.catalog.missing_packages(['glibc'], 'p9', 0)
+        assert [] == self.catalog.missing_packages(['glibc-core', 'python3'])
+
+    def test_preloaded(self):
+        self.catalog.load()
+        self.client.execute.reset_mock()
+
+        # worker process doesn't load catalog preloaded by master process
+        with patch('catalog.time.sleep', side_effect=StopIteration):
+            with self.assertRaises(StopIteration):
+                self.catalog._run()
+        self.client.execute.assert_not_called()
+
+        # expired catalog is loaded again
+        self.catalog._loaded_at -= self.catalog.refresh_interval + 1
+        with patch('catalog.time.sleep', side_effect=StopIteration):
+            with self.assertRaises(StopIteration):
+                self.catalog._run()
+        self.client.execute.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import MagicMock, patch
 
 from libs.conflict_filter import ConflictFilter
 
@@ -47,6 +48,52 @@ class TestConflictFilter(unittest.TestCase):
         assert [(17830059475705751619, 8505303502925891219)] == \
                self.cf._get_conflicts(dA, dB, hshA, hshB, hsh_evrd)
 
+    def test_detect_conflict(self):
+        hsh_dpt_dict = {
+            1: {'conflict': [('perl', '1:5.30-alt1', 2)],
+                'provide': [('glibc', '', 0)]},
+            2: {'conflict': [], 'provide': [('perl', '', 0), ('perl', '', 0)]},
+            3: {'conflict': [('glibc', '', 0)], 'provide': []},
+        }
+        hsh_evrd = {1: [0, '2.32', 'alt1', None],
+                    2: [1, '5.28', 'alt1', None],
+                    3: [0, '1.0', 'alt1', None]}
+
+        with patch.object(ConflictFilter, '_get_dict_conflict_provide',
+                          return_value=(hsh_dpt_dict, hsh_evrd)):
+            assert [(1, 2), (3, 1)] == self.cf.detect_conflict(
+                [(1, 2), (1, 3), (2, 3)]
+            )
+
+        assert {'perl': [('perl', '', 0), ('perl', '', 0)]} == \
+            self.cf._index_provides(hsh_dpt_dict[2]['provide'])
+
+    def test_get_dict_conflict_provide(self):
+        g = MagicMock()
+        requests = []
+        responses = iter([(True, [(1, 'obsolete', 'perl', '', 0)]),
+                          (True, [(1, 0, '5.30', 'alt1', '')])])
+
+        def send_request():
+            requests.append(g.connection.request_line)
+            return next(responses)
+
+        g.connection.send_request.side_effect = send_request
+
+        with patch('libs.conflict_filter.g', g):
+            hsh_dpt_dict, hsh_evrd = self.cf._get_dict_conflict_provide(
+                [1, 2]
+            )
+
+        assert [('perl', '', 0)] == hsh_dpt_dict[1]['conflict']
+        assert {1: [0, '5.30', 'alt1', '']} == hsh_evrd
+
+        # hashes are sent in external table, not in text of queries
+        for query, _, tables in requests:
+            assert '(SELECT hsh FROM pkg_hshs)' in query
+            assert 'pkg_hshs' == tables[0]['name']
+            assert [(1,), (2,)] == tables[0]['data']
+
     def test_split_version(self):
         assert (0, '6.04.pre3', 'alt2', 'sisyphus+240957.100.1.1') == \
                (self.cf._split_version('6.04.pre3-alt2:sisyphus+240957.100.1.1'))
@@ -0,0 +1,308 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from db_connection import DBConnectionPool, DBConnection, PoolTimeoutError, \
+    CircuitBreaker
+from querymgr import SQLTemplate, query_manager as QM
+
+
+class TestDBConnectionPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('db_connection.Client', side_effect=MagicMock)
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+    def test_acquire_release(self):
+        pool = DBConnectionPool(size=2)
+
+        client = pool.acquire()
+        client.connection.connect.assert_called_once()
+        assert 1 == pool.stats()['in_use']
+
+        pool.release(client)
+        assert client is pool.acquire()
+        assert 1 == pool.stats()['created']
+        assert 2 == pool.stats()['checkouts']
+
+    def test_pool_bounded(self):
+        pool = DBConnectionPool(size=1, timeout=0.1)
+
+        pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire()
+
+        assert 1 == pool.stats()['timeouts']
+
+    def test_reconnect_broken_client(self):
+        pool = DBConnectionPool(size=1)
+
+        client = pool.acquire()
+        pool.release(client)
+        client.connection.connected = False
+
+        assert client is pool.acquire()
+        assert 1 == pool.stats()['reconnects']
+
+    def test_discard(self):
+        pool = DBConnectionPool(size=1)
+
+        client = pool.acquire()
+        pool.release(client, discard=True)
+        client.disconnect.assert_called_once()
+
+        assert client is not pool.acquire()
+        assert 1 == pool.stats()['discarded']
+
+    def test_client(self):
+        pool = DBConnectionPool(size=1)
+        breaker = MagicMock()
+
+        with pool.client(breaker) as client:
+            assert 1 == pool.stats()['in_use']
+        assert 0 == pool.stats()['in_use']
+        breaker.record_success.assert_called_once()
+
+        # client of failed block may have unread rows in the socket
+        with self.assertRaises(ValueError):
+            with pool.client(breaker) as client:
+                raise ValueError('Code: 241. Memory limit exceeded')
+        client.disconnect.assert_called_once()
+        assert 0 == pool.stats()['open']
+        breaker.record_failure.assert_called_once()
+
+        # client held by the caller is not released
+        held = pool.acquire()
+        with pool.client(breaker, held=held) as client:
+            assert held is client
+        assert 1 == pool.stats()['in_use']
+
+        # busy pool isn't failure of database
+        pool.timeout = 0.1
+        with self.assertRaises(PoolTimeoutError):
+            with pool.client(breaker):
+                pass
+        breaker.record_failure.assert_called_once()
+
+    def test_dirty_session_not_reused(self):
+        pool = DBConnectionPool(size=1)
+
+        conn = DBConnection(pool)
+        assert True is conn.make_connection()
+
+        conn.db_query = 'CREATE TEMPORARY TABLE tmp (hsh UInt64)'
+        conn.send_request()
+        conn.disconnect()
+
+        assert False is conn.connection_status
+        assert 0 == pool.stats()['open']
+
+    def test_query_stats(self):
+        pool = DBConnectionPool(size=1)
+        queries = []
+
+        conn = DBConnection(pool, on_query=queries.append)
+        conn.make_connection()
+        client = conn.clickhouse_client
+        client.execute.return_value = [(1,), (2,)]
+        client.last_query.progress.elapsed_ns = 0.25 * 10 ** 9
+        client.last_query.progress.rows = 1000
+        client.last_query.progress.bytes = 8000
+
+        conn.db_query = SQLTemplate('SELECT {} FROM Package', 'pkg_get') \
+            .format('hsh')
+        assert (True, [(1,), (2,)]) == conn.send_request()
+
+        client.execute.side_effect = Exception('syntax error')
+        conn.db_query = ('SELECT name FROM Package', {})
+        assert False is conn.send_request()[0]
+
+        assert ['pkg_get', 'inline'] == [q['template'] for q in queries]
+        assert 0.25 == queries[0]['server_time']
+        assert 1000 == queries[0]['rows_read']
+        assert 8000 == queries[0]['bytes_read']
+        assert 2 == queries[0]['result_rows']
+        assert False is queries[0]['error']
+        assert True is queries[1]['error']
+        assert 0 == queries[1]['result_rows']
+
+    def test_query_stats_old_driver(self):
+        pool = DBConnectionPool(size=1)
+        queries = []
+
+        conn = DBConnection(pool, db_query='SELECT 1',
+                            on_query=queries.append)
+        conn.make_connection()
+        client = conn.clickhouse_client
+        client.execute.return_value = [(1,)]
+        # progress of old driver without elapsed time
+        client.last_query.progress = MagicMock(spec=['rows', 'bytes'],
+                                               rows=10, bytes=80)
+
+        assert True is conn.send_request()[0]
+        assert 0.0 == queries[0]['server_time']
+        assert 10 == queries[0]['rows_read']
+
+    def test_external_tables(self):
+        pool = DBConnectionPool(size=1)
+
+        conn = DBConnection(pool)
+        conn.make_connection()
+        client = conn.clickhouse_client
+        client.execute.return_value = [(1,)]
+
+        query = SQLTemplate('SELECT pkghash FROM Package WHERE pkghash IN '
+                            '(SELECT hsh FROM pkg_hshs)', 'pkg_get')
+        conn.db_query = QM.build(query, tables={'pkg_hshs': [1, 2]})
+        assert (True, [(1,)]) == conn.send_request()
+
+        client.execute.assert_called_once_with(
+            query, {}, external_tables=[{
+                'name': 'pkg_hshs', 'structure': [('hsh', 'UInt64')],
+                'data': [(1,), (2,)]
+            }]
+        )
+
+    def test_send_request_iter(self):
+        pool = DBConnectionPool(size=1)
+
+        conn = DBConnection(pool)
+        conn.make_connection()
+        conn.clickhouse_client.execute_iter.side_effect = \
+            lambda *args, **kwargs: iter([[(1,), (2,)], [(3,)]])
+
+        conn.db_query = ('SELECT hsh FROM Package', {})
+        status, blocks = conn.send_request_iter(2)
+
+        assert True is status
+        assert [[(1,), (2,)], [(3,)]] == list(blocks)
+        conn.disconnect()
+
+        # connection was read to the end and returned to the pool
+        assert 1 == pool.stats()['idle']
+
+    def test_send_request_iter_not_finished(self):
+        pool = DBConnectionPool(size=1)
+
+        conn = DBConnection(pool)
+        conn.make_connection()
+        conn.clickhouse_client.execute_iter.side_effect = \
+            lambda *args, **kwargs: iter([[(1,), (2,)], [(3,)]])
+
+        conn.db_query = 'SELECT hsh FROM Package'
+        status, blocks = conn.send_request_iter(2)
+        next(blocks)
+        conn.disconnect()
+
+        assert 0 == pool.stats()['open']
+
+
+    def test_send_request_iter_error(self):
+        pool = DBConnectionPool(size=1)
+        queries = []
+
+        def blocks(*args, **kwargs):
+            yield [(1,), (2,)]
+            raise Exception('connection reset')
+
+        conn = DBConnection(pool, on_query=queries.append)
+        conn.make_connection()
+        conn.clickhouse_client.execute_iter.side_effect = blocks
+
+        conn.db_query = 'SELECT hsh FROM Package'
+        status, response = conn.send_request_iter(2)
+
+        # error in the middle of result is not hidden from response
+        assert [(1,), (2,)] == next(response)
+        with self.assertRaises(Exception):
+            next(response)
+        assert True is queries[0]['error']
+
+        conn.disconnect()
+        assert 0 == pool.stats()['open']
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_after_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        breaker.record_failure()
+        assert CircuitBreaker.CLOSED == breaker.state
+        breaker.record_failure()
+        assert CircuitBreaker.OPEN == breaker.state
+
+        assert False is breaker.allow_request()
+        assert 1 == breaker.stats()['rejected']
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+
+        breaker.record_failure()
+        time.sleep(0.02)
+
+        # single probe is allowed
+        assert True is breaker.allow_request()
+        assert CircuitBreaker.HALF_OPEN == breaker.state
+        assert False is breaker.allow_request()
+
+        breaker.record_success()
+        assert CircuitBreaker.CLOSED == breaker.state
+        assert True is breaker.allow_request()
+
+    def test_backoff(self):
+        breaker = CircuitBreaker(backoff_base=0.1, max_backoff=0.3)
+
+        for attempt in range(10):
+            assert 0 <= breaker.backoff(attempt) <= 0.3
+
+    def test_fail_fast_connection(self):
+        pool = MagicMock()
+        pool.acquire.side_effect = ConnectionError('refused')
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+        conn = DBConnection(pool, breaker)
+        assert False is conn.make_connection()
+        assert False is conn.make_connection()
+
+        pool.acquire.assert_called_once()
+
+    def test_success_by_query(self):
+        pool = MagicMock()
+        breaker = MagicMock(CLOSED=CircuitBreaker.CLOSED,
+                            state=CircuitBreaker.CLOSED)
+
+        # idle client of the pool is not a proof that database is alive
+        conn = DBConnection(pool, breaker, db_query='SELECT 1')
+        assert True is conn.make_connection()
+        breaker.record_success.assert_not_called()
+
+        conn.send_request()
+        breaker.record_success.assert_called_once()
+
+    def test_half_open_probe_ping(self):
+        pool = MagicMock()
+        client = pool.acquire.return_value
+        client.connection.ping.return_value = False
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+
+        breaker.record_failure()
+        time.sleep(0.02)
+
+        # probe doesn't close the circuit while database is down
+        conn = DBConnection(pool, breaker)
+        assert False is conn.make_connection()
+        assert CircuitBreaker.OPEN == breaker.state
+        pool.release.assert_called_once_with(client, discard=True)
+
+        time.sleep(0.03)
+        client.connection.ping.return_value = True
+        assert True is conn.make_connection()
+        assert CircuitBreaker.CLOSED == breaker.state
+
+
+if __name__ == '__main__':
+    unittest.main()
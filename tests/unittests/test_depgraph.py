@@ -0,0 +1,218 @@
+import unittest
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+from depgraph import BuildDependencyGraph, DependencyGraphs, \
+    BuildProvidesIndex, ProvidesIndexes
+from db_connection import DBConnectionPool, PoolTimeoutError
+
+
+class TestBuildDependencyGraph(unittest.TestCase):
+
+    def setUp(self) -> None:
+        binaries = [
+            ('glibc-core', 'glibc'), ('glibc-devel', 'glibc'),
+            ('gcc', 'gcc'), ('perl-base', 'perl'), ('perl-devel', 'perl'),
+            ('python3', 'python3'),
+        ]
+        requires = [
+            # build requires of source packages
+            ('gcc', 1, 'glibc-devel'),
+            ('perl', 1, 'gcc'),
+            ('perl', 1, 'glibc-devel'),
+            ('python3', 1, 'perl-devel'),
+            # requires of binary packages
+            ('perl-base', 0, 'glibc-core'),
+            ('python3', 0, 'glibc-core'),
+            ('glibc-core', 0, 'glibc-core'),
+            # unknown provider
+            ('perl-base', 0, 'glibc-debuginfo'),
+        ]
+
+        self.graph = BuildDependencyGraph(binaries, requires)
+
+    def test_requires(self):
+        assert {'glibc', 'gcc'} == self.graph.requires('perl')
+        assert {'glibc'} == self.graph.requires('perl', source=False)
+        assert {'perl'} == self.graph.requires('python3', binary=False)
+
+    def test_dependents(self):
+        assert {'glibc', 'gcc', 'perl'} == self.graph.dependents(
+            ['glibc'], source=True, binary=False
+        )
+        assert {'glibc', 'gcc', 'perl', 'python3'} == \
+            self.graph.dependents(['glibc'], 2, binary=False)
+        assert {'glibc', 'perl', 'python3'} == self.graph.dependents(
+            ['glibc'], 10, source=False
+        )
+
+    def test_required_by_binary(self):
+        assert {'python3'} == self.graph.required_by_binary('perl-devel')
+        assert {'glibc', 'perl', 'python3'} == \
+            self.graph.required_by_binary('glibc-core')
+        assert set() == self.graph.required_by_binary('unknown')
+
+
+class TestDependencyGraphs(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.client = MagicMock()
+        self.client.execute.side_effect = [
+            [('gcc', 'gcc')], [('gcc', 1, 'gcc')],
+            [('gcc', 'gcc')], [('gcc', 1, 'gcc')],
+        ]
+
+        self.pool = MagicMock()
+        self.pool.acquire.return_value = self.client
+        self.pool.client = partial(DBConnectionPool.client, self.pool)
+
+        self.generation = MagicMock()
+        self.generation.current.return_value = 0
+
+        self.graphs = DependencyGraphs(self.pool, None, self.generation)
+
+        self.patcher = patch('depgraph.QM')
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+    def test_get(self):
+        graph = self.graphs.get('p9', ['x86_64', 'noarch'])
+
+        assert {'gcc'} == graph.requires('gcc')
+        assert graph is self.graphs.get('p9', ['noarch', 'x86_64'])
+        self.pool.acquire.assert_called_once()
+
+        # graph is rebuilt after repository import
+        self.generation.current.return_value = 1
+        assert graph is not self.graphs.get('p9', ['x86_64', 'noarch'])
+        assert 1 == len(self.graphs._graphs)
+
+    def test_variants(self):
+        self.client.execute.side_effect = None
+        self.client.execute.return_value = []
+        self.graphs.max_variants = 2
+        self.graphs.allowed_archs = lambda: {'x86_64', 'i586', 'aarch64',
+                                             'noarch'}
+
+        base = self.graphs.get('p9', ['x86_64', 'noarch'])
+        other = self.graphs.get('p10', ['x86_64', 'noarch'])
+        self.graphs.get('p9', ['i586', 'noarch'])
+        # unknown archs are dropped
+        assert base is self.graphs.get('p9', ['x86_64', 'noarch', 'foo'])
+        assert None is self.graphs.get('p9', ['foo'])
+
+        # the least recently used variant of branch is dropped, graph of
+        # other branch is kept
+        self.graphs.get('p9', ['aarch64', 'noarch'])
+        assert [(0, 'p10', ('noarch', 'x86_64')),
+                (0, 'p9', ('noarch', 'x86_64')),
+                (0, 'p9', ('aarch64', 'noarch'))] == list(self.graphs._graphs)
+        assert other is self.graphs.get('p10', ['x86_64', 'noarch'])
+
+    def test_get_error_lock(self):
+        key = (0, 'p9', ('x86_64',))
+        self.client.execute.side_effect = ConnectionError('refused')
+
+        # lock of failed graph is kept for requests which wait for it
+        assert None is self.graphs.get('p9', ['x86_64'])
+        lock = self.graphs._load_locks[key]
+        assert None is self.graphs.get('p9', ['x86_64'])
+        assert lock is self.graphs._load_locks[key]
+
+        self.client.execute.side_effect = [[('gcc', 'gcc')],
+                                           [('gcc', 1, 'gcc')]]
+        assert None is not self.graphs.get('p9', ['x86_64'])
+        assert key not in self.graphs._load_locks
+
+    def test_get_error(self):
+        self.client.execute.side_effect = ConnectionError('refused')
+        self.graphs.breaker = MagicMock()
+
+        assert None is self.graphs.get('p9', ['x86_64'])
+        self.pool.release.assert_called_once_with(self.client, discard=True)
+        self.graphs.breaker.record_failure.assert_called_once()
+        self.graphs.breaker.record_success.assert_not_called()
+
+    def test_get_breaker(self):
+        self.graphs.breaker = MagicMock()
+
+        assert None is not self.graphs.get('p9', ['x86_64'])
+        self.graphs.breaker.record_success.assert_called_once()
+        self.pool.release.assert_called_once_with(self.client)
+
+        # all connections are busy, database is not failed
+        self.pool.acquire.side_effect = PoolTimeoutError('busy')
+        assert None is self.graphs.get('p9', ['noarch'])
+        self.graphs.breaker.record_failure.assert_not_called()
+
+    def test_refresh(self):
+        self.graphs.refresh_interval = 60
+        graph = self.graphs.get('p9', ['x86_64'])
+
+        with patch('depgraph.time.monotonic', return_value=10 ** 9):
+            # graph is reloaded after refresh interval
+            reloaded = self.graphs.get('p9', ['x86_64'])
+            assert graph is not reloaded
+            assert reloaded is self.graphs.get('p9', ['x86_64'])
+
+            # expired graph is kept if reloading fails
+            self.graphs._graphs[(0, 'p9', ('x86_64',))] = (reloaded, 0)
+            self.client.execute.side_effect = ConnectionError('refused')
+            assert reloaded is self.graphs.get('p9', ['x86_64'])
+
+    def test_get_client(self):
+        client = MagicMock()
+        client.execute.side_effect = [[('gcc', 'gcc')], [('gcc', 1, 'gcc')]]
+
+        graph = self.graphs.get('p9', ['x86_64'], client)
+
+        # client of request is used and is not returned to the pool
+        assert {'gcc'} == graph.requires('gcc')
+        self.pool.acquire.assert_not_called()
+        self.pool.release.assert_not_called()
+
+
+class TestBuildProvidesIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        provides = [('libc.so.6', [10]), ('glibc-devel', [11]),
+                    ('perl(strict.pm)', [20, 21])]
+        requires = [(11, ['libc.so.6', 'unknown']), (20, ['libc.so.6']),
+                    (30, ['unknown'])]
+
+        self.index = BuildProvidesIndex(provides, requires)
+
+    def test_resolve(self):
+        assert {10, 11} == self.index.resolve(['libc.so.6', 'glibc-devel'])
+        assert set() == self.index.resolve(['unknown'])
+
+    def test_get_requires(self):
+        assert {10, 11, 20, 21, 30} == self.index.binaries
+        assert [(11, (10,)), (20, (10,))] == \
+            self.index.get_requires([10, 11, 20, 30])
+
+
+class TestProvidesIndexes(unittest.TestCase):
+
+    def test_get(self):
+        client = MagicMock()
+        client.execute.side_effect = [[('gcc', [1])], [(1, ['gcc'])]]
+        pool = MagicMock()
+        pool.acquire.return_value = client
+        pool.client = partial(DBConnectionPool.client, pool)
+        generation = MagicMock()
+        generation.current.return_value = 0
+
+        indexes = ProvidesIndexes(pool, None, generation)
+        with patch('depgraph.QM'):
+            index = indexes.get('p9', ['x86_64', 'noarch'])
+
+        assert [(1, (1,))] == index.get_requires([1])
+        assert index is indexes.get('p9', ['noarch', 'x86_64'])
+        pool.acquire.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
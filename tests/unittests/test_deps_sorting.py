@@ -1,7 +1,7 @@
 import json
 import unittest
 
-from libs.deps_sorting import SortList
+from libs.deps_sorting import SortList, Graph
 
 
 class TestDepsSorting(unittest.TestCase):
@@ -11,18 +11,61 @@ class TestDepsSorting(unittest.TestCase):
         with open('deps_sorting_data/input_struct', 'r') as fd:
             cls.test_struct = json.loads(fd.read())
 
+        # list of cycles (sorted names of packages)
+        with open('deps_sorting_data/result_circle', 'r') as fd:
+            cls.res_circle = json.loads(fd.read())
+
+    def check_circle(self, circle):
+        cycles = sorted({tuple(sorted(deps))
+                         for pkg, deps in circle.items()})
+        assert [tuple(cycle) for cycle in self.res_circle] == cycles
+
+        for pkg, deps in circle.items():
+            assert pkg in deps
+            for dep, count in deps.items():
+                assert len(self.test_struct[dep]) == count
+
     def test_sort_list(self):
         sort = SortList(self.test_struct, 'a')
         circle, sorted_ = sort.sort_list()
 
-        with open('deps_sorting_data/result_circle', 'r') as fd_c, \
-                open('deps_sorting_data/result_sorted') as fd_s:
-            res_circle = json.loads(fd_c.read())
+        with open('deps_sorting_data/result_sorted') as fd_s:
             res_sorted = fd_s.read().split('\n')
 
-        assert res_circle == circle
+        self.check_circle(circle)
         assert res_sorted == sorted_
 
+        # dependencies are before packages, except of cycles
+        position = {pkg: num for num, pkg in enumerate(sorted_)}
+        for pkg, reqs in self.test_struct.items():
+            for req in reqs:
+                if req not in circle.get(pkg, {pkg: 0}):
+                    assert position[req] < position[pkg]
+
+    def test_sort_list_acyclic(self):
+        # without cycles packages are in the order of the former recursive
+        # sort (result_sorted_acyclic is written by it)
+        circle, _ = SortList(self.test_struct, 'a').sort_list()
+        acyclic = {pkg: [req for req in reqs if req not in circle]
+                   for pkg, reqs in self.test_struct.items()
+                   if pkg not in circle}
+
+        circle, sorted_ = SortList(acyclic, 'a').sort_list()
+
+        with open('deps_sorting_data/result_sorted_acyclic') as fd:
+            res_sorted = fd.read().split('\n')
+
+        assert {} == circle
+        assert res_sorted == sorted_
+
+    def test_depth_first_order(self):
+        g = Graph(4)
+        g.add_edge(2, 1)
+        g.add_edge(1, 0)
+        g.add_edge(3, 0)
+
+        assert [3, 2, 1, 0] == g.depth_first_order()
+
     def test_numbered_list(self):
         name_num, num_name = SortList._numbered_list([
             'curl', 'strongswan', 'SimGear', 'osgEarth', 'adp'
@@ -37,10 +80,29 @@ class TestDepsSorting(unittest.TestCase):
         sort = SortList(None, None)
         sort.package_reqs = self.test_struct
 
-        with open('deps_sorting_data/result_circle') as fd:
-            res_circle = json.loads(fd.read())
+        self.check_circle(sort._search_circle_deps())
+
+    def test_long_chain(self):
+        # recursion limit is not reached on deep graphs
+        g = Graph(100000)
+        for v in range(99999):
+            g.add_edge(v + 1, v)
+        g.add_edge(0, 99999)
+
+        components = g.strongly_connected_components()
+        assert 1 == len(components)
+        assert 100000 == len(components[0])
+
+        assert [] == g.topological_sort()
+
+    def test_topological_sort(self):
+        g = Graph(4)
+        g.add_edge(2, 1)
+        g.add_edge(1, 0)
+        g.add_edge(3, 0)
 
-        assert res_circle == sort._search_circle_deps()
+        assert [2, 3, 1, 0] == g.topological_sort()
+        assert [[0], [1], [2], [3]] == g.strongly_connected_components()
 
 
 if __name__ == '__main__':
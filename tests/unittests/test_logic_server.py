@@ -32,6 +32,31 @@ class TestLogicServer(unittest.TestCase):
         assert True is status
         assert 10 == len(response)
 
+    def test_held_client(self):
+        conn = Connection()
+        conn.db_connection = MagicMock(connection_status=False)
+
+        assert None is conn.held_client()
+
+        conn.db_connection.connection_status = True
+        assert conn.db_connection.clickhouse_client is conn.held_client()
+
+    def test_drop_connection_stats(self):
+        conn = Connection()
+        conn.db_connection = MagicMock(connection_status=True)
+
+        with patch('logic_server.db_pool') as pool, \
+                patch('logic_server.logger') as logger:
+            logger.isEnabledFor.return_value = False
+            conn.drop_connection()
+            pool.stats.assert_not_called()
+
+            logger.isEnabledFor.return_value = True
+            conn.drop_connection()
+            pool.stats.assert_called_once()
+
+        assert 2 == conn.db_connection.disconnect.call_count
+
     def test_get_one_value(self):
         self.m.args = {
             'arg1': 'value1',
@@ -88,6 +113,28 @@ class TestLogicServer(unittest.TestCase):
                 assert 'Package(s) with input parameters is not in the ' \
                        'repository' in server.check_input_params()
 
+    def test_missing_packages(self):
+        connection = MagicMock()
+        connection.send_request.return_value = (True, [('glibc',)])
+
+        with patch('logic_server.g', MagicMock(connection=connection)):
+            assert ['no-such-package'] == server._missing_packages(
+                ['glibc', 'no-such-package', 'glibc'], None, 'p9', 1
+            )
+            # one query for all packages
+            assert 1 == connection.send_request.call_count
+            assert ('glibc', 'no-such-package') == \
+                connection.request_line[1]['names']
+
+            # found package is in validation cache
+            connection.send_request.return_value = (True, [])
+            assert [] == server._missing_packages(['glibc'], None, 'p9', 1)
+            assert 1 == connection.send_request.call_count
+
+            assert ['glibc'] == server._missing_packages(
+                ['glibc'], None, 'p8', 1
+            )
+
     def test_get_values_by_params(self):
         self.m.args = {
             'sha1': '53ddac04bd35f566a818e020d59b1bcb2e58bbe9',
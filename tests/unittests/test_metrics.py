@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+import multiprocessing
+from unittest.mock import patch
+
+from metrics import Metrics
+
+DECLARATIONS = [
+    ('requests_total', 'counter', 'Requests'),
+    ('in_flight', 'gauge', 'Requests being processed'),
+    ('duration_seconds', 'histogram', 'Request time'),
+]
+
+
+def worker(path):
+    # counts requests in forked process like gunicorn worker
+    metrics = Metrics(path, declarations=DECLARATIONS)
+    metrics.inc('requests_total', 2, route='/package_info')
+    metrics.add('in_flight', 5)
+    metrics.observe('duration_seconds', 0.3)
+    metrics.sync()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metrics = Metrics(self.tmp.name, declarations=DECLARATIONS)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_render(self):
+        self.metrics.inc('requests_total', route='/package_info',
+                         status='200')
+        self.metrics.add('in_flight', 1)
+        self.metrics.observe('duration_seconds', 0.01)
+        self.metrics.observe('duration_seconds', 0.2)
+        self.metrics.observe('duration_seconds', 100)
+
+        lines = self.metrics.render().split('\n')
+
+        assert '# TYPE requests_total counter' in lines
+        assert 'requests_total{route="/package_info",status="200"} 1' \
+            in lines
+        assert 'in_flight 1' in lines
+        assert 'duration_seconds_bucket{le="0.005"} 0' in lines
+        assert 'duration_seconds_bucket{le="0.01"} 1' in lines
+        assert 'duration_seconds_bucket{le="0.25"} 2' in lines
+        assert 'duration_seconds_bucket{le="+Inf"} 3' in lines
+        assert 'duration_seconds_sum 100.21' in lines
+        assert 'duration_seconds_count 3' in lines
+
+    def test_label_escaping(self):
+        self.metrics.inc('requests_total', route='a"b\\c\n')
+
+        assert 'requests_total{route="a\\"b\\\\c\\n"} 1' in \
+            self.metrics.render().split('\n')
+
+    def test_processes(self):
+        self.metrics.inc('requests_total', route='/package_info')
+
+        context = multiprocessing.get_context('fork')
+        process = context.Process(target=worker, args=(self.tmp.name,))
+        process.start()
+        process.join()
+
+        # live worker snapshot
+        live = Metrics(self.tmp.name, declarations=DECLARATIONS)
+        live.add('in_flight', 1)
+        live._write(str(os.getppid()), live._snapshot())
+
+        lines = self.metrics.render().split('\n')
+
+        # counters of finished worker are kept, its gauges are not
+        assert 'requests_total{route="/package_info"} 3' in lines
+        assert 'in_flight 1' in lines
+        assert 'duration_seconds_count 1' in lines
+
+        # snapshot of finished worker is moved to the archive
+        assert not os.path.exists(
+            os.path.join(self.tmp.name, str(process.pid))
+        )
+        assert 'requests_total{route="/package_info"} 3' in \
+            self.metrics.render().split('\n')
+
+        self.metrics.clear()
+        assert [] == [name for name in os.listdir(self.tmp.name)
+                      if not name.startswith('.')]
+
+    def test_snapshot_format(self):
+        self.metrics.inc('requests_total', route='/package_info')
+        self.metrics.observe('duration_seconds', 0.3)
+        self.metrics.sync()
+
+        path = os.path.join(self.tmp.name, str(os.getpid()))
+        with open(path) as fd:
+            assert [['requests_total', [['route', '/package_info']], 1]] == \
+                json.load(fd)['counters']
+
+        assert self.metrics._snapshot() == \
+            self.metrics._read(str(os.getpid()))
+
+        # broken snapshot is skipped
+        with open(path, 'w') as fd:
+            fd.write('{"counters": [[1]]}')
+        assert None is self.metrics._read(str(os.getpid()))
+
+    def test_start(self):
+        metrics = Metrics(self.tmp.name, sync_interval=0.01,
+                          declarations=DECLARATIONS)
+        path = os.path.join(self.tmp.name, str(os.getpid()))
+
+        with patch('utils.atexit') as atexit:
+            metrics.start()
+            metrics.start()
+        atexit.register.assert_called_once_with(
+            metrics._snapshots._flush
+        )
+
+        # changes of idle worker are written by background thread
+        metrics.inc('requests_total', route='/package_info')
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.01)
+        assert 1 == metrics._read(str(os.getpid()))['counters'][
+            ('requests_total', (('route', '/package_info'),))
+        ]
+
+        # snapshot isn't rewritten without changes
+        os.remove(path)
+        metrics._snapshots._flush()
+        assert not os.path.exists(path)
+
+    def test_private_dir(self):
+        os.chmod(self.tmp.name, 0o777)
+
+        with self.assertRaises(PermissionError):
+            Metrics(self.tmp.name, declarations=DECLARATIONS)
+
+
+if __name__ == '__main__':
+    unittest.main()
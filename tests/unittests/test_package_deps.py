@@ -0,0 +1,134 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from depgraph import BuildProvidesIndex
+from libs.package_deps import PackageDependencies
+from querymgr import query_manager as QM
+
+# hash - hashes of binary packages which provide its requires
+REQUIRES = {
+    1: [10, 11],
+    2: [11, 12],
+    10: [20],
+    11: [20, 21],
+    12: [10],
+    20: [10, 30],
+    21: [],
+    30: [],
+}
+
+
+def get_requires(hshs):
+    return True, [(hsh, REQUIRES[hsh]) for hsh in sorted(hshs)
+                  if REQUIRES.get(hsh)]
+
+
+class TestPackageDependencies(unittest.TestCase):
+
+    def test_get_package_dep_set(self):
+        pkg_deps = PackageDependencies('p9')
+
+        with patch.object(pkg_deps, '_get_requires',
+                          side_effect=get_requires) as mock:
+            dep_dict = pkg_deps.get_package_dep_set([1, 2])
+
+        assert [1, 2] == sorted(dep_dict)
+        assert [10, 11, 20, 21, 30] == sorted(dep_dict[1])
+        assert [10, 11, 12, 20, 21, 30] == sorted(dep_dict[2])
+        for hshs in dep_dict.values():
+            assert len(hshs) == len(set(hshs))
+
+        # every hash is queried once
+        queried = [hsh for call in mock.call_args_list for hsh in call[0][0]]
+        assert sorted(queried) == sorted(set(queried))
+        assert 4 == mock.call_count
+
+    def test_get_requires(self):
+        pkg_deps = PackageDependencies('p9')
+        g = MagicMock()
+        g.connection.send_request.return_value = (True, [(1, [10, 11])])
+
+        with patch('libs.package_deps.g', g), \
+                patch.object(QM, 'build_dep_set_get_srchsh_for_binary',
+                             'SELECT', create=True):
+            assert (True, [(1, [10, 11])]) == pkg_deps._get_requires({1, 2})
+
+        # level is one query with hashes in external table
+        assert 1 == g.connection.send_request.call_count
+        query, params, tables = g.connection.request_line
+        assert {'branch': 'p9', 'archs': ('x86_64', 'noarch')} == params
+        assert 'pkg_hshs' == tables[0]['name']
+        assert [(1,), (2,)] == sorted(tables[0]['data'])
+
+    def test_index(self):
+        provides = {}
+        for hsh, hshs in REQUIRES.items():
+            for provider in hshs:
+                provides.setdefault('dep-{}'.format(provider), [provider])
+        index = BuildProvidesIndex(provides.items(), [
+            (hsh, ['dep-{}'.format(provider) for provider in hshs])
+            for hsh, hshs in REQUIRES.items() if hsh >= 10
+        ])
+
+        g = MagicMock()
+        g.connection.send_request.return_value = (True, [
+            (1, ['dep-10', 'dep-11']), (2, ['dep-11', 'dep-12'])
+        ])
+
+        pkg_deps = PackageDependencies('p9', index=index)
+        with patch('libs.package_deps.g', g), \
+                patch.object(QM, 'build_dep_set_get_source_requires',
+                             'SELECT', create=True):
+            dep_dict = pkg_deps.get_package_dep_set([1, 2])
+
+        with patch.object(PackageDependencies, '_get_requires',
+                          side_effect=get_requires):
+            assert PackageDependencies('p9').get_package_dep_set([1, 2]) \
+                == dep_dict
+
+        # database is queried for requires of source packages only
+        assert 1 == g.connection.send_request.call_count
+        assert [(1,), (2,)] == \
+            sorted(g.connection.request_line[2][0]['data'])
+
+    def test_group_archs(self):
+        dict_info = {
+            1: ['foo', '1.0', 'alt1', 0, ['src']],
+            2: ['bar', '2.0', 'alt1', 0, ['src']],
+            10: ['libfoo', '1.0', 'alt1', 0, ['x86_64']],
+            11: ['libfoo', '1.0', 'alt1', 0, ['i586']],
+            12: ['libfoo', '1.0', 'alt1', 1, ['noarch']],
+            20: ['libbar', '3.0', 'alt2', 0, ['x86_64']],
+        }
+        hsh_dict = {1: [10, 20, 11, 12], 2: [10, 20]}
+
+        result = PackageDependencies._group_archs(dict_info, hsh_dict)
+
+        assert {
+            'foo': {
+                0: {'name': 'libfoo', 'version': '1.0', 'release': 'alt1',
+                    'epoch': 0, 'archs': ('i586', 'noarch', 'x86_64')},
+                1: {'name': 'libbar', 'version': '3.0', 'release': 'alt2',
+                    'epoch': 0, 'archs': ('x86_64',)},
+                2: {'name': 'libfoo', 'version': '1.0', 'release': 'alt1',
+                    'epoch': 1, 'archs': ('i586', 'noarch', 'x86_64')},
+            },
+            # archs merged for the previous package are kept
+            'bar': {
+                0: {'name': 'libfoo', 'version': '1.0', 'release': 'alt1',
+                    'epoch': 0, 'archs': ('i586', 'noarch', 'x86_64')},
+                1: {'name': 'libbar', 'version': '3.0', 'release': 'alt2',
+                    'epoch': 0, 'archs': ('x86_64',)},
+            },
+        } == result
+
+    def test_error(self):
+        pkg_deps = PackageDependencies('p9')
+
+        with patch.object(pkg_deps, '_get_requires',
+                          return_value=(False, 'error')):
+            assert 'error' == pkg_deps.get_package_dep_set([1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import json
+import tempfile
+import unittest
+import multiprocessing
+
+from profiling import QueryProfiler
+
+
+def query(template, wall_time, error=False):
+    return {'template': template, 'wall_time': wall_time,
+            'server_time': wall_time / 2, 'client_time': wall_time / 2,
+            'rows_read': 100, 'bytes_read': 1000, 'result_rows': 10,
+            'error': error}
+
+
+def worker(path):
+    profiler = QueryProfiler(path)
+    profiler.record('/package_info', query('package_info_get', 10.0))
+    profiler.sync()
+
+
+class TestQueryProfiler(unittest.TestCase):
+
+    def test_record(self):
+        profiler = QueryProfiler()
+        profiler.record('/package_info', query('package_info_get', 1.0))
+        profiler.record('/package_info', query('package_info_get', 3.0))
+        profiler.record('/package_info', query('inline', 0.5, error=True))
+        profiler.record('/task_info', query('package_info_get', 2.0))
+
+        stats = profiler.stats()['endpoints']
+        assert ['/package_info', '/task_info'] == sorted(stats)
+
+        template = stats['/package_info']['package_info_get']
+        assert 2 == template['queries']
+        assert 0 == template['errors']
+        assert 4.0 == template['wall_time']
+        assert 3.0 == template['max_wall_time']
+        assert 2.0 == template['mean_wall_time']
+        assert 2.0 == template['server_time']
+        assert 200 == template['rows_read']
+        assert 2000 == template['bytes_read']
+        assert 20 == template['result_rows']
+
+        assert 1 == stats['/package_info']['inline']['errors']
+
+        profiler.clear()
+        assert {'workers': 1, 'endpoints': {}} == profiler.stats()
+
+    def test_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = QueryProfiler(tmp)
+            profiler.record('/package_info', query('package_info_get', 1.0))
+
+            # finished worker
+            context = multiprocessing.get_context('fork')
+            process = context.Process(target=worker, args=(tmp,))
+            process.start()
+            process.join()
+
+            # running worker
+            other = QueryProfiler(tmp)
+            other.record('/package_info', query('package_info_get', 3.0))
+            other.record('/task_info', query('inline', 0.5, error=True))
+            snapshot = {'reset': 0, 'stats': [
+                [endpoint, template, stats]
+                for (endpoint, template), stats in other._items()
+            ]}
+            with open(os.path.join(tmp, 'queries.{}'.format(os.getppid())),
+                      'w') as fd:
+                json.dump(snapshot, fd)
+
+            stats = profiler.stats()
+            assert 2 == stats['workers']
+            template = stats['endpoints']['/package_info']['package_info_get']
+            assert 2 == template['queries']
+            assert 3.0 == template['max_wall_time']
+            assert 2.0 == template['mean_wall_time']
+            assert 1 == stats['endpoints']['/task_info']['inline']['errors']
+            # snapshot of finished worker is removed
+            assert not os.path.exists(
+                os.path.join(tmp, 'queries.{}'.format(process.pid))
+            )
+
+            # reset clears statistics of all workers
+            profiler.clear()
+            assert {'workers': 1, 'endpoints': {}} == profiler.stats()
+
+
+if __name__ == '__main__':
+    unittest.main()
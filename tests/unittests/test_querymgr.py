@@ -23,6 +23,33 @@ class TestQueryMgr(unittest.TestCase):
         assert 'SELECT DISTINCT name' in QM.find_pkgset_get_package_names
         assert '' == QM.nonexistent_attribute
 
+    def test_build(self):
+        query, params, tables = QM.build(
+            'SELECT name FROM Package WHERE pkghash IN '
+            '(SELECT hsh FROM pkg_hshs) AND arch = %(arch)s',
+            {'arch': 'noarch'}, tables={'pkg_hshs': {3, 1, 2}}
+        )
+
+        assert {'arch': 'noarch'} == params
+        assert 1 == len(tables)
+        assert 'pkg_hshs' == tables[0]['name']
+        assert [('hsh', 'UInt64')] == tables[0]['structure']
+        assert [(1,), (2,), (3,)] == sorted(tables[0]['data'])
+
+        # text of query doesn't depend on input data
+        assert query == QM.build(query, {'arch': 'i586'},
+                                 tables={'pkg_hshs': range(10000)})[0]
+        assert ('SELECT 1', {}, []) == QM.build('SELECT 1')
+
+    def test_build_names(self):
+        _, _, tables = QM.build(
+            'SELECT pkghash FROM Package WHERE name IN '
+            '(SELECT name FROM pkg_names)', tables={'pkg_names': ('glibc',)}
+        )
+
+        assert [('name', 'String')] == tables[0]['structure']
+        assert [('glibc',)] == tables[0]['data']
+
 
 if __name__ == '__main__':
     unittest.main()
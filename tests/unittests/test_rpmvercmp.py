@@ -0,0 +1,125 @@
+import random
+import unittest
+
+from libs.rpmvercmp import rpmvercmp, compare_evr, compare_evr_many
+
+try:
+    import rpm
+except ImportError:
+    rpm = None
+
+
+class TestRpmVerCmp(unittest.TestCase):
+
+    # cases from test suite of rpm library
+    cases = [
+        ('1.0', '1.0', 0), ('1.0', '2.0', -1), ('2.0.1', '2.0', 1),
+        ('2.0.1a', '2.0.1', 1), ('5.5p1', '5.5p10', -1),
+        ('10xyz', '10.1xyz', -1), ('xyz10.1', 'xyz10', 1),
+        ('xyz.4', '8', -1), ('8', 'xyz.4', 1), ('6.0.rc1', '6.0', 1),
+        ('10b2', '10a1', 1), ('1.0a', '1.0aa', -1), ('10.0001', '10.1', 0),
+        ('10.0039', '10.0001', 1), ('4.999.9', '5.0', -1),
+        ('20101122', '20101121', 1), ('2.0', '2_0', 0), ('a+', 'a_', 0),
+        ('_+', '+_', 0), ('1.0~rc1', '1.0', -1), ('1.0~rc1', '1.0~rc2', -1),
+        ('1.0~rc1~git123', '1.0~rc1', -1), ('1.0^', '1.0', 1),
+        ('1.0', '1.0^git1', -1), ('1.0^git1', '1.01', -1),
+        ('1.0^20160101', '1.0.1', -1),
+        ('1.0^20160102', '1.0^20160101^git1', 1),
+        ('1.0~rc1^git1', '1.0~rc1', 1), ('1.0^git1~pre', '1.0^git1', -1),
+    ]
+
+    def test_rpmvercmp(self):
+        for version1, version2, result in self.cases:
+            assert result == rpmvercmp(version1, version2), \
+                (version1, version2)
+            assert -result == rpmvercmp(version2, version1), \
+                (version2, version1)
+
+    def test_compare_evr(self):
+        assert 1 == compare_evr((1, '1.0', 'alt1', None),
+                                (0, '2.0', 'alt1', None))
+        assert -1 == compare_evr(('0', '1.0', 'alt1', None),
+                                 (0, '1.0', 'alt2', None))
+        # release is compared only if both versions have it
+        assert 0 == compare_evr((0, '1.0', None, None),
+                                (0, '1.0', 'alt2', None))
+        assert 1 == compare_evr((0, '1.0', 'alt1', 'sisyphus+2'),
+                                (0, '1.0', 'alt1', 'sisyphus+1'))
+        assert 0 == compare_evr((0, '1.0', 'alt1', ''),
+                                (0, '1.0', 'alt1', 'sisyphus+1'))
+
+    def test_compare_evr_epoch(self):
+        # missing epoch is 0
+        for epoch in (None, '', '0', 0):
+            assert 0 == compare_evr((epoch, '1.0', 'alt1', None),
+                                    (0, '1.0', 'alt1', None)), epoch
+        assert -1 == compare_evr((None, '2.0', 'alt1', None),
+                                 (1, '1.0', 'alt1', None))
+        # epoch is a number
+        assert -1 == compare_evr(('2', '1.0', 'alt1', None),
+                                 ('10', '1.0', 'alt1', None))
+
+    def test_compare_evr_release(self):
+        # versions are equal, only release differs
+        assert -1 == compare_evr((0, '1.0', 'alt1', None),
+                                 (0, '1.0', 'alt2', None))
+        assert 1 == compare_evr((0, '1.0', 'alt10', None),
+                                (0, '1.0', 'alt9', None))
+        assert 1 == compare_evr((0, '1.0', 'alt1.1', None),
+                                (0, '1.0', 'alt1', None))
+        assert -1 == compare_evr((0, '1.0', 'alt0.1', None),
+                                 (0, '1.0', 'alt1', None))
+        # version is compared before release
+        assert 1 == compare_evr((0, '1.1', 'alt1', None),
+                                (0, '1.0', 'alt5', None))
+
+    def test_compare_evr_alt_suffix(self):
+        # ALT release suffixes: backports, git snapshots and prereleases
+        assert 1 == compare_evr((0, '1.0', 'alt1', None),
+                                (0, '1.0', 'alt0.M80P.1', None))
+        assert -1 == compare_evr((0, '1.0', 'alt1', None),
+                                 (0, '1.0', 'alt1.git1234', None))
+        assert -1 == compare_evr((0, '1.0', 'alt0.rc1', None),
+                                 (0, '1.0', 'alt1', None))
+        assert 0 == compare_evr((0, '1.0', 'alt1_1', None),
+                                (0, '1.0', 'alt1.1', None))
+
+    def test_compare_evr_disttag(self):
+        # disttag is compared only after equal releases
+        assert 1 == compare_evr((0, '1.0', 'alt2', 'sisyphus+1'),
+                                (0, '1.0', 'alt1', 'sisyphus+2'))
+        assert -1 == compare_evr((0, '1.0', 'alt1', 'sisyphus+299.100.1'),
+                                 (0, '1.0', 'alt1', 'sisyphus+300.100.1'))
+        assert 0 == compare_evr((0, '1.0', 'alt1', None),
+                                (0, '1.0', 'alt1', 'p10+300.100.1'))
+
+    def test_compare_evr_many(self):
+        assert [1, 0, -1] == compare_evr_many(
+            (0, '1.0', 'alt2', None),
+            [(0, '1.0', 'alt1', None), (0, '1.0', 'alt2', None),
+             (0, '1.1', 'alt1', None)]
+        )
+
+    @unittest.skipIf(rpm is None, 'rpm module is not installed')
+    def test_rpm_corpus(self):
+        random.seed(0)
+        parts = ['0', '1', '01', '2', '10', 'a', 'b', 'alt', 'rc', 'git',
+                 '.', '_', '+', '~', '^']
+
+        def version():
+            return ''.join(random.choice(parts)
+                           for _ in range(random.randint(1, 6)))
+
+        for _ in range(5000):
+            version1, version2 = version(), version()
+
+            hdr1, hdr2 = rpm.hdr(), rpm.hdr()
+            hdr1[rpm.RPMTAG_VERSION] = version1
+            hdr2[rpm.RPMTAG_VERSION] = version2
+
+            assert rpm.versionCompare(hdr1, hdr2) == \
+                rpmvercmp(version1, version2), (version1, version2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import run_app
+from paths import namespace
+
+
+class TestRunApp(unittest.TestCase):
+
+    def worker_args(self, **options):
+        with patch.multiple(namespace, **options):
+            return run_app.worker_args()
+
+    def test_sync(self):
+        args = self.worker_args(WORKER_CLASS='sync', WORKER_PROCESSES='4',
+                                MAX_REQUESTS=0, PRELOAD_APP=False)
+
+        assert ['-w', '4', '-k', 'sync'] == args[:4]
+        assert '--threads' not in args
+        assert '--max-requests' not in args
+        assert '--preload' not in args
+
+    def test_gthread(self):
+        args = self.worker_args(WORKER_CLASS='gthread', WORKER_THREADS=8,
+                                DATABASE_POOL_SIZE=8, MAX_REQUESTS=1000,
+                                MAX_REQUESTS_JITTER=50, KEEPALIVE=5,
+                                BACKLOG=64, PRELOAD_APP=True)
+
+        assert '8' == args[args.index('--threads') + 1]
+        assert '1000' == args[args.index('--max-requests') + 1]
+        assert '50' == args[args.index('--max-requests-jitter') + 1]
+        assert '5' == args[args.index('--keep-alive') + 1]
+        assert '64' == args[args.index('--backlog') + 1]
+        assert '--preload' in args
+        assert '--worker-connections' not in args
+
+    def test_unknown_worker_class(self):
+        with self.assertRaises(SystemExit):
+            self.worker_args(WORKER_CLASS='tornado')
+
+    def test_missing_worker_module(self):
+        with patch('importlib.import_module', side_effect=ImportError):
+            with self.assertRaises(SystemExit):
+                self.worker_args(WORKER_CLASS='gevent')
+
+    def test_preload_patch_module(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = os.path.join(tmp, 'app.conf')
+            with open(config, 'w') as fd:
+                fd.write('[Application]\n'
+                         'WORKER_CLASS = gevent   # async\n'
+                         'PRELOAD = true\n')
+
+            assert 'gevent' == run_app.preload_patch_module(
+                ['altrepo-server', '--config', config]
+            )
+            # key overrides config file
+            assert 'eventlet' == run_app.preload_patch_module(
+                ['altrepo-server', '--config={}'.format(config),
+                 '--worker-class', 'eventlet']
+            )
+            assert None is run_app.preload_patch_module(
+                ['altrepo-server', '--config', config, '--worker-class',
+                 'gthread']
+            )
+
+            # gunicorn patches workers itself without preloading
+            with patch.object(namespace, 'PRELOAD_APP', False):
+                assert None is run_app.preload_patch_module(
+                    ['altrepo-server', '--config', tmp + '/missing.conf',
+                     '--worker-class', 'gevent']
+                )
+
+
+if __name__ == '__main__':
+    unittest.main()
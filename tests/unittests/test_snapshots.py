@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from snapshots import WorkerSnapshots
+
+
+class TestWorkerSnapshots(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = {'requests': 1}
+        self.snapshots = WorkerSnapshots(
+            self.tmp.name, lambda: self.state, prefix='test.',
+            sync_interval=60
+        )
+        self.name = 'test.{}'.format(os.getpid())
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_sync(self):
+        # nothing is written without changes
+        self.snapshots.sync()
+        assert None is self.snapshots.read(self.name)
+
+        self.snapshots.changed = True
+        self.snapshots.sync()
+        assert {'requests': 1} == self.snapshots.read(self.name)
+        assert not self.snapshots.changed
+
+        # the next snapshot waits for sync_interval
+        self.state = {'requests': 2}
+        self.snapshots.changed = True
+        self.snapshots.sync()
+        assert {'requests': 1} == self.snapshots.read(self.name)
+
+        self.snapshots.sync(force=True)
+        assert {'requests': 2} == self.snapshots.read(self.name)
+
+    def test_others(self):
+        self.snapshots.write('test.1', {})
+        self.snapshots.write('test.x', {})
+        self.snapshots.write('1', {})
+        self.snapshots.write(self.name, {})
+
+        assert [(1, 'test.1')] == list(self.snapshots.others())
+
+        # missing directory has no snapshots
+        self.tmp.cleanup()
+        assert [] == list(self.snapshots.others())
+
+        # broken snapshot is skipped
+        self.snapshots.write('test.1', {})
+        with open(os.path.join(self.tmp.name, 'test.1'), 'w') as fd:
+            fd.write('{')
+        assert None is self.snapshots.read('test.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import re
+import time
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from cache import DiskCache
+from task_artifacts import TaskArtifacts
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Stub of task pages, every response is delayed. Pages have the same ETag,
+    so revalidated pages are not modified.
+    """
+    protocol_version = 'HTTP/1.1'
+    delay = 0.05
+    # paths which are loaded longer than deadline
+    slow = re.compile(r'^/RESULT/2/')
+    # paths which are temporarily unavailable
+    unavailable = re.compile(r'^/RESULT/3/')
+    etag = '"v1"'
+    # (path, status) of handled requests
+    handled = []
+
+    def do_GET(self):
+        time.sleep(1.5 if self.slow.match(self.path) else self.delay)
+
+        if self.unavailable.match(self.path):
+            self.handled.append((self.path, 503))
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if re.match(r'^/tasks/\d+/acl/\w+/\d+/$', self.path):
+            body = '<html><body><a href="../">Parent Directory</a>' \
+                   '<a href="user">user</a></body></html>'
+        elif re.match(r'^/tasks/4/acl/approved/\d+/user$', self.path):
+            # malformed message without author
+            body = 'no separator\n'
+        elif re.match(r'^/tasks/\d+/acl/approved/\d+/user$', self.path):
+            body = 'user :: 2020-01-01\nok\n'
+        elif re.match(r'^/tasks/\d+/logs/events\.1\.1\.log$', self.path):
+            body = 'message: test task\n'
+        elif re.match(r'^/RESULT/\d+/check-beehive-result.log$', self.path):
+            body = 'beehive ok'
+        else:
+            body = None
+
+        if body and self.headers.get('If-None-Match') == self.etag:
+            self.handled.append((self.path, 304))
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.handled.append((self.path, 200 if body else 404))
+        data = (body or 'not found').encode()
+        if self.path == '/RESULT/4/check-beehive-result.log':
+            # page in other encoding
+            data = b'\xff\xfe beehive'
+        self.send_response(200 if body else 404)
+        self.send_header('Content-Length', str(len(data)))
+        if body:
+            self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTaskArtifacts(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.daemon_threads = True
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+
+        cls.thread = threading.Thread(target=cls.server.serve_forever,
+                                      daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        StubHandler.handled.clear()
+
+    def make_artifacts(self, workers, deadline=30, cache=None):
+        return TaskArtifacts(self.url, self.url, workers=workers, timeout=10,
+                             deadline=deadline, cache=cache)
+
+    def test_fetch(self):
+        approvals, beehive, message, complete = \
+            self.make_artifacts(4).fetch(1, '1.1', [100, 200])
+
+        assert True is complete
+        approval = ['user', '2020-01-01', 'ok']
+        assert {100: [approval, ''], 200: [approval, '']} == approvals
+        assert 'beehive ok' == beehive
+        assert 'test task' == message
+
+    def test_concurrent_speedup(self):
+        subtasks = list(range(100, 600, 100))
+
+        start = time.monotonic()
+        serial = self.make_artifacts(1).fetch(1, '1.1', subtasks)
+        serial_time = time.monotonic() - start
+
+        start = time.monotonic()
+        concurrent = self.make_artifacts(16).fetch(1, '1.1', subtasks)
+        concurrent_time = time.monotonic() - start
+
+        assert serial == concurrent
+        assert concurrent_time * 3 < serial_time
+
+    def test_deadline(self):
+        start = time.monotonic()
+        approvals, beehive, message, complete = \
+            self.make_artifacts(4, deadline=0.3).fetch(2, '1.1', [100])
+
+        # partial result without slow page
+        assert time.monotonic() - start < 1
+        assert False is complete
+        assert '' == beehive
+        assert [['user', '2020-01-01', 'ok'], ''] == approvals[100]
+        assert 'test task' == message
+
+    def test_failed_pages(self):
+        approvals, beehive, message, complete = \
+            self.make_artifacts(4).fetch(4, '1.1', [100])
+
+        # partial result without broken pages
+        assert False is complete
+        assert {100: ['', '']} == approvals
+        assert '' == beehive
+        assert 'test task' == message
+
+    def test_cache_revalidation(self):
+        with tempfile.TemporaryDirectory() as path:
+            artifacts = self.make_artifacts(4, cache=DiskCache(path, 2 ** 20))
+
+            first = artifacts.fetch(1, '1.1', [100])
+            requests = len(StubHandler.handled)
+            assert all(status != 304 for _, status in StubHandler.handled)
+
+            # iteration in progress, cached pages are revalidated
+            StubHandler.handled.clear()
+            assert first == artifacts.fetch(1, '1.1', [100])
+            assert requests == len(StubHandler.handled)
+            assert {304, 404} == {status for _, status in StubHandler.handled}
+
+    def test_cache_finished(self):
+        with tempfile.TemporaryDirectory() as path:
+            artifacts = self.make_artifacts(4, cache=DiskCache(path, 2 ** 20))
+
+            first = artifacts.fetch(1, '1.1', [100], finished=True)
+            assert StubHandler.handled
+
+            # pages of finished iteration, missing ones too, are not loaded
+            StubHandler.handled.clear()
+            assert first == artifacts.fetch(1, '1.1', [100], finished=True)
+            assert [] == StubHandler.handled
+
+            # other iteration is not in the cache
+            artifacts.fetch(1, '1.2', [100], finished=True)
+            assert StubHandler.handled
+
+    def test_cache_unavailable(self):
+        with tempfile.TemporaryDirectory() as path:
+            artifacts = self.make_artifacts(4, cache=DiskCache(path, 2 ** 20))
+
+            _, beehive, _, complete = artifacts.fetch(3, '1.1', [100],
+                                                      finished=True)
+            assert '' == beehive
+            assert False is complete
+
+            # temporary error of finished iteration is not cached
+            StubHandler.handled.clear()
+            artifacts.fetch(3, '1.1', [100], finished=True)
+            assert [('/RESULT/3/check-beehive-result.log', 503)] == \
+                StubHandler.handled
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
 import os
 import json
+import datetime
 import time
 import logging
 import unittest
 import tempfile
 from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
 
 import utils
 from utils import func_time
@@ -14,6 +18,13 @@ logging.basicConfig(stream=log_stream, level=logging.INFO)
 
 
 class TestUtils(unittest.TestCase):
+    def test_get_logger_no_setup(self):
+        # modules get loggers at import, log file is not opened by them
+        with patch.object(utils, 'setup_logging') as setup_logging:
+            utils.get_logger('test_import')
+
+        setup_logging.assert_not_called()
+
     def test_get_logger(self):
         logger = utils.get_logger(__name__)
         message = "logging from {}".format(__name__)
@@ -48,6 +59,20 @@ class TestUtils(unittest.TestCase):
         assert 'value2' == config.get('TestConfig', 'Field2')
         assert 'value3' == config.get('TestConfig', 'Field3')
 
+    def test_make_private_dir(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache')
+            os.mkdir(path, 0o755)
+            os.chmod(path, 0o755)
+
+            # readable directory of the user is made private
+            assert path == utils.make_private_dir(path)
+            assert 0o700 == os.stat(path).st_mode & 0o777
+
+            os.chmod(path, 0o775)
+            with self.assertRaises(PermissionError):
+                utils.make_private_dir(path)
+
     def test_join_tuples(self):
         tuples = (('elem1', 'elem2', 'elem3'),
                   ('elem1.1', 'elem2.1', 'elem3.1'),
@@ -69,6 +94,125 @@ class TestUtils(unittest.TestCase):
         assert 'elem2.1' == js['1']['key2']
         assert 'elem3.2' == js['2']['key3']
 
+    def test_row_serializer(self):
+        date = datetime.datetime(2020, 1, 2, 3, 4, 5)
+        serializer = utils.RowSerializer(['name', 'date', 'size'])
+
+        assert [] == serializer.to_dicts([])
+        assert [{'name': 'glibc', 'date': '2020-01-02 03:04:05', 'size': 1},
+                {'name': 'perl', 'date': '2020-01-02 03:04:05', 'size': 2}] \
+            == serializer.to_dicts([('glibc', date, 1), ('perl', date, 2)])
+
+        js = json.loads(serializer.dumps([('glibc', date, 10 ** 20)]))
+        assert {'0': {'name': 'glibc', 'date': '2020-01-02 03:04:05',
+                      'size': 10 ** 20}} == js
+
+        # column of dates is detected by the first not NULL value
+        assert [{'name': 'glibc', 'date': None, 'size': 1},
+                {'name': 'perl', 'date': '2020-01-02 03:04:05', 'size': 2}] \
+            == serializer.to_dicts([('glibc', None, 1), ('perl', date, 2)])
+
+    def test_json_dumps(self):
+        assert '{"a": 1, "b": "/x"}' == json.dumps(
+            json.loads(utils.json_dumps({'b': '/x', 'a': 1}, sort=True)),
+            sort_keys=True
+        )
+        assert {'1': [1, 2]} == json.loads(utils.json_dumps({1: (1, 2)}))
+
+    def test_json_dumps_backends(self):
+        obj = {'name': 'пакет/1', 'size': 2 ** 40, 'ratio': 0.5,
+               'date': datetime.datetime(2020, 1, 2, 3, 4, 5),
+               'day': datetime.date(2020, 1, 2), 1: (1, None)}
+        expected = '{"name":"пакет/1","size":1099511627776,' \
+                   '"ratio":0.5,"date":"2020-01-02 03:04:05",' \
+                   '"day":"2020-01-02","1":[1,null]}'
+
+        # the same output with orjson and json
+        assert expected == utils.json_dumps(obj)
+        with patch.object(utils, 'orjson', None):
+            assert expected == utils.json_dumps(obj)
+
+    def test_html_parser(self):
+        parser = utils.HtmlParser('a', ['Name', 'Parent Directory'])
+
+        chunks = iter([b'<html><a href="../">Parent Dir', b'ectory</a>',
+                       b'<a href="x">p&amp;kg \xd1', b'\x8f</a>',
+                       b'<a href="y">other</a></html>'])
+        assert 'p&kg \u044f' == parser.find_link(chunks)
+        # parsing is stopped at the first suitable link
+        assert b'<a href="y">other</a></html>' == next(chunks)
+
+        assert None is parser.find_link('<a>Name</a><p>file</p>')
+        assert 'file.txt' == parser.find_link('<a>Name</a><a>file.txt</a>')
+
+    def test_json_formatter(self):
+        record = logging.makeLogRecord({
+            'name': 'app', 'levelno': logging.INFO, 'levelname': 'INFO',
+            'msg': 'Time %s is %s', 'args': ('view', 0.5), 'duration': 0.5,
+        })
+
+        data = json.loads(utils.JsonFormatter().format(record))
+        assert 'app' == data['logger']
+        assert 'INFO' == data['level']
+        assert 'Time view is 0.5' == data['message']
+        assert 0.5 == data['duration']
+        assert 'args' not in data
+
+    def test_sampling_filter(self):
+        def record(level):
+            return logging.makeLogRecord({'levelno': level})
+
+        assert True is utils.SamplingFilter(0).filter(record(logging.INFO))
+        assert False is utils.SamplingFilter(0).filter(record(logging.DEBUG))
+        assert True is utils.SamplingFilter(1).filter(record(logging.DEBUG))
+
+    def test_request_context_filter(self):
+        app = Flask(__name__)
+        record = logging.makeLogRecord({})
+
+        with app.test_request_context('/packages?name=glibc&token=secret'):
+            assert True is utils.RequestContextFilter().filter(record)
+
+        assert '/packages' == record.route
+        assert {'name': 'glibc'} == record.params
+
+    def test_async_logging(self):
+        with tempfile.TemporaryDirectory() as path:
+            log_file = os.path.join(path, 'test.log')
+            with patch.multiple(utils.namespace, LOG_FILE=log_file,
+                                LOG_LEVEL='DEBUG', LOG_FORMAT='json',
+                                LOG_DEBUG_SAMPLE=0):
+                utils.setup_logging()
+                logger = utils.get_logger('test_async')
+                logger.debug('sampled out')
+                try:
+                    1 / 0
+                except ZeroDivisionError:
+                    logger.exception('failed %s', 'query')
+
+                # records are written by listener thread
+                utils._stop_listener()
+
+            logging.getLogger().removeHandler(utils._logging['handler'])
+            utils._logging.update(options=None, handler=None)
+
+            with open(log_file) as fd:
+                records = [json.loads(line) for line in fd]
+
+        assert 1 == len(records)
+        assert 'failed query' == records[0]['message']
+        assert 'ZeroDivisionError' in records[0]['exception']
+
+    def test_lazy_object(self):
+        factory = MagicMock(return_value=MagicMock(size=4))
+        lazy = utils.LazyObject(factory)
+        factory.assert_not_called()
+
+        assert 4 == lazy.size
+        lazy.size = 8
+        assert 8 == lazy.size
+        factory.assert_called_once_with()
+
     def test_func_time(self):
         logger = logging.getLogger()
 
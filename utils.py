@@ -1,20 +1,198 @@
 import os
 import json
+import stat
 import time
+import queue
+import random
+import atexit
 import logging
 import datetime
+import codecs
 import argparse
-import requests
+import threading
+import logging.handlers
 import configparser
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from collections import defaultdict
+from flask import has_request_context, request, g
 
 from paths import namespace
 
+# faster json backend is used if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# parameters of requests which are never written to log
+SENSITIVE_PARAMS = {'token'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Log record as json line: time, level, logger, pid, message, request
+    context and extra fields of record.
+    """
+
+    # attributes of every record, the rest are extra fields
+    reserved = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items()
+                    if key not in self.reserved)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Add id, route and parameters of current request to record, secret
+    parameters (`SENSITIVE_PARAMS`) are not added.
+    """
+
+    def filter(self, record):
+        if has_request_context() and not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id')
+            record.route = request.path
+            record.params = {
+                key: value for key, value in request.args.items()
+                if key not in SENSITIVE_PARAMS
+            }
+
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Pass only `rate` part of DEBUG records, records of other levels are
+    passed always.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or \
+            random.random() < self.rate
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Put records to the queue of background listener. Record is not
+    formatted in the thread of request, only its message is rendered.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args = record.getMessage(), None
+
+        # traceback can't be formatted after frames are gone
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+
+        return record
+
+
+# handler, listener and options of configured logging of process
+_logging = {'options': None, 'handler': None, 'listener': None}
+_logging_lock = threading.Lock()
+
+
+def _stop_listener():
+    if _logging['listener'] is not None:
+        _logging['listener'].stop()
+        _logging['listener'] = None
+
+
+def _restart_listener():
+    # thread of listener is not inherited by forked process, records which
+    # were in the queue are written by parent process
+    global _logging_lock
+    _logging_lock = threading.Lock()
+
+    listener = _logging['listener']
+    if listener is None:
+        return
+
+    records = queue.SimpleQueue()
+    _logging['handler'].queue = records
+    _logging['listener'] = logging.handlers.QueueListener(
+        records, *listener.handlers
+    )
+    _logging['listener'].start()
+
+
+os.register_at_fork(after_in_child=_restart_listener)
+atexit.register(_stop_listener)
+
+
+def setup_logging():
+    """
+    Configure logging of process by `namespace`: records are put to the
+    queue by requests and written to LOG_FILE by background thread, as
+    json lines (LOG_FORMAT 'json') or text. Only LOG_DEBUG_SAMPLE part of
+    DEBUG records is written.
+
+    Repeated calls reconfigure logging only if options are changed.
+    """
+    options = (namespace.LOG_FILE, namespace.LOG_LEVEL.upper(),
+               namespace.LOG_FORMAT, float(namespace.LOG_DEBUG_SAMPLE))
+
+    with _logging_lock:
+        if _logging['options'] == options:
+            return
+
+        root = logging.getLogger()
+        if _logging['handler'] is not None:
+            root.removeHandler(_logging['handler'])
+        _stop_listener()
+
+        try:
+            file_handler = logging.FileHandler(namespace.LOG_FILE)
+        except OSError as error:
+            print_statusbar([("Log is written to stderr, can't open log "
+                              "file: {}".format(error), 'w')])
+            file_handler = logging.StreamHandler()
+        if namespace.LOG_FORMAT == 'json':
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter(
+                u'%(levelname)-8s [%(asctime)s] %(message)s'
+            ))
+
+        records = queue.SimpleQueue()
+        handler = AsyncQueueHandler(records)
+        handler.addFilter(SamplingFilter(options[3]))
+        handler.addFilter(RequestContextFilter())
+
+        listener = logging.handlers.QueueListener(records, file_handler)
+        listener.start()
+
+        root.addHandler(handler)
+        root.setLevel(options[1])
+
+        _logging.update(options=options, handler=handler, listener=listener)
+
 
 def get_logger(name):
-    logging.basicConfig(format=u'%(levelname)-8s [%(asctime)s] %(message)s',
-                        level=logging.DEBUG, filename=namespace.LOG_FILE)
+    # logging is configured by `setup_logging` when options are read, not
+    # at import of modules
     logger = logging.getLogger(name)
 
     return logger
@@ -33,25 +211,225 @@ def read_config(config_file):
     return False
 
 
+def make_private_dir(path):
+    """
+    Create directory accessible to the current user only or check the
+    existing one. Files of shared caches are loaded by worker processes, so
+    directory created or writable by other user is not used.
+
+    :param path: path to directory
+    :return: path
+    :raise PermissionError: directory belongs to other user or is
+                            writable by group or others
+    """
+    missing = []
+    head = os.path.abspath(path)
+    while not os.path.exists(head):
+        missing.append(head)
+        head = os.path.dirname(head)
+
+    # parents are created private too (`os.makedirs` uses mode for the
+    # last directory only)
+    for directory in reversed(missing):
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            info.st_mode & 0o022:
+        raise PermissionError(
+            "Directory {} should belong to user {} and be not writable by "
+            "others".format(path, os.getuid())
+        )
+
+    # directory of the previous versions is readable by others
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+    return path
+
+
+def process_alive(pid):
+    """
+    Check if process exists (ex. worker process which wrote a snapshot).
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+class LazyObject:
+    """
+    Proxy of object which is created by factory at the first access to its
+    attributes. Shared state of worker process (ex. connection pool) is
+    declared at import of module, but options are read and directories are
+    created only when the state is used by application.
+
+    :param factory: function without arguments which returns the object
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_object', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get(self):
+        if self._object is None:
+            with self._lock:
+                if self._object is None:
+                    object.__setattr__(self, '_object', self._factory())
+
+        return self._object
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+
+def run_periodically(function, interval, name):
+    """
+    Call function in the daemon thread every `interval` seconds and at exit
+    of the process, ex. to write the last changes of worker state shared by
+    files.
+
+    :param function: function without arguments
+    :param interval: seconds between calls
+    :param name: name of thread
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            function()
+
+    atexit.register(function)
+    threading.Thread(target=run, name=name, daemon=True).start()
+
+
+def str_to_bool(value):
+    """
+    Convert value of configuration option to `bool`.
+    """
+    if isinstance(value, bool):
+        return value
+
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 # return error message as json format
 def json_str_error(error):
     return json.dumps({'Error': error})
 
 
-def convert_to_json(keys, values, sort=False):
-    js = {}
+# format of dates in responses
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    raise TypeError("Type is not JSON serializable: {}".format(
+        type(value).__name__
+    ))
+
 
-    for i in range(len(values)):
-        js[i] = dict([(keys[j], values[i][j])
-                      for j in range(len(values[i]))])
+def json_dumps(obj, sort=False):
+    """
+    Serialize object to json string by orjson if it is installed or by json.
 
-        for key in js[i]:
-            if key == 'date':
-                js[i]['date'] = datetime.datetime.strftime(
-                    js[i]['date'], '%Y-%m-%d %H:%M:%S'
-                )
+    Output is the same with both backends: compact separators, non-ASCII
+    characters are not escaped, dates are formatted by `DATE_FORMAT`.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=_json_default,
+                                option=option).decode()
+        except TypeError:
+            # the object is not supported by orjson (ex. too large integer)
+            pass
 
-    return json.dumps(js, sort_keys=sort)
+    return json.dumps(obj, sort_keys=sort, separators=(',', ':'),
+                      ensure_ascii=False, default=_json_default)
+
+
+class RowSerializer:
+    """
+    Serializer of database rows to json.
+
+    Rows are converted to dicts by column index with precomputed keys.
+    Columns of dates are detected once by the first not NULL value of column
+    and formatted as strings.
+
+    :param keys: names of columns
+    :param date_format: format of dates
+    """
+
+    def __init__(self, keys, date_format=DATE_FORMAT):
+        self.keys = list(keys)
+        self.date_format = date_format
+
+    def _date_columns(self, rows):
+        columns = []
+        for i in range(min(len(self.keys), len(rows[0]))):
+            for row in rows:
+                if row[i] is not None:
+                    if isinstance(row[i], (datetime.datetime, datetime.date)):
+                        columns.append(i)
+                    break
+
+        return columns
+
+    def to_dicts(self, rows):
+        """
+        :param rows: list of rows
+        :return: `list` of `dict` column name - value
+        """
+        if not rows:
+            return []
+
+        keys, date_format = self.keys, self.date_format
+        date_columns = self._date_columns(rows)
+
+        if not date_columns:
+            return [dict(zip(keys, row)) for row in rows]
+
+        result = []
+        for row in rows:
+            row = list(row)
+            for i in date_columns:
+                if row[i] is not None:
+                    row[i] = row[i].strftime(date_format)
+            result.append(dict(zip(keys, row)))
+
+        return result
+
+    def to_indexed(self, rows):
+        """
+        :param rows: list of rows
+        :return: `dict` number of row (as string) - `dict` of row
+        """
+        return {str(i): value for i, value in enumerate(self.to_dicts(rows))}
+
+    def dumps(self, rows, sort=False):
+        return json_dumps(self.to_indexed(rows), sort=sort)
+
+
+def convert_to_json(keys, values, sort=False):
+    return RowSerializer(keys).dumps(values, sort=sort)
 
 
 def join_tuples(tuple_list):
@@ -109,8 +487,10 @@ def func_time(logger):
         def wrapper(*args, **kwargs):
             start = time.time()
             resuls = function(*args, **kwargs)
+            duration = time.time() - start
             logger.info(
-                "Time {} is {}".format(function.__name__, time.time() - start)
+                "Time {} is {}".format(function.__name__, duration),
+                extra={'function': function.__name__, 'duration': duration}
             )
             return resuls
 
@@ -120,22 +500,75 @@ def func_time(logger):
     return decorator
 
 
-class HtmlParser:
+class _LinkFound(Exception):
+    pass
+
+
+class _LinkExtractor(HTMLParser):
+    """
+    Incremental parser which looks for the first tag with text not in the
+    bad list. Parsing is interrupted as soon as the tag is closed.
+    """
+
     def __init__(self, search_tag, bad_list):
+        super().__init__(convert_charrefs=True)
         self.search_tag = search_tag
         self.bad_list = bad_list
+        self.link = None
+        self._text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == self.search_tag:
+            self._text = []
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag != self.search_tag or self._text is None:
+            return
 
-    def parse_html(self, url):
-        response = requests.get(url)
-        if response.status_code != 200:
-            return False
+        text, self._text = ''.join(self._text), None
+        if text not in self.bad_list:
+            self.link = text
+            raise _LinkFound()
 
-        soup = BeautifulSoup(response.content, 'lxml')
 
-        for tag in soup.find_all(self.search_tag):
-            if tag.text not in self.bad_list:
-                response = requests.get(os.path.join(url, tag.text))
-                if response.status_code != 200:
-                    return False
+class HtmlParser:
+    """
+    Find the first file in html directory listing.
+
+    Listing is parsed by chunks, so it may be parsed while it is
+    downloaded, and parsing stops at the first suitable link.
+
+    :param search_tag: tag of links
+    :param bad_list: texts of tags which are not links to files
+    """
+
+    def __init__(self, search_tag, bad_list):
+        self.search_tag = search_tag
+        self.bad_list = bad_list
 
-                return response.content.decode()
+    def find_link(self, content):
+        """
+        Find the first tag which text is not in the bad list.
+
+        :param content: html page, `str`, `bytes` or iterable of chunks
+        :return: text of tag or `None`
+        """
+        if isinstance(content, (str, bytes)):
+            content = [content]
+
+        extractor = _LinkExtractor(self.search_tag, self.bad_list)
+        # multibyte characters can be split between chunks
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            for chunk in content:
+                if isinstance(chunk, bytes):
+                    chunk = decoder.decode(chunk)
+                extractor.feed(chunk)
+        except _LinkFound:
+            pass
+
+        return extractor.link